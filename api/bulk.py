@@ -0,0 +1,246 @@
+"""
+Bulk create and update for the API. A list of objects is validated together
+and written in one transaction with batched queries, along with its history
+rows, instead of one request, transaction and history write per object.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When
+from django.db.models.functions import Cast
+from django.db.models.expressions import Value
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.response import Response
+from simple_history.utils import bulk_create_with_history, get_history_manager_for_model
+
+from core.models import ModelVersion
+from core.search_util.search_documents import update_dependent_documents
+
+
+def bulk_history_create(objs, model, history_type, batch_size=None):
+    """Write one history row of history_type ("+", "~" or "-") per object."""
+    history_model = get_history_manager_for_model(model).model
+    history_date = timezone.now()
+    history_model.objects.bulk_create([
+        history_model(
+            history_date=getattr(obj, '_history_date', history_date),
+            history_user=getattr(obj, '_history_user', None),
+            history_change_reason=getattr(obj, 'changeReason', ''),
+            history_type=history_type,
+            **{
+                field.attname: getattr(obj, field.attname)
+                for field in obj._meta.fields
+                if field.name not in history_model._history_excluded_fields
+            }
+        )
+        for obj in objs
+    ], batch_size=batch_size)
+
+
+def bulk_update(objs, model, field_names, batch_size=None):
+    """
+    Save field_names of already saved objs with one UPDATE per batch, setting
+    every field to a CASE over the primary keys of the batch.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    fields += [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) and field not in fields
+    ]
+    if not fields:
+        return
+
+    batch_size = batch_size or len(objs)
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        updates = {}
+        for field in fields:
+            whens = [
+                When(pk=obj.pk, then=Cast(Value(field.pre_save(obj, False)), output_field=field))
+                for obj in batch
+            ]
+            updates[field.attname] = Case(*whens, output_field=field)
+        model.objects.filter(pk__in=[obj.pk for obj in batch]).update(**updates)
+
+
+class PrefetchedObjects(object):
+    """
+    Stands in for the queryset of a related field, holding every object a
+    batch refers to, so validating the batch looks each one up in memory.
+    """
+
+    def __init__(self, queryset, pks):
+        self.model = queryset.model
+        self.objects = {str(obj.pk): obj for obj in queryset.filter(pk__in=pks)}
+
+    def get(self, pk):
+        self.model._meta.pk.get_prep_value(pk)
+        try:
+            return self.objects[str(pk)]
+        except KeyError:
+            raise self.model.DoesNotExist()
+
+
+def prefetch_related_fields(serializer, items):
+    """Load the related objects referred to by a list of items in one query per field."""
+    for field in serializer.child.fields.values():
+        if field.read_only:
+            continue
+        relation = getattr(field, 'child_relation', field)
+        if not isinstance(relation, serializers.PrimaryKeyRelatedField):
+            continue
+
+        pks = set()
+        for item in items:
+            value = item.get(field.field_name) if isinstance(item, dict) else None
+            for pk in (value if isinstance(value, list) else [value]):
+                try:
+                    pks.add(relation.queryset.model._meta.pk.get_prep_value(pk))
+                except (TypeError, ValueError):
+                    pass
+        pks.discard(None)
+        relation.queryset = PrefetchedObjects(relation.queryset, pks)
+
+
+def split_validated_data(model, data):
+    """
+    Split validated serializer data into concrete field values, many to many
+    values and objects on the other side of a reverse one to one relation.
+    """
+    values, many_to_many, reverse_one_to_one = {}, {}, {}
+    for name, value in data.items():
+        field = model._meta.get_field(name)
+        if field.many_to_many:
+            many_to_many[name] = value
+        elif field.one_to_one and not field.concrete:
+            reverse_one_to_one[field] = value
+        else:
+            values[name] = value
+    return values, many_to_many, reverse_one_to_one
+
+
+class BulkWriteMixin(object):
+    """
+    Adds a "bulk/" route to a viewset. POST a list of objects to create them
+    all, or PATCH a list of objects that each carry an "id" to update them.
+    The whole list is rejected if any object is invalid.
+    """
+    bulk_serializer_class = None
+    bulk_batch_size = 500
+
+    def get_bulk_serializer(self, *args, **kwargs):
+        serializer_class = self.bulk_serializer_class or self.get_serializer_class()
+        kwargs['context'] = self.get_serializer_context()
+        return serializer_class(*args, **kwargs)
+
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            raise ParseError('Expected a list of objects')
+        if request.method == 'POST':
+            return self.bulk_create(request)
+        return self.bulk_update(request)
+
+    def bulk_create(self, request):
+        serializer = self.get_bulk_serializer(data=request.data, many=True)
+        prefetch_related_fields(serializer, request.data)
+        serializer.is_valid(raise_exception=True)
+        model = serializer.child.Meta.model
+
+        objs, related = [], []
+        for data in serializer.validated_data:
+            values, many_to_many, reverse_one_to_one = split_validated_data(model, data)
+            obj = model(**values)
+            self.set_history_user(obj)
+            objs.append(obj)
+            related.append((many_to_many, reverse_one_to_one))
+        self.prepare_bulk_write(objs)
+
+        try:
+            with transaction.atomic():
+                objs = bulk_create_with_history(objs, model, batch_size=self.bulk_batch_size)
+                self.save_related(model, objs, related)
+        except IntegrityError as e:
+            raise ValidationError(str(e))
+
+        return Response(
+            self.get_bulk_serializer(objs, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    def bulk_update(self, request):
+        model = self.get_bulk_serializer().Meta.model
+        ids = []
+        for index, item in enumerate(request.data):
+            if not isinstance(item, dict) or not isinstance(item.get('id'), int):
+                raise ValidationError({index: 'Expected an object with an integer id'})
+            ids.append(item['id'])
+        if len(set(ids)) != len(ids):
+            raise ValidationError('Each id may only be updated once per request')
+
+        serializer = self.get_bulk_serializer(data=request.data, many=True, partial=True)
+        prefetch_related_fields(serializer, request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            with transaction.atomic():
+                instances = model.objects.select_for_update().in_bulk(ids)
+                missing = [pk for pk in ids if pk not in instances]
+                if missing:
+                    raise ValidationError('No %s with id %s' % (
+                        model._meta.verbose_name, ', '.join(str(pk) for pk in missing)))
+
+                objs, related, field_names = [], [], set()
+                for pk, data in zip(ids, serializer.validated_data):
+                    obj = instances[pk]
+                    values, many_to_many, reverse_one_to_one = split_validated_data(model, data)
+                    for name, value in values.items():
+                        setattr(obj, name, value)
+                    self.set_history_user(obj)
+                    field_names.update(values)
+                    objs.append(obj)
+                    related.append((many_to_many, reverse_one_to_one))
+                field_names.update(self.prepare_bulk_write(objs))
+
+                bulk_update(objs, model, sorted(field_names), batch_size=self.bulk_batch_size)
+                bulk_history_create(objs, model, '~', batch_size=self.bulk_batch_size)
+                self.save_related(model, objs, related)
+        except IntegrityError as e:
+            raise ValidationError(str(e))
+
+        return Response(self.get_bulk_serializer(objs, many=True).data)
+
+    def prepare_bulk_write(self, objs):
+        """
+        Set fields that save() would derive from the others on objs before
+        they are written, and return their names.
+        """
+        return []
+
+    def save_related(self, model, objs, related):
+        """Set many to many values and point reverse one to one objects at objs."""
+        reverse_updates = {}
+        for obj, (many_to_many, reverse_one_to_one) in zip(objs, related):
+            for name, value in many_to_many.items():
+                getattr(obj, name).set(value)
+            for relation, related_obj in reverse_one_to_one.items():
+                if related_obj is None:
+                    continue
+                setattr(related_obj, relation.field.name, obj)
+                self.set_history_user(related_obj)
+                reverse_updates.setdefault(relation, []).append(related_obj)
+
+        for relation, related_objs in reverse_updates.items():
+            related_model = relation.related_model
+            bulk_update(related_objs, related_model, [relation.field.name], batch_size=self.bulk_batch_size)
+            bulk_history_create(related_objs, related_model, '~', batch_size=self.bulk_batch_size)
+
+        # Bulk queries send no model signals
+        ModelVersion.objects.bump(model, *[relation.related_model for relation in reverse_updates])
+        update_dependent_documents(model, [obj.pk for obj in objs])
+
+    def set_history_user(self, obj):
+        user = self.request.user
+        obj._history_user = user if user.is_authenticated else None
+
@@ -0,0 +1,42 @@
+"""
+Caches rendered list responses under their ETag (see ConditionalGetMixin).
+
+The ETag changes whenever any model the response reads changes, so entries
+never need deleting: a write makes the next request miss, and the stale
+entry ages out of the cache.
+"""
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+class CachedListMixin(object):
+    """Serve repeated JSON list requests from the cache."""
+
+    list_cache_timeout = None  # the cache's default timeout
+
+    def get_list_cache_key(self, request):
+        etag, _ = self.get_validators(request)
+        return 'api:list:%s' % etag.strip('"')
+
+    def list(self, request, *args, **kwargs):
+        # The browsable API embeds the user and a CSRF token
+        if request.accepted_renderer.format != 'json':
+            return super(CachedListMixin, self).list(request, *args, **kwargs)
+
+        key = self.get_list_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super(CachedListMixin, self).list(request, *args, **kwargs)
+
+        def store(response):
+            if response.status_code == 200:
+                timeout = self.list_cache_timeout
+                kwargs = {} if timeout is None else {'timeout': timeout}
+                cache.set(key, (response.content, response['Content-Type']), **kwargs)
+            return response
+
+        response.add_post_render_callback(store)
+        return response
@@ -0,0 +1,188 @@
+"""
+Builds the API change feed from the simple_history tables: which objects
+of each model were created, updated or deleted since a cursor.
+
+The cursor holds, for each model, the highest history_id read, and the
+gaps below it: ids not seen yet. An id is taken when a history row is
+inserted but only seen once its transaction commits, so a long transaction
+or a bulk import can commit rows below ids already read. Gaps are read
+again on every poll until they are filled, or until GAP_WINDOW has passed
+since the row after them was written, when their transactions are taken to
+have rolled back.
+
+A feed can also start from a time rather than a cursor: each model is read
+from the lowest history_id written at or after it, see start_positions().
+"""
+import base64
+import datetime
+import json
+import time
+from collections import OrderedDict
+
+from django.db.models import Max, Min, Q
+
+from core.signals import get_tracked_models
+
+
+# How long after the row following it a gap in the history ids is read again
+GAP_WINDOW = datetime.timedelta(hours=1)
+
+# Gaps kept in a cursor across all of its models, the oldest dropped first,
+# which keeps it to a few KB of query string
+MAX_GAPS = 50
+
+
+def get_history_models():
+    """Return {label: model} for the LIMS models that keep history."""
+    return OrderedDict(
+        (model._meta.label_lower, model)
+        for model in sorted(get_tracked_models(), key=lambda m: m._meta.label_lower)
+        if hasattr(model, 'history')
+    )
+
+
+def encode_cursor(positions):
+    return base64.urlsafe_b64encode(json.dumps(positions, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Return {label: [history id, [[first, last, expires], ...]]} for a
+    cursor, {} for an empty one. Raises ValueError if it is malformed.
+    """
+    if not cursor:
+        return {}
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('invalid cursor')
+    if not isinstance(positions, dict):
+        raise ValueError('invalid cursor')
+    for position in positions.values():
+        if not (isinstance(position, list) and len(position) == 2 and isinstance(position[0], int)
+                and isinstance(position[1], list)
+                and all(isinstance(gap, list) and len(gap) == 3 and all(isinstance(n, int) for n in gap)
+                        for gap in position[1])):
+            raise ValueError('invalid cursor')
+    return positions
+
+
+def start_positions(models, since):
+    """
+    Return the positions, see decode_cursor(), of the history rows of
+    models written at or after since, using their history_date indexes.
+    """
+    positions = {}
+    for label, model in models.items():
+        first = model.history.filter(history_date__gte=since).aggregate(first=Min('history_id'))['first']
+        if first is None:
+            after = model.history.aggregate(last=Max('history_id'))['last'] or 0
+        else:
+            after = first - 1
+        positions[label] = [after, []]
+    return positions
+
+
+def read_history(model, after, gaps, limit):
+    """Return (history id, pk, type, date) of up to limit history rows after the cursor or in its gaps."""
+    found = Q(history_id__gt=after)
+    for first, last, _ in gaps:
+        found |= Q(history_id__range=(first, last))
+    return list(model.history.filter(found).order_by('history_id').values_list(
+        'history_id', model._meta.pk.attname, 'history_type', 'history_date')[:limit])
+
+
+def advance(after, gaps, rows):
+    """Return the history id and gaps of a model's cursor once rows were read."""
+    found = set(history_id for history_id, _, _, _ in rows if history_id <= after)
+    remaining = []
+    for first, last, expires in gaps:
+        for history_id in sorted(n for n in found if first <= n <= last):
+            if history_id > first:
+                remaining.append([first, history_id - 1, expires])
+            first = history_id + 1
+        if first <= last:
+            remaining.append([first, last, expires])
+
+    for history_id, _, _, history_date in rows:
+        if history_id <= after:
+            continue
+        if history_id > after + 1:
+            remaining.append([after + 1, history_id - 1, int((history_date + GAP_WINDOW).timestamp())])
+        after = history_id
+    return after, [gap for gap in remaining if gap[2] > time.time()]
+
+
+def trim_gaps(positions):
+    """Drop the oldest gaps of positions beyond MAX_GAPS, across all of their models."""
+    gaps = sorted(
+        (gap[2], label, index)
+        for label, (_, model_gaps) in positions.items()
+        for index, gap in enumerate(model_gaps)
+    )
+    if len(gaps) <= MAX_GAPS:
+        return positions
+    kept = set((label, index) for _, label, index in gaps[-MAX_GAPS:])
+    return dict(
+        (label, [after, [gap for index, gap in enumerate(model_gaps) if (label, index) in kept]])
+        for label, (after, model_gaps) in positions.items()
+    )
+
+
+def classify(rows):
+    """
+    Return {"created": [...], "updated": [...], "deleted": [...]} ids for
+    history rows, or None if there are none.
+
+    An object created and changed in the rows is only reported as created,
+    and an object deleted in them only as deleted.
+    """
+    first_type = {}
+    last_type = {}
+    for _, pk, history_type, _ in sorted(rows, key=lambda row: (row[3], row[0])):
+        first_type.setdefault(pk, history_type)
+        last_type[pk] = history_type
+    if not last_type:
+        return None
+
+    changes = OrderedDict([('created', []), ('updated', []), ('deleted', [])])
+    for pk in sorted(last_type):
+        if last_type[pk] == '-':
+            changes['deleted'].append(pk)
+        elif first_type[pk] == '+':
+            changes['created'].append(pk)
+        else:
+            changes['updated'].append(pk)
+    return changes
+
+
+def get_changes(models, positions, limit):
+    """
+    Read up to limit history rows of models after positions, see
+    decode_cursor(). Return ({label: changes}, the positions after them,
+    whether there are more rows to read).
+    """
+    now = time.time()
+    positions = dict(positions)
+    changes = OrderedDict()
+    for label, model in models.items():
+        after, gaps = positions.get(label, [0, []])
+        gaps = [gap for gap in gaps if gap[2] > now]
+        if limit <= 0:
+            # Rows of the models before used up the limit exactly
+            if read_history(model, after, gaps, 1):
+                return changes, trim_gaps(positions), True
+            continue
+
+        rows = read_history(model, after, gaps, limit + 1)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        limit -= len(rows)
+
+        positions[label] = list(advance(after, gaps, rows))
+        model_changes = classify(rows)
+        if model_changes is not None:
+            changes[label] = model_changes
+        if more:
+            return changes, trim_gaps(positions), True
+    return changes, trim_gaps(positions), False
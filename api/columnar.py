@@ -0,0 +1,223 @@
+"""
+Columnar list responses: "?format=arrow" returns an Apache Arrow IPC stream
+and "?format=parquet" a Parquet file. Rows are read with values_list() in id
+ordered batches and written a batch at a time, without going through the
+serializers. Parquet buffers batches into row groups of
+PARQUET_ROW_GROUP_SIZE rows, as a row group per batch would make files
+slower to read.
+
+pyarrow is optional; without it the formats are not offered.
+"""
+import io
+from collections import OrderedDict, namedtuple
+
+from django.contrib.postgres.fields import ArrayField
+from django.db import models
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Rows per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 65536
+
+# columns is a list of (name, django field) pairs, batches yields
+# {name: [values]} dicts
+ColumnarData = namedtuple('ColumnarData', ['columns', 'batches'])
+
+
+def resolve_lookup(model, lookup):
+    """Return the field values_list(lookup) reads, following relations."""
+    parts = lookup.split('__')
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+    field = model._meta.get_field(parts[-1])
+    while field.is_relation:
+        field = field.target_field
+    return field
+
+
+def arrow_type(field):
+    if isinstance(field, ArrayField):
+        return pyarrow.list_(arrow_type(field.base_field))
+    if isinstance(field, models.BooleanField):
+        return pyarrow.bool_()
+    if isinstance(field, (models.AutoField, models.IntegerField)):
+        return pyarrow.int64()
+    if isinstance(field, models.FloatField):
+        return pyarrow.float64()
+    if isinstance(field, models.DecimalField):
+        return pyarrow.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.DateTimeField):
+        return pyarrow.timestamp('us', tz='UTC')
+    if isinstance(field, models.DateField):
+        return pyarrow.date32()
+    return pyarrow.string()
+
+
+def arrow_values(field, values):
+    if isinstance(field, models.DateTimeField):
+        return [
+            timezone.make_naive(value, timezone.utc) if value is not None else None
+            for value in values
+        ]
+    if arrow_type(field) == pyarrow.string():
+        return [str(value) if value is not None else None for value in values]
+    return values
+
+
+class ColumnarRenderer(BaseRenderer):
+    """Base for renderers that write ColumnarData a batch at a time."""
+    charset = None
+    render_style = 'binary'
+
+    def get_schema(self, columns):
+        return pyarrow.schema([
+            pyarrow.field(name, arrow_type(field)) for name, field in columns
+        ])
+
+    def iter_record_batches(self, data):
+        schema = self.get_schema(data.columns)
+        for batch in data.batches:
+            arrays = [
+                pyarrow.array(arrow_values(field, batch[name]), type=schema.field(name).type)
+                for name, field in data.columns
+            ]
+            yield pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def iter_render(self, data):
+        """Yield the rendered bytes batch by batch."""
+        sink = io.BytesIO()
+        writer = self.open_writer(sink, self.get_schema(data.columns))
+        for record_batch in self.iter_record_batches(data):
+            writer.write_batch(record_batch)
+            content = self.drain(sink)
+            if content:
+                yield content
+        writer.close()
+        yield self.drain(sink)
+
+    def drain(self, sink):
+        content = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return content
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, ColumnarData):
+            return b''.join(self.iter_render(data))
+
+        # Errors and detail views have no columnar form
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class ArrowRenderer(ColumnarRenderer):
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+    def open_writer(self, sink, schema):
+        return pyarrow.RecordBatchStreamWriter(sink, schema)
+
+
+class ParquetRenderer(ColumnarRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+    def open_writer(self, sink, schema):
+        return RowGroupWriter(pyarrow.parquet.ParquetWriter(sink, schema), PARQUET_ROW_GROUP_SIZE)
+
+
+class RowGroupWriter(object):
+    """Writes record batches to a ParquetWriter in row groups of row_group_size rows."""
+
+    def __init__(self, writer, row_group_size):
+        self.writer = writer
+        self.row_group_size = row_group_size
+        self.batches = []
+        self.rows = 0
+
+    def write_batch(self, record_batch):
+        self.batches.append(record_batch)
+        self.rows += record_batch.num_rows
+        if self.rows >= self.row_group_size:
+            self.flush(self.rows - self.rows % self.row_group_size)
+
+    def flush(self, rows):
+        """Write the first rows buffered, keeping the others for the next row group."""
+        table = pyarrow.Table.from_batches(self.batches)
+        self.writer.write_table(table.slice(0, rows), row_group_size=self.row_group_size)
+        self.batches = table.slice(rows).to_batches()
+        self.rows -= rows
+
+    def close(self):
+        if self.rows:
+            self.flush(self.rows)
+        self.writer.close()
+
+
+COLUMNAR_RENDERERS = (ArrowRenderer, ParquetRenderer) if pyarrow is not None else ()
+
+
+class ColumnarListMixin(object):
+    """
+    Offer "?format=arrow" and "?format=parquet" on list, returning every row
+    matching the filters in one payload.
+    """
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + COLUMNAR_RENDERERS
+
+    # values_list() lookups to return, named with "." in place of "__";
+    # every concrete field by default
+    columnar_fields = None
+
+    def get_columnar_fields(self):
+        if self.columnar_fields is not None:
+            return self.columnar_fields
+        return [field.name for field in self.queryset.model._meta.concrete_fields]
+
+    def get_columnar_columns(self):
+        model = self.queryset.model
+        return [
+            (lookup.replace('__', '.'), resolve_lookup(model, lookup))
+            for lookup in self.get_columnar_fields()
+        ]
+
+    def iterate_columnar_batches(self, queryset):
+        lookups = self.get_columnar_fields()
+        names = [lookup.replace('__', '.') for lookup in lookups]
+        queryset = queryset.prefetch_related(None).order_by('id')
+
+        last_id = None
+        while True:
+            batch = queryset if last_id is None else queryset.filter(id__gt=last_id)
+            rows = list(batch.values_list('id', *lookups)[:self.stream_batch_size])
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            columns = list(zip(*rows))[1:]
+            yield self.get_columnar_batch(OrderedDict(zip(names, columns)))
+
+    def get_columnar_batch(self, columns):
+        """Hook to add computed columns to a {name: values} batch."""
+        return columns
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, ColumnarRenderer):
+            return super(ColumnarListMixin, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        data = ColumnarData(self.get_columnar_columns(), self.iterate_columnar_batches(queryset))
+        response = StreamingHttpResponse(renderer.iter_render(data), content_type=renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+            self.queryset.model._meta.model_name, renderer.format)
+        return response
@@ -0,0 +1,90 @@
+"""
+Answers conditional GETs (If-None-Match / If-Modified-Since) from the
+ModelVersion counters of the models a response is built from, so unchanged
+resources come back as 304 Not Modified without being serialized.
+
+The validators are only as fresh as the counters: writes that send no
+model signals, such as QuerySet.update(), raw SQL or writers outside of
+Django, must bump them themselves (see core.models.ModelVersion).
+"""
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from core.models import ModelVersion
+from api.prefetch import get_relation, plan_related
+
+
+def compute_validators(request, models):
+    """
+    Return the (etag, last_modified) of a GET of request reading the rows
+    of models. The ETag covers the full path and the accepted media type,
+    so the JSON and browsable API renderings of a URL are told apart.
+    """
+    versions = ModelVersion.objects.get_versions(models)
+    versions = sorted(versions.values(), key=lambda v: v.label)
+
+    key = '|'.join(
+        [request.get_full_path(), request.accepted_media_type or ''] +
+        ['%s:%d' % (v.label, v.version) for v in versions]
+    )
+    etag = quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+    last_modified = max(v.last_modified for v in versions)
+    return etag, timegm(last_modified.utctimetuple())
+
+
+def conditional_response(validators, method, request, *args, **kwargs):
+    """Return 304 Not Modified if the request's validators match, else the response of method."""
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = method(request, *args, **kwargs)
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ConditionalGetMixin(object):
+    """Add ETag and Last-Modified validators to list and retrieve."""
+
+    def get_validator_models(self):
+        """Return the models whose changes may change the response."""
+        model_classes = set(plan_related(self.get_serializer()).models)
+
+        # Filters on related fields change which rows match when the related
+        # rows change
+        filters = getattr(self, 'filter_class', None)
+        filters = filters.base_filters if filters is not None else {}
+        for key in self.request.query_params.keys():
+            lookup = getattr(filters.get(key), 'name', None) or key
+            model = self.queryset.model
+            for attr in lookup.split('__'):
+                relation = get_relation(model, attr)
+                if relation is None:
+                    break
+                model = relation.related_model
+                model_classes.add(model)
+        return model_classes
+
+    def get_validators(self, request):
+        """Return the (etag, last_modified) of the current request."""
+        if getattr(self, '_validators', None) is None:
+            self._validators = self.compute_validators(request)
+        return self._validators
+
+    def compute_validators(self, request):
+        return compute_validators(request, self.get_validator_models())
+
+    def conditional_response(self, method, request, *args, **kwargs):
+        return conditional_response(self.get_validators(request), method, request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super(ConditionalGetMixin, self).list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super(ConditionalGetMixin, self).retrieve, request, *args, **kwargs)
@@ -13,7 +13,6 @@ from core.models import (
 )
 
 from sisyphus.models import DlpAnalysisInformation
-import re
 
 from tenx.models import TenxAnalysis
 
@@ -101,40 +100,8 @@ class AnalysisInformationFilter(filters.FilterSet):
         ]
 
 
-class CellIdFilter(filters.Filter):
-    def filter(self, qs, value):
-        if value:
-            row = re.search(
-                r"-R(\d{2})",
-                value,
-            )
-            column = re.search(
-                r"-C(\d{2})",
-                value,
-            )
-
-            # check if value has form <sample>-<library>-R<row_number>-C<col-number>
-            try:
-                row = row.group(1)
-                column = column.group(1)
-            except:
-                return []
-
-            # TODO: refactor
-            cell_id = value.split("-")
-            # some sample ids have "-" in them
-            # to take care of such samples, take strings from start of value up
-            # until the library value which is third last
-            return qs.filter(
-                Q(library__pool_id__exact=cell_id[-3]) & Q(sample_id__sample_id__exact="-".join(cell_id[:-3]))
-                & Q(row__exact=int(row))
-                & Q(column__exact=int(column))) if len(cell_id) > 3 else []
-        else:
-            return qs
-
-
 class SublibraryInformationFilter(filters.FilterSet):
-    cell_id = CellIdFilter(label="Cell Id", name="cell_id")
+    cell_id = filters.CharFilter(label="Cell Id", name="cell_id")
 
     class Meta:
         model = SublibraryInformation
@@ -0,0 +1,290 @@
+"""
+A JSON query language over the LIMS models, for fetching a whole tree of
+related rows in one request, e.g. a library with its sequencings and their
+lanes, its analyses and its chip regions:
+
+    {"library": {
+        "filter": {"pool_id": "A90652A"},
+        "include": {
+            "sequencings": {"include": {"lanes": {}}},
+            "analyses": {"fields": ["id", "jira_ticket"]},
+            "chip_regions": {"include": {"metadata": {}}}
+        }
+    }}
+
+Each top level key names a node type, and the rows of that type matching
+"filter" come back under the same key, the first "limit" of them by id.
+Every node takes "fields", the columns of its rows (all of them by
+default), "filter", a column or "<column>__in" to match, "include", the
+relations whose rows are nested under each row, and "limit", DEFAULT_LIMIT
+unless given and at most MAX_LIMIT. The limit of a nested node bounds its
+rows under all of the rows above it together; rather than nest some of
+them, a query matching more fails, and needs a narrower filter or a
+higher limit.
+
+Rows are read with values(), and the rows of a relation are fetched for
+all of the rows above them at once, so a query costs one SQL query per
+node whatever the number of rows it returns.
+"""
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from rest_framework.exceptions import ParseError
+
+from core.models import ChipRegion, ChipRegionMetadata, Project, Sample, SublibraryInformation
+from dlp.models import DlpLane, DlpLibrary, DlpSequencing
+from sisyphus.models import AnalysisRun, DlpAnalysisInformation
+from tenx.models import TenxAnalysis, TenxChip, TenxLane, TenxLibrary, TenxPool, TenxSequencing
+
+
+# Nodes allowed in one query, which bounds the number of SQL queries
+MAX_NODES = 20
+
+# Rows of one node, which bound the rows of a query
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+PARENT = '_parent'
+
+
+class Relation(object):
+    """
+    The rows of node type target related to a row, found by following
+    lookup from the target rows back to it. A relation that is not many
+    nests one row or None rather than a list.
+    """
+
+    def __init__(self, target, lookup, many=True):
+        self.target = target
+        self.lookup = lookup
+        self.many = many
+
+
+class NodeType(object):
+    """The rows of model, their columns and their relations."""
+
+    def __init__(self, model, relations=None, columns=None):
+        self.model = model
+        self.relations = relations or {}
+        self.extra_columns = columns or {}
+
+    @property
+    def columns(self):
+        """Return {column name: values() lookup}."""
+        columns = OrderedDict((field.name, field.name) for field in self.model._meta.concrete_fields)
+        columns.update(self.extra_columns)
+        return columns
+
+    def get_field(self, column):
+        """Return the model field read by a column, following the relations of its lookup."""
+        model = self.model
+        names = self.columns[column].split('__')
+        for name in names[:-1]:
+            model = model._meta.get_field(name).related_model
+        return model._meta.get_field(names[-1])
+
+
+NODE_TYPES = OrderedDict([
+    ('project', NodeType(Project, {
+        'libraries': Relation('library', 'projects'),
+        'tenxlibraries': Relation('tenxlibrary', 'projects'),
+    })),
+    ('sample', NodeType(Sample, {
+        'libraries': Relation('library', 'sample'),
+        'tenxlibraries': Relation('tenxlibrary', 'sample'),
+    })),
+    ('library', NodeType(DlpLibrary, {
+        'sample': Relation('sample', 'dlplibrary', many=False),
+        'projects': Relation('project', 'dlplibrary'),
+        'sequencings': Relation('sequencing', 'library'),
+        'analyses': Relation('analysis_information', 'library'),
+        'chip_regions': Relation('chip_region', 'library'),
+        'sublibraries': Relation('sublibrary', 'library'),
+    })),
+    ('sequencing', NodeType(DlpSequencing, {
+        'library': Relation('library', 'dlpsequencing', many=False),
+        'lanes': Relation('lane', 'sequencing'),
+        'analyses': Relation('analysis_information', 'sequencings'),
+    })),
+    ('lane', NodeType(DlpLane, {
+        'sequencing': Relation('sequencing', 'dlplane', many=False),
+        'analyses': Relation('analysis_information', 'lanes'),
+    })),
+    ('analysis_information', NodeType(DlpAnalysisInformation, {
+        'library': Relation('library', 'dlpanalysisinformation', many=False),
+        'sequencings': Relation('sequencing', 'dlpanalysisinformation'),
+        'lanes': Relation('lane', 'dlpanalysisinformation'),
+        'analysis_run': Relation('analysis_run', 'dlpanalysisinformation', many=False),
+    })),
+    ('analysis_run', NodeType(AnalysisRun)),
+    ('chip_region', NodeType(ChipRegion, {
+        'metadata': Relation('chip_region_metadata', 'chip_region'),
+    })),
+    ('chip_region_metadata', NodeType(ChipRegionMetadata, columns={
+        'field': 'metadata_field__field',
+    })),
+    ('sublibrary', NodeType(SublibraryInformation)),
+    ('tenxlibrary', NodeType(TenxLibrary, {
+        'sample': Relation('sample', 'tenxlibrary', many=False),
+        'projects': Relation('project', 'tenxlibrary'),
+        'chip': Relation('tenxchip', 'tenxlibrary', many=False),
+        'sequencings': Relation('tenxsequencing', 'library'),
+        'analyses': Relation('tenxanalysis', 'tenx_library'),
+        'pools': Relation('tenxpool', 'libraries'),
+    })),
+    ('tenxsequencing', NodeType(TenxSequencing, {
+        'library': Relation('tenxlibrary', 'tenxsequencing', many=False),
+        'pool': Relation('tenxpool', 'tenxsequencing', many=False),
+        'lanes': Relation('tenxlane', 'sequencing'),
+    })),
+    ('tenxlane', NodeType(TenxLane, {
+        'sequencing': Relation('tenxsequencing', 'tenxlane', many=False),
+    })),
+    ('tenxchip', NodeType(TenxChip, {
+        'libraries': Relation('tenxlibrary', 'chips'),
+    })),
+    ('tenxpool', NodeType(TenxPool, {
+        'libraries': Relation('tenxlibrary', 'tenxpool'),
+        'sequencings': Relation('tenxsequencing', 'tenx_pool'),
+    })),
+    ('tenxanalysis', NodeType(TenxAnalysis, {
+        'library': Relation('tenxlibrary', 'tenxanalysis', many=False),
+        'lanes': Relation('tenxlane', 'tenxanalysis'),
+    })),
+])
+
+
+class Node(object):
+    """One node of a parsed query: the rows of node_type to fetch and nest."""
+
+    def __init__(self, node_type, spec, path):
+        if not isinstance(spec, dict):
+            raise ParseError('%s: expected an object' % path)
+        unknown = set(spec) - set(['fields', 'filter', 'include', 'limit'])
+        if unknown:
+            raise ParseError('%s: no option %s' % (path, ', '.join(sorted(unknown))))
+
+        self.node_type = node_type
+        self.path = path
+        columns = node_type.columns
+
+        fields = spec.get('fields', list(columns))
+        if not isinstance(fields, list) or not all(field in columns for field in fields):
+            raise ParseError('%s: fields must be a list of %s' % (path, ', '.join(columns)))
+        self.columns = OrderedDict((field, columns[field]) for field in fields)
+
+        self.filters = {}
+        filters = spec.get('filter', {})
+        if not isinstance(filters, dict):
+            raise ParseError('%s: filter must be an object' % path)
+        for key, value in filters.items():
+            column, _, lookup = key.partition('__')
+            if column not in columns or lookup not in ('', 'in'):
+                raise ParseError('%s: no filter %s' % (path, key))
+            if isinstance(value, list) != (lookup == 'in') or isinstance(value, dict):
+                raise ParseError('%s: expected %s for %s' % (path, 'a list' if lookup else 'a value', key))
+            field = node_type.get_field(column)
+            try:
+                value = [field.to_python(item) for item in value] if lookup else field.to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise ParseError('%s: bad value for %s' % (path, key))
+            self.filters[columns[column] + ('__in' if lookup else '')] = value
+
+        self.limit = spec.get('limit', DEFAULT_LIMIT)
+        if not isinstance(self.limit, int) or isinstance(self.limit, bool) or not 0 <= self.limit <= MAX_LIMIT:
+            raise ParseError('%s: limit must be an integer from 0 to %d' % (path, MAX_LIMIT))
+
+        self.children = OrderedDict()
+        include = spec.get('include', {})
+        if not isinstance(include, dict):
+            raise ParseError('%s: include must be an object' % path)
+        for name, child_spec in include.items():
+            relation = node_type.relations.get(name)
+            if relation is None:
+                raise ParseError('%s: no relation %s' % (path, name))
+            self.children[name] = (relation, Node(NODE_TYPES[relation.target], child_spec, path + '.' + name))
+
+    def iterate(self):
+        """Yield this node and every node below it."""
+        yield self
+        for _, child in self.children.values():
+            for node in child.iterate():
+                yield node
+
+    def get_queryset(self, relation=None, parent_ids=None):
+        """Return the values() rows of this node, of the given parents if a relation is given."""
+        queryset = self.node_type.model._default_manager.filter(**self.filters).order_by('id')
+        lookups = dict((column, lookup) for column, lookup in self.columns.items() if column != lookup)
+        if relation is not None:
+            queryset = queryset.filter(**{relation.lookup + '__in': parent_ids})
+            lookups[PARENT] = relation.lookup
+        plain = [column for column, lookup in self.columns.items() if column == lookup and column != 'id']
+        return queryset.values('id', *plain, **dict((name, F(lookup)) for name, lookup in lookups.items()))
+
+    def resolve(self, relation=None, parent_ids=None):
+        """
+        Return the rows of this node, with their children nested, as a list,
+        or as {parent id: [rows]} for the rows of a relation.
+        """
+        queryset = self.get_queryset(relation, parent_ids)
+        if relation is None:
+            queryset = queryset[:self.limit]
+        else:
+            # Cutting the rows of a relation would leave some parents
+            # with part of theirs, so fetch one more to tell
+            queryset = list(queryset[:self.limit + 1])
+            if len(queryset) > self.limit:
+                raise ParseError('%s: more than %d rows, filter them or give a limit of at most %d' % (
+                    self.path, self.limit, MAX_LIMIT))
+
+        rows = OrderedDict()
+        parents = OrderedDict()
+        for values in queryset:
+            if values['id'] not in rows:
+                rows[values['id']] = OrderedDict((column, values[column]) for column in self.columns)
+            if relation is not None:
+                parents.setdefault(values[PARENT], []).append(rows[values['id']])
+
+        ids = list(rows)
+        for name, (child_relation, child) in self.children.items():
+            children = child.resolve(child_relation, ids) if ids else {}
+            for id, row in rows.items():
+                related = children.get(id, [])
+                row[name] = related if child_relation.many else (related[0] if related else None)
+
+        return parents if relation is not None else list(rows.values())
+
+
+def parse_query(query):
+    """Return [(name, Node)] for the top level nodes of a query."""
+    if not isinstance(query, dict) or not query:
+        raise ParseError('Expected an object with one or more of %s' % ', '.join(NODE_TYPES))
+    roots = []
+    for name, spec in query.items():
+        if name not in NODE_TYPES:
+            raise ParseError('no node type %s' % name)
+        roots.append((name, Node(NODE_TYPES[name], spec, name)))
+
+    if sum(1 for _, root in roots for _ in root.iterate()) > MAX_NODES:
+        raise ParseError('A query may have at most %d nodes' % MAX_NODES)
+    return roots
+
+
+def get_models(roots):
+    """Return the models the rows of a parsed query are read from."""
+    models = set()
+    for _, root in roots:
+        for node in root.iterate():
+            models.add(node.node_type.model)
+            for lookup in node.columns.values():
+                model = node.node_type.model
+                for name in lookup.split('__')[:-1]:
+                    model = model._meta.get_field(name).related_model
+                    models.add(model)
+    return models
+
+
+def run_query(roots):
+    """Return {name: rows} for the top level nodes of a parsed query."""
+    return OrderedDict((name, root.resolve()) for name, root in roots)
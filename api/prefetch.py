@@ -0,0 +1,174 @@
+"""
+Works out the select_related/prefetch_related lookups a serializer needs by
+walking its declared fields, so nested representations cost a fixed number
+of queries per page rather than a few queries per row.
+"""
+from collections import namedtuple
+
+from django.db import models
+from rest_framework import serializers
+
+
+RelatedPlan = namedtuple('RelatedPlan', ['select_related', 'prefetch_related', 'models', 'only'])
+
+
+def get_relation(model, name):
+    """Return the relation reached through attribute name on model, or None."""
+    for field in model._meta.get_fields():
+        if not field.is_relation:
+            continue
+        if field.auto_created and not field.concrete:
+            accessor = field.get_accessor_name()
+        else:
+            accessor = field.name
+        if accessor == name:
+            return field
+    return None
+
+
+def get_column(model, name):
+    """Return the concrete field stored on model's rows under name, or None."""
+    for field in model._meta.concrete_fields:
+        if field.name == name:
+            return field
+    return None
+
+
+def reads_columns_on_init(model):
+    """Models that copy field values in __init__ cannot have columns deferred."""
+    return model.__init__ is not models.Model.__init__
+
+
+def is_many(relation):
+    return relation.one_to_many or relation.many_to_many
+
+
+def get_nested_serializer(field):
+    """Return the serializer rendering field's related objects, if any."""
+    if isinstance(field, serializers.ListSerializer):
+        return field.child
+    if isinstance(field, serializers.BaseSerializer):
+        return field
+    return None
+
+
+def plan_related(serializer):
+    """
+    Return the related lookups and the models a serializer instance reads.
+
+    When the serializer only renders some of its fields (see
+    DynamicFieldsMixin) only also lists the columns to load with only();
+    otherwise it is empty and every column is loaded.
+    """
+    plan = RelatedPlan(set(), set(), set(), set())
+    model = serializer.Meta.model
+    plan.models.add(model)
+    loaded_whole = set([''] if reads_columns_on_init(model) else [])
+    _plan_fields(serializer, model, '', False, plan, loaded_whole)
+
+    if '' in loaded_whole:
+        plan.only.clear()
+    else:
+        for path in loaded_whole:
+            plan.only.difference_update(
+                [column for column in plan.only if column.startswith(path + '__')]
+            )
+    return plan
+
+
+def _plan_fields(serializer, model, prefix, prefetching, plan, loaded_whole):
+    selection = getattr(serializer, 'field_selection', None)
+    if selection is None and not prefetching:
+        loaded_whole.add(prefix)
+    computed_sources = getattr(serializer, 'computed_field_sources', {})
+
+    fields = serializer.fields
+    for field in fields.values():
+        if field.write_only:
+            continue
+
+        if field.field_name in computed_sources:
+            for source in computed_sources[field.field_name]:
+                _plan_source(source.split('.'), model, prefix, prefetching, plan, loaded_whole)
+            continue
+
+        nested = get_nested_serializer(field)
+        if field.source == '*':
+            if nested is not None:
+                _plan_fields(nested, model, prefix, prefetching, plan, loaded_whole)
+            elif not prefetching:
+                loaded_whole.add(prefix)
+            continue
+
+        path, current_model, many = _plan_source(
+            field.source.split('.'), model, prefix, prefetching, plan, loaded_whole,
+            join_last=not isinstance(field, serializers.PrimaryKeyRelatedField),
+        )
+        if nested is not None and current_model is not None:
+            _plan_fields(nested, current_model, path, many, plan, loaded_whole)
+
+    # Extra values added in to_representation
+    for field_name, sources in computed_sources.items():
+        if field_name in fields or not serializer.is_field_requested(field_name):
+            continue
+        for source in sources:
+            _plan_source(source.split('.'), model, prefix, prefetching, plan, loaded_whole)
+
+
+def _plan_source(attrs, model, prefix, prefetching, plan, loaded_whole, join_last=False):
+    """
+    Plan the lookups needed to read the dotted source attrs off model.
+
+    Returns the lookup path, model and whether it was prefetched when attrs
+    ends on a related object, otherwise a None model.
+    """
+    current_model = model
+    path = prefix
+    many = prefetching
+    for index, attr in enumerate(attrs):
+        relation = get_relation(current_model, attr)
+        attr_path = '__'.join([path, attr]) if path else attr
+        if relation is None:
+            if not many:
+                if get_column(current_model, attr) is not None:
+                    plan.only.add(attr_path)
+                else:
+                    # A method or property, there is no telling what it reads
+                    loaded_whole.add(path)
+            return path, None, many
+
+        if relation.concrete and not is_many(relation) and not many:
+            plan.only.add(attr_path)
+
+        # Primary keys of forward foreign keys are read straight off the
+        # row, there is nothing to join
+        is_last = index == len(attrs) - 1
+        if is_last and relation.concrete and not is_many(relation) and not join_last:
+            return path, None, many
+
+        path = attr_path
+        many = many or is_many(relation)
+        if many:
+            plan.prefetch_related.add(path)
+        else:
+            plan.select_related.add(path)
+            if reads_columns_on_init(relation.related_model):
+                loaded_whole.add(path)
+        current_model = relation.related_model
+        plan.models.add(current_model)
+    return path, current_model, many
+
+
+class SerializerPrefetchMixin(object):
+    """Apply the lookups planned from the view's serializer to get_queryset()."""
+
+    def get_queryset(self):
+        queryset = super(SerializerPrefetchMixin, self).get_queryset()
+        plan = plan_related(self.get_serializer())
+        if plan.select_related:
+            queryset = queryset.select_related(*sorted(plan.select_related))
+        if plan.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(plan.prefetch_related))
+        if plan.only:
+            queryset = queryset.only(*sorted(plan.only))
+        return queryset
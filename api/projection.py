@@ -0,0 +1,163 @@
+"""
+Projection serializers render list rows straight from values() instead of
+building a model instance per row and running it through serializer fields.
+
+A projection lists its output fields like a ModelSerializer does. Plain
+model fields are formatted the way the rest framework field ModelSerializer
+builds for them would, so a projection renders the same JSON as the
+serializer it stands in for, and pass straight through whenever that field
+would return the stored value unchanged. Values read across relations are
+declared with Column and JoinedColumn.
+"""
+from collections import OrderedDict
+
+from django.db.models.query import QuerySet, ValuesIterable
+from rest_framework import serializers
+
+
+# Fields whose to_representation returns values() results unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.FloatField,
+    serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+    serializers.ReadOnlyField,
+)
+
+
+def get_formatter(field):
+    """Return the function formatting field's values, or None if they pass through."""
+    if isinstance(field, PASSTHROUGH_FIELDS):
+        return None
+    if isinstance(field, serializers.ChoiceField) and all(
+            key == value for key, value in field.choice_strings_to_values.items()):
+        return None
+    return field.to_representation
+
+
+class Column(object):
+    """The value at lookup, passed through to_representation when given."""
+
+    def __init__(self, lookup, to_representation=None):
+        self.lookup = lookup
+        self.to_representation = to_representation
+
+
+class JoinedColumn(object):
+    """The values of a many valued lookup, in order, joined into one string."""
+
+    def __init__(self, lookup, separator=', '):
+        self.lookup = lookup
+        self.separator = separator
+
+    def get_values(self, model, ids):
+        """Return {id: joined values} for the rows of model with ids."""
+        values = dict((id, []) for id in ids)
+        rows = model._default_manager.filter(
+            pk__in=ids, **{self.lookup + '__isnull': False}
+        ).order_by(self.lookup).values_list('pk', self.lookup)
+        for id, value in rows:
+            values[id].append(value)
+        return dict((id, self.separator.join(value)) for id, value in values.items())
+
+
+class ProjectionSerializerMetaclass(type):
+    """Collect the Column and JoinedColumn attributes declared on a projection."""
+
+    def __new__(cls, name, bases, attrs):
+        declared = OrderedDict()
+        for base in reversed(bases):
+            declared.update(getattr(base, '_declared_columns', {}))
+        for key, value in list(attrs.items()):
+            if isinstance(value, (Column, JoinedColumn)):
+                declared[key] = attrs.pop(key)
+        attrs['_declared_columns'] = declared
+        return super(ProjectionSerializerMetaclass, cls).__new__(cls, name, bases, attrs)
+
+
+class ProjectionSerializer(object, metaclass=ProjectionSerializerMetaclass):
+    """
+    Render many rows of Meta.model as a list of dicts of Meta.fields.
+
+    Takes a queryset, which is read with values(), or the values() rows
+    returned by get_queryset(). Like ListSerializer, the result is in data.
+    """
+
+    def __init__(self, instance=None, many=True, context=None, **kwargs):
+        assert many, 'Projections only render lists'
+        self.instance = instance
+        self.context = context or {}
+
+    @classmethod
+    def get_columns(cls):
+        """Return the (name, lookup, to_representation) of every output field."""
+        if '_columns' not in cls.__dict__:
+            cls._columns = cls.build_columns()
+        return cls._columns
+
+    @classmethod
+    def build_columns(cls):
+        declared = cls._declared_columns
+        model = cls.Meta.model
+        fields = cls.Meta.fields
+
+        if fields == serializers.ALL_FIELDS:
+            plain_fields = fields
+        else:
+            plain_fields = [name for name in fields if name not in declared]
+
+        meta = type('Meta', (), {'model': model, 'fields': plain_fields})
+        plain = type('Serializer', (serializers.ModelSerializer,), {'Meta': meta})().fields
+
+        if fields == serializers.ALL_FIELDS:
+            fields = list(plain.keys()) + [name for name in declared if name not in plain]
+
+        columns = []
+        for name in fields:
+            if name in declared:
+                column = declared[name]
+                if isinstance(column, JoinedColumn):
+                    columns.append((name, 'id', column))
+                else:
+                    columns.append((name, column.lookup, column.to_representation))
+            else:
+                field = plain[name]
+                assert '.' not in field.source and field.source != '*', (
+                    'Declare a Column for %s, it does not read a column of %s' % (name, model.__name__))
+                columns.append((name, field.source, get_formatter(field)))
+        return columns
+
+    @classmethod
+    def get_queryset(cls, queryset):
+        """Return the values() rows of queryset this projection reads."""
+        lookups = ['id']
+        for _, lookup, _ in cls.get_columns():
+            if lookup not in lookups:
+                lookups.append(lookup)
+        return queryset.prefetch_related(None).values(*lookups)
+
+    @property
+    def data(self):
+        rows = self.instance
+        if isinstance(rows, QuerySet) and rows._iterable_class is not ValuesIterable:
+            rows = self.get_queryset(rows)
+        rows = list(rows)
+
+        columns = []
+        for name, lookup, to_representation in self.get_columns():
+            if isinstance(to_representation, JoinedColumn):
+                ids = [row['id'] for row in rows]
+                to_representation = to_representation.get_values(self.Meta.model, ids).__getitem__
+            columns.append((name, lookup, to_representation))
+
+        data = []
+        for row in rows:
+            item = OrderedDict()
+            for name, lookup, to_representation in columns:
+                value = row[lookup]
+                if to_representation is not None and value is not None:
+                    value = to_representation(value)
+                item[name] = value
+            data.append(item)
+        return data
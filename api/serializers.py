@@ -10,8 +10,10 @@ Updated by Spencer Vatrt-Watts (github.com/Spenca)
 # Django rest framework imports
 #----------------------------
 import re
+from collections import OrderedDict
 
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
 #============================
 # App imports
@@ -19,6 +21,8 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 
+from api.projection import Column, JoinedColumn, ProjectionSerializer
+
 from core.models import (
     Sample,
     AdditionalSampleInformation,
@@ -53,13 +57,118 @@ from sisyphus.models import (
 #----------------------------
 
 
-class AdditionalSampleInformationSerializer(serializers.ModelSerializer):
+def parse_field_paths(value):
+    """Split "a,b.c" into {("a",), ("b", "c")}."""
+    return set(
+        tuple(path.split('.'))
+        for path in value.replace(' ', '').split(',')
+        if path
+    )
+
+
+class DynamicFieldsMixin(object):
+    """
+    Trim read responses with the "fields" and "expand" query parameters.
+
+    fields is a comma separated list of field names, dotted for nested
+    objects, e.g. "?fields=id,pool_id,sample.sample_id". Nested objects named
+    in fields are returned as primary keys unless they are also named in
+    expand or have fields of their own listed. Without fields the full
+    representation is returned.
+    """
+    # Values added in to_representation (or read through model methods),
+    # mapped to the model attributes they read, so that the view can still
+    # defer every other column
+    computed_field_sources = {}
+
+    _field_selection = None
+
+    def get_field_paths(self, param):
+        request = self.context.get('request')
+        if request is None:
+            return None
+        # Only responses that read rows are trimmed, including the POST
+        # query/ lookup
+        view = self.context.get('view')
+        if request.method not in SAFE_METHODS and getattr(view, 'action', None) != 'query':
+            return None
+        value = request.query_params.get(param)
+        if not value:
+            return None
+        return parse_field_paths(value)
+
+    def get_serializer_path(self):
+        path = []
+        field = self
+        while field.parent is not None:
+            if field.field_name:
+                path.append(field.field_name)
+            field = field.parent
+        return tuple(reversed(path))
+
+    @property
+    def field_selection(self):
+        """Names of the fields requested at this level, or None for all."""
+        if self._field_selection is None:
+            self._field_selection = (None,)
+            paths = self.get_field_paths('fields')
+            if paths is not None:
+                prefix = self.get_serializer_path()
+                selection = set(
+                    path[len(prefix)] for path in paths
+                    if len(path) > len(prefix) and path[:len(prefix)] == prefix
+                )
+                # A nested object that is expanded without any of its own
+                # fields listed is returned whole
+                if selection or not prefix:
+                    self._field_selection = (selection,)
+        return self._field_selection[0]
+
+    def is_field_requested(self, field_name):
+        selection = self.field_selection
+        return selection is None or field_name in selection
+
+    def get_fields(self):
+        fields = super(DynamicFieldsMixin, self).get_fields()
+        selection = self.field_selection
+        if selection is None:
+            return fields
+
+        paths = self.get_field_paths('fields')
+        expand = self.get_field_paths('expand') or set()
+        prefix = self.get_serializer_path()
+
+        trimmed = OrderedDict()
+        for field_name, field in fields.items():
+            if field_name not in selection:
+                continue
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if isinstance(nested, serializers.BaseSerializer) and field.source != '*':
+                path = prefix + (field_name,)
+                has_subfields = any(
+                    len(p) > len(path) and p[:len(path)] == path for p in paths
+                )
+                if path not in expand and not has_subfields:
+                    kwargs = {'read_only': True, 'many': many}
+                    if field.source is not None:
+                        kwargs['source'] = field.source
+                    field = serializers.PrimaryKeyRelatedField(**kwargs)
+            trimmed[field_name] = field
+        return trimmed
+
+
+class DynamicFieldsModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    pass
+
+
+class AdditionalSampleInformationSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = AdditionalSampleInformation
         fields = "__all__"
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Project
         fields = (
@@ -72,7 +181,7 @@ class ProjectSerializer(serializers.ModelSerializer):
         )
 
 
-class SampleSerializer(serializers.ModelSerializer):
+class SampleSerializer(DynamicFieldsModelSerializer):
     additionalsampleinformation = (
         AdditionalSampleInformationSerializer(read_only=True)
     )
@@ -94,7 +203,7 @@ class SampleSerializer(serializers.ModelSerializer):
         )
 
 
-class TenxAnalysisSerializer(serializers.ModelSerializer):
+class TenxAnalysisSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = TenxAnalysis
         fields = (
@@ -109,7 +218,7 @@ class TenxAnalysisSerializer(serializers.ModelSerializer):
             'tenxsequencing_set',
         )
 
-class LaneSerializer(serializers.ModelSerializer):
+class LaneSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = DlpLane
         fields = (
@@ -122,7 +231,7 @@ class LaneSerializer(serializers.ModelSerializer):
 
 
 
-class SequencingSerializer(serializers.ModelSerializer):
+class SequencingSerializer(DynamicFieldsModelSerializer):
     library = serializers.SlugRelatedField(read_only=True, slug_field='pool_id')
     dlplane_set = LaneSerializer(many=True, read_only=True)
     class Meta:
@@ -130,7 +239,7 @@ class SequencingSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class TagSerializerField(serializers.ModelSerializer):
+class TagSerializerField(DynamicFieldsModelSerializer):
     class Meta:
         model = Project
         fields = (
@@ -139,23 +248,23 @@ class TagSerializerField(serializers.ModelSerializer):
         )
 
 
-class DlpLibraryConstructionInformationSerializer(serializers.ModelSerializer):
+class DlpLibraryConstructionInformationSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = DlpLibraryConstructionInformation
         fields = '__all__'
 
 
-class DlpLibrarySampleDetailSerializer(serializers.ModelSerializer):
+class DlpLibrarySampleDetailSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = DlpLibrarySampleDetail
         fields = '__all__'
 
-class DlpLibraryQuantificationAndStorageSerializer(serializers.ModelSerializer):
+class DlpLibraryQuantificationAndStorageSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = DlpLibraryQuantificationAndStorage
         fields = '__all__'
 
-class LibrarySerializer(serializers.ModelSerializer):
+class LibrarySerializer(DynamicFieldsModelSerializer):
     sample = SampleSerializer()
     dlplibraryconstructioninformation = DlpLibraryConstructionInformationSerializer()
     dlplibrarysampledetail = DlpLibrarySampleDetailSerializer()
@@ -188,12 +297,48 @@ class LibrarySerializer(serializers.ModelSerializer):
             'normal_sample_library_id',
         )
 
-class SublibraryInformationSerializer(serializers.ModelSerializer):
+def get_chip_region_metadata(chip_region_ids):
+    """Return {chip region id: {"region_code": ..., <field>: <value>}} from one query."""
+    rows = ChipRegion.objects.filter(id__in=set(chip_region_ids)).values_list(
+        'id',
+        'region_code',
+        'chipregionmetadata__metadata_field__field',
+        'chipregionmetadata__metadata_value',
+    ).order_by('id', 'chipregionmetadata__id')
+
+    region_metadata = {}
+    for chip_region_id, region_code, field, value in rows:
+        metadata = region_metadata.setdefault(chip_region_id, {"region_code": region_code})
+        if field is not None:
+            metadata[field] = value
+    return region_metadata
+
+
+class SublibraryInformationListSerializer(serializers.ListSerializer):
+    """Load the chip region metadata of every cell in the page at once."""
+    def to_representation(self, data):
+        sublibraries = list(data.all() if hasattr(data, 'all') else data)
+        if self.child.is_field_requested("metadata"):
+            self.child.region_metadata = get_chip_region_metadata(
+                [s.chip_region_id for s in sublibraries if s.chip_region_id]
+            )
+        return super(SublibraryInformationListSerializer, self).to_representation(sublibraries)
+
+
+class SublibraryInformationSerializer(DynamicFieldsModelSerializer):
     sample_id = SampleSerializer(read_only=True)
     library = LibrarySerializer(read_only=True)
 
+    region_metadata = None
+
+    computed_field_sources = {
+        'metadata': ('chip_region',),
+        'cell_id': ('cell_id',),
+    }
+
     class Meta:
         model = SublibraryInformation
+        list_serializer_class = SublibraryInformationListSerializer
         fields = (
             'sample_id',
             'row',
@@ -210,20 +355,28 @@ class SublibraryInformationSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         value = super(SublibraryInformationSerializer, self).to_representation(instance)
-        if instance.chip_region:
-            value["metadata"] = {"region_code" : instance.chip_region.region_code}
-            for metadata in instance.chip_region.chipregionmetadata_set.all():
-                value["metadata"][metadata.metadata_field.field] = metadata.metadata_value
-        value["cell_id"] = instance.get_sublibrary_id()
+        if self.is_field_requested("metadata") and instance.chip_region_id:
+            region_metadata = self.region_metadata
+            if region_metadata is None or instance.chip_region_id not in region_metadata:
+                region_metadata = get_chip_region_metadata([instance.chip_region_id])
+            value["metadata"] = dict(region_metadata[instance.chip_region_id])
+        if self.is_field_requested("cell_id"):
+            value["cell_id"] = instance.cell_id
         return value
 
-class SublibraryInformationSerializerBrief(serializers.ModelSerializer):
+class SublibraryInformationSerializerBrief(DynamicFieldsModelSerializer):
+    class Meta:
+        model = SublibraryInformation
+        fields = '__all__'
+
+
+class SublibraryInformationProjectionBrief(ProjectionSerializer):
     class Meta:
         model = SublibraryInformation
         fields = '__all__'
 
 
-class ReferenceGenomeSerializer(serializers.ModelSerializer):
+class ReferenceGenomeSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = ReferenceGenome
         fields = (
@@ -231,7 +384,7 @@ class ReferenceGenomeSerializer(serializers.ModelSerializer):
         )
 
 
-class AnalysisRunSerializer(serializers.ModelSerializer):
+class AnalysisRunSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = AnalysisRun
         fields = (
@@ -261,7 +414,7 @@ class AnalysisRunSerializer(serializers.ModelSerializer):
         return analysis_run
 
 
-class AnalysisInformationSerializer(serializers.ModelSerializer):
+class AnalysisInformationSerializer(DynamicFieldsModelSerializer):
     library = LibrarySerializer(read_only=True)
     analysis_run = AnalysisRunSerializer(read_only=True)
     reference_genome = ReferenceGenomeSerializer(read_only=True)
@@ -368,7 +521,7 @@ class AnalysisInformationCreateSerializer(serializers.ModelSerializer):
 
         return instance
 
-class MetadataSerializer(serializers.ModelSerializer):
+class MetadataSerializer(DynamicFieldsModelSerializer):
 
     class Meta:
         model = MetadataField
@@ -377,7 +530,7 @@ class MetadataSerializer(serializers.ModelSerializer):
         )
 
 
-class ChipRegionMetadataSerializer(serializers.ModelSerializer):
+class ChipRegionMetadataSerializer(DynamicFieldsModelSerializer):
     metadata_field = MetadataSerializer(read_only=True)
     metadata_field = metadata_field['field']._field
 
@@ -389,7 +542,7 @@ class ChipRegionMetadataSerializer(serializers.ModelSerializer):
         )
 
 
-class ChipRegionSerializer(serializers.ModelSerializer):
+class ChipRegionSerializer(DynamicFieldsModelSerializer):
     chipregionmetadata_set = ChipRegionMetadataSerializer(read_only=True,many=True)
     jira_ticket = serializers.CharField(source='library.jira_ticket')
     class Meta:
@@ -403,20 +556,25 @@ class ChipRegionSerializer(serializers.ModelSerializer):
         )
 
 
-class JiraUserSerializer(serializers.ModelSerializer):
+class JiraUserSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = JiraUser
         fields = '__all__'
 
 
 
-class TenxLaneSerializer(serializers.ModelSerializer):
+class TenxLaneSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = TenxLane
         fields = '__all__'
 
-class TenxSequencingSerializer(serializers.ModelSerializer):
+class TenxSequencingSerializer(DynamicFieldsModelSerializer):
     tenxlane_set = TenxLaneSerializer(many=True, read_only=True)
+
+    computed_field_sources = {
+        'library': ('library',),
+    }
+
     class Meta:
         model = TenxSequencing
         fields = (
@@ -437,25 +595,27 @@ class TenxSequencingSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         value = super(TenxSequencingSerializer, self).to_representation(instance)
-        value["library"] = [instance.library.id] if instance.library else []
+        if self.is_field_requested("library"):
+            value["library"] = [instance.library_id] if instance.library_id else []
         return value
 
-class TenxLibraryConstructionInformationSerializer(serializers.ModelSerializer):
+class TenxLibraryConstructionInformationSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = TenxLibraryConstructionInformation
         fields = "__all__"
 
-class TenxLibrarySampleDetailSerializer(serializers.ModelSerializer):
+class TenxLibrarySampleDetailSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = TenxLibrarySampleDetail
         fields = "__all__"
 
-class TenxLibraryQuantificationAndStorageSerializer(serializers.ModelSerializer):
+class TenxLibraryQuantificationAndStorageSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = TenxLibraryQuantificationAndStorage
         fields = "__all__"
 
-class TenxPoolSerializer(serializers.ModelSerializer):
+class TenxPoolSerializer(DynamicFieldsModelSerializer):
+    tenxsequencing_set = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     class Meta:
         model = TenxPool
         fields = (
@@ -465,15 +625,11 @@ class TenxPoolSerializer(serializers.ModelSerializer):
             'construction_location',
             'constructed_date',
             'libraries',
+            'tenxsequencing_set',
         )
 
-    def to_representation(self, instance):
-        value = super(TenxPoolSerializer, self).to_representation(instance)
-        value["tenxsequencing_set"] = [s.pk for s in  instance.tenxsequencing_set.all()]
-        return value
-
 
-class TenxLibrarySerializer(serializers.ModelSerializer):
+class TenxLibrarySerializer(DynamicFieldsModelSerializer):
     tenxsequencing_set = TenxSequencingSerializer(many=True, read_only=True)
     tenxpool_set = TenxPoolSerializer(many=True)
     tenxlibraryconstructioninformation = TenxLibraryConstructionInformationSerializer()
@@ -507,9 +663,14 @@ class TenxLibrarySerializer(serializers.ModelSerializer):
             'gsc_library_id',
         )
 
-class TenxChipSerializer(serializers.ModelSerializer):
+class TenxChipSerializer(DynamicFieldsModelSerializer):
     name = serializers.CharField(source="get_id")
     tenxlibrary_set = TenxLibrarySerializer(many=True, read_only=True)
+
+    computed_field_sources = {
+        'name': ('id',),
+    }
+
     class Meta:
         model = TenxChip
         fields = (
@@ -543,6 +704,12 @@ class KuduSampleSerializer(serializers.ModelSerializer):
         )
 
 
+class KuduSampleProjection(ProjectionSerializer):
+    class Meta:
+        model = Sample
+        fields = KuduSampleSerializer.Meta.fields
+
+
 class KuduProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
@@ -552,11 +719,21 @@ class KuduProjectSerializer(serializers.ModelSerializer):
         )
 
 
+class KuduProjectProjection(ProjectionSerializer):
+    class Meta:
+        model = Project
+        fields = KuduProjectSerializer.Meta.fields
+
+
 #============================
 # DLP
 #----------------------------
 class KuduDLPLibraryListSerializer(serializers.ModelSerializer):
     projects = KuduProjectSerializer(many=True, read_only=True)
+    computed_field_sources = {
+        'sample_id': ('sample.sample_id',),
+    }
+
     class Meta:
         model = DlpLibrary
         fields = (
@@ -570,11 +747,25 @@ class KuduDLPLibraryListSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         value = super(KuduDLPLibraryListSerializer, self).to_representation(instance)
-        value['sample_id'] = get_object_or_404(Sample,id=value['sample_id']).sample_id
+        value['sample_id'] = instance.sample.sample_id
         value['projects'] = ", ".join([i["name"] for i in value['projects']])
         return value
 
+
+class KuduDLPLibraryListProjection(ProjectionSerializer):
+    sample_id = Column('sample__sample_id')
+    projects = JoinedColumn('projects__name')
+
+    class Meta:
+        model = DlpLibrary
+        fields = KuduDLPLibraryListSerializer.Meta.fields
+
+
 class KuduDLPSequencingSerializer(serializers.ModelSerializer):
+    computed_field_sources = {
+        'library': ('library.pool_id', 'library.jira_ticket', 'library.sample.sample_id'),
+    }
+
     class Meta:
         model = DlpSequencing
         fields = (
@@ -586,13 +777,28 @@ class KuduDLPSequencingSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         value = super(KuduDLPSequencingSerializer, self).to_representation(instance)
-        temp_lib = get_object_or_404(DlpLibrary,id=value['library'])
+        temp_lib = instance.library
         value['jira_ticket'] = temp_lib.jira_ticket
-        value['sample_id'] = get_object_or_404(Sample,id=temp_lib.sample_id).sample_id
+        value['sample_id'] = temp_lib.sample.sample_id
         value['library'] = temp_lib.pool_id
         return value
 
+
+class KuduDLPSequencingProjection(ProjectionSerializer):
+    library = Column('library__pool_id')
+    jira_ticket = Column('library__jira_ticket')
+    sample_id = Column('library__sample__sample_id')
+
+    class Meta:
+        model = DlpSequencing
+        fields = KuduDLPSequencingSerializer.Meta.fields + ('jira_ticket', 'sample_id')
+
+
 class KuduDLPAnalysisSerializer(serializers.ModelSerializer):
+    computed_field_sources = {
+        'analysis_run': ('analysis_run.last_updated', 'analysis_run.run_status'),
+    }
+
     class Meta:
         model = DlpAnalysisInformation
         fields = (
@@ -603,17 +809,30 @@ class KuduDLPAnalysisSerializer(serializers.ModelSerializer):
         )
     def to_representation(self, instance):
         value = super(KuduDLPAnalysisSerializer, self).to_representation(instance)
-        temp_analysis = get_object_or_404(AnalysisRun,id=value['analysis_run'])
-        value['last_updated'] = temp_analysis.last_updated
-        value['run_status'] = temp_analysis.run_status
+        temp_analysis = instance.analysis_run
+        value['last_updated'] = temp_analysis.last_updated if temp_analysis else None
+        value['run_status'] = temp_analysis.run_status if temp_analysis else None
         return value
 
+
+class KuduDLPAnalysisProjection(ProjectionSerializer):
+    last_updated = Column('analysis_run__last_updated')
+    run_status = Column('analysis_run__run_status')
+
+    class Meta:
+        model = DlpAnalysisInformation
+        fields = KuduDLPAnalysisSerializer.Meta.fields + ('last_updated', 'run_status')
+
 #============================
 # TENX
 #----------------------------
 
 class KuduTenxLibraryListSerializer(serializers.ModelSerializer):
     projects = KuduProjectSerializer(many=True, read_only=True)
+    computed_field_sources = {
+        'sample_id': ('sample.sample_id',),
+    }
+
     class Meta:
         model = TenxLibrary
         fields = (
@@ -625,11 +844,20 @@ class KuduTenxLibraryListSerializer(serializers.ModelSerializer):
         )
     def to_representation(self, instance):
         value = super(KuduTenxLibraryListSerializer, self).to_representation(instance)
-        value['sample_id'] = get_object_or_404(Sample,id=value['sample_id']).sample_id
+        value['sample_id'] = instance.sample.sample_id
         value['projects'] = ", ".join([i["name"] for i in value['projects']])
         return value
 
 
+class KuduTenxLibraryListProjection(ProjectionSerializer):
+    sample_id = Column('sample__sample_id')
+    projects = JoinedColumn('projects__name')
+
+    class Meta:
+        model = TenxLibrary
+        fields = KuduTenxLibraryListSerializer.Meta.fields
+
+
 class KuduTenxPoolSerializer(serializers.ModelSerializer):
     class Meta:
         model = TenxPool
@@ -642,8 +870,19 @@ class KuduTenxPoolSerializer(serializers.ModelSerializer):
         )
 
 
+class KuduTenxPoolProjection(ProjectionSerializer):
+    class Meta:
+        model = TenxPool
+        fields = KuduTenxPoolSerializer.Meta.fields
+
+
 class KuduTenxChipSerializer(serializers.ModelSerializer):
     name = serializers.CharField(source="get_id")
+
+    computed_field_sources = {
+        'name': ('id',),
+    }
+
     class Meta:
         model = TenxChip
         fields = (
@@ -652,6 +891,15 @@ class KuduTenxChipSerializer(serializers.ModelSerializer):
             'name'
         )
 
+
+class KuduTenxChipProjection(ProjectionSerializer):
+    name = Column('id', format_chip_id)
+
+    class Meta:
+        model = TenxChip
+        fields = KuduTenxChipSerializer.Meta.fields
+
+
 class KuduTenxSequencingSerializer(serializers.ModelSerializer):
     class Meta:
         model = TenxSequencing
@@ -665,6 +913,13 @@ class KuduTenxSequencingSerializer(serializers.ModelSerializer):
             'lane_requested_date',
         )
 
+
+class KuduTenxSequencingProjection(ProjectionSerializer):
+    class Meta:
+        model = TenxSequencing
+        fields = KuduTenxSequencingSerializer.Meta.fields
+
+
 class KuduTenxAnalysisSerializer(serializers.ModelSerializer):
     class Meta:
         model = TenxAnalysis
@@ -676,3 +931,8 @@ class KuduTenxAnalysisSerializer(serializers.ModelSerializer):
             'run_status'
         )
 
+
+class KuduTenxAnalysisProjection(ProjectionSerializer):
+    class Meta:
+        model = TenxAnalysis
+        fields = KuduTenxAnalysisSerializer.Meta.fields
@@ -0,0 +1,918 @@
+"""
+Tests of the API against a synthetic LIMS (see core.testing).
+
+For the query budgets, every router route is requested, then requested
+again after more of the LIMS has been generated. A route fails when it
+needs more queries than its budget, or when its query count grows with the
+number of rows it returns. The other tests check what routes return.
+"""
+import datetime
+import json
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from api import changes, columnar, graph
+from api.prefetch import plan_related
+from api.serializers import LibrarySerializer
+from api.views import LaneViewSet, SublibraryViewSet
+from core.models import ChipRegion, ModelVersion, Project, Sample, SearchDocument, SublibraryInformation
+from core.testing import ApiClientMixin, LimsTestCase, QueryBudgetTestCase
+from dlp.models import DlpLane, DlpLibrary, DlpSequencing
+from sisyphus.models import AnalysisRun, DlpAnalysisInformation
+from tenx.models import TenxAnalysis, TenxChip, TenxLane, TenxLibrary, TenxPool, TenxSequencing
+
+
+# Large enough for every list to return all of its rows
+PAGE_SIZE = 10000
+
+
+# Queries allowed for one request to each list route, whatever its size
+LIST_BUDGETS = OrderedDict([
+    ('project', 6),
+    ('sample', 5),
+    ('lane', 3),
+    ('sequencing', 5),
+    ('library', 11),
+    ('sublibraries', 14),
+    ('sublibraries_brief', 3),
+    ('analysis_information', 13),
+    ('analysis_run', 3),
+    ('experimental_metadata', 5),
+    ('jira_users', 2),
+    ('tenxpool', 5),
+    ('tenxchip', 20),
+    ('tenxlibrary', 14),
+    ('tenxsequencing', 4),
+    ('tenxlane', 3),
+    ('tenxanalysis', 4),
+    ('kuduproject_list', 2),
+    ('kudusample_list', 2),
+    ('kududlplibrary_list', 3),
+    ('kududlpsequencing_list', 2),
+    ('kududlpanalysis_list', 2),
+    ('kudutenxlibrary_list', 3),
+    ('kudutenxchip_list', 2),
+    ('kudutenxpool_list', 2),
+    ('kudutenxsequencing_list', 2),
+    ('kudutenxanalysis_list', 2),
+])
+
+# Queries allowed for one request to each detail route, and the model of
+# the row requested
+DETAIL_BUDGETS = OrderedDict([
+    ('project', (Project, 5)),
+    ('sample', (Sample, 4)),
+    ('lane', (DlpLane, 2)),
+    ('sequencing', (DlpSequencing, 4)),
+    ('library', (DlpLibrary, 10)),
+    ('sublibraries', (SublibraryInformation, 13)),
+    ('sublibraries_brief', (SublibraryInformation, 2)),
+    ('analysis_information', (DlpAnalysisInformation, 12)),
+    ('analysis_run', (AnalysisRun, 2)),
+    ('experimental_metadata', (ChipRegion, 4)),
+    ('tenxpool', (TenxPool, 4)),
+    ('tenxchip', (TenxChip, 19)),
+    ('tenxlibrary', (TenxLibrary, 13)),
+    ('tenxsequencing', (TenxSequencing, 3)),
+    ('tenxlane', (TenxLane, 2)),
+    ('tenxanalysis', (TenxAnalysis, 3)),
+    ('kuduproject_list', (Project, 2)),
+    ('kudusample_list', (Sample, 2)),
+    ('kududlplibrary_list', (DlpLibrary, 3)),
+    ('kududlpsequencing_list', (DlpSequencing, 2)),
+    ('kududlpanalysis_list', (DlpAnalysisInformation, 2)),
+    ('kudutenxlibrary_list', (TenxLibrary, 3)),
+    ('kudutenxchip_list', (TenxChip, 2)),
+    ('kudutenxpool_list', (TenxPool, 2)),
+    ('kudutenxsequencing_list', (TenxSequencing, 2)),
+    ('kudutenxanalysis_list', (TenxAnalysis, 2)),
+])
+
+
+class QueryBudgetTests(ApiClientMixin, QueryBudgetTestCase):
+
+    def test_list_routes(self):
+        self.assertQueryBudgets(OrderedDict(
+            ('/api/%s/?page_size=%d' % (route, PAGE_SIZE), budget)
+            for route, budget in LIST_BUDGETS.items()
+        ))
+
+    def test_detail_routes(self):
+        self.assertQueryBudgets(OrderedDict(
+            ('/api/%s/%d/' % (route, model.objects.order_by('id').first().id), budget)
+            for route, (model, budget) in DETAIL_BUDGETS.items()
+        ))
+
+    def test_other_routes(self):
+        library_tree = {'library': {'include': {
+            'sample': {},
+            'sequencings': {'include': {'lanes': {}}},
+            'analyses': {'include': {'analysis_run': {}, 'lanes': {}}},
+            'chip_regions': {'include': {'metadata': {}}},
+        }}}
+        self.assertQueryBudgets(OrderedDict([
+            ('/api/graph/?%s' % urlencode({'query': json.dumps(library_tree)}), 10),
+            ('/api/sublibraries/?library__pool_id=%s' % DlpLibrary.objects.first().pool_id, 14),
+            ('/api/kudusearch/%s' % Sample.objects.first().sample_id, 2),
+            ('/api/kudusearch/%s' % Project.objects.first().name, 2),
+            ('/api/kudusearch/SYN?group=core.Samples&start=1', 2),
+            ('/api/changes/?page_size=10000', 32),
+            ('/api/stats/', 8),
+        ]))
+
+
+class GraphTests(ApiClientMixin, LimsTestCase):
+    scale = 2
+
+    def query(self, query):
+        return self.client.post('/api/graph/', query, format='json')
+
+    def test_nested_rows(self):
+        library = DlpLibrary.objects.order_by('id').first()
+        response = self.query({'library': {
+            'filter': {'pool_id': library.pool_id},
+            'fields': ['id', 'pool_id'],
+            'include': {
+                'sample': {'fields': ['sample_id']},
+                'sequencings': {'fields': ['id'], 'include': {'lanes': {'fields': ['flow_cell_id']}}},
+            },
+        }})
+        self.assertEqual(response.status_code, 200)
+
+        [row] = response.data['library']
+        self.assertEqual(row['pool_id'], library.pool_id)
+        self.assertEqual(row['sample'], {'sample_id': library.sample.sample_id})
+        sequencings = library.dlpsequencing_set.order_by('id')
+        self.assertEqual([s['id'] for s in row['sequencings']], [s.id for s in sequencings])
+        for nested, sequencing in zip(row['sequencings'], sequencings):
+            self.assertEqual(
+                [lane['flow_cell_id'] for lane in nested['lanes']],
+                list(sequencing.dlplane_set.order_by('id').values_list('flow_cell_id', flat=True)))
+
+    def test_get_is_conditional(self):
+        url = '/api/graph/?%s' % urlencode({'query': json.dumps({'sample': {'fields': ['sample_id']}})})
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_nodes_without_fields_change_the_etag(self):
+        url = '/api/graph/?%s' % urlencode({'query': json.dumps({'library': {
+            'fields': ['pool_id'], 'include': {'sequencings': {'fields': []}}}})})
+        etag = self.get(url)['ETag']
+        sequencing = DlpSequencing.objects.order_by('id').first()
+        sequencing.save()
+        self.run_commit_hooks()
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_covers_the_media_type(self):
+        url = '/api/graph/?%s' % urlencode({'query': json.dumps({'sample': {'fields': ['sample_id']}})})
+        etag = self.get(url)['ETag']
+        response = self.get(url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_limits(self):
+        response = self.query({'sample': {'limit': 1}})
+        self.assertEqual(len(response.data['sample']), 1)
+
+        with mock.patch.object(graph, 'DEFAULT_LIMIT', 1):
+            self.assertEqual(len(self.query({'sample': {}}).data['sample']), 1)
+
+        self.assertEqual(self.query({'sample': {'limit': graph.MAX_LIMIT + 1}}).status_code, 400)
+        self.assertEqual(self.query({'sample': {'limit': -1}}).status_code, 400)
+
+    def test_nested_limit_is_not_cut(self):
+        query = {'library': {'include': {'sequencings': {'limit': 3}}}}
+        # Two libraries with two sequencings each
+        self.assertEqual(self.query(query).status_code, 400)
+        query['library']['include']['sequencings']['limit'] = 4
+        response = self.query(query)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(row['sequencings']) for row in response.data['library']], [2, 2])
+
+    def test_bad_filter_values(self):
+        self.assertEqual(self.query({'library': {'filter': {'id': 'abc'}}}).status_code, 400)
+        self.assertEqual(self.query({'library': {'filter': {'id__in': [1, 'abc']}}}).status_code, 400)
+        self.assertEqual(self.query({'library': {'filter': {'sample': 'abc'}}}).status_code, 400)
+        library = DlpLibrary.objects.order_by('id').first()
+        response = self.query({'library': {'filter': {'id': str(library.id)}, 'fields': ['id']}})
+        self.assertEqual(response.data['library'], [{'id': library.id}])
+
+
+class CellIdTests(ApiClientMixin, LimsTestCase):
+
+    def setUp(self):
+        super(CellIdTests, self).setUp()
+        self.sample = Sample.objects.get(pk=self.samples[0].pk)
+        self.library = DlpLibrary.objects.get(sample=self.sample)
+        # A second chip of the same sample, given the chip id of the first
+        self.reused = DlpLibrary.objects.create(pool_id=self.library.pool_id, sample=self.sample)
+        self.first = SublibraryInformation.objects.filter(library=self.library).order_by('id').first()
+        self.copy = SublibraryInformation.objects.create(
+            library=self.reused, sample_id=self.sample, row=self.first.row, column=self.first.column)
+
+    def test_reused_chip_ids_share_cell_ids(self):
+        self.assertEqual(self.copy.cell_id, self.first.cell_id)
+        self.copy.save()
+        self.assertEqual(SublibraryInformation.objects.filter(cell_id=self.first.cell_id).count(), 2)
+
+    def test_renames_update_cell_ids(self):
+        sample = self.sample
+        sample.sample_id = 'SYNRENAMED'
+        sample.save()
+        self.library.pool_id = 'SYNCHIP'
+        self.library.save()
+
+        for sublibrary in SublibraryInformation.objects.filter(sample_id=sample).select_related('library'):
+            self.assertEqual(sublibrary.cell_id, sublibrary.build_cell_id())
+        self.assertEqual(
+            SublibraryInformation.objects.get(pk=self.copy.pk).cell_id,
+            self.first.cell_id.replace(self.samples[0].sample_id, 'SYNRENAMED'))
+        self.assertTrue(
+            SublibraryInformation.objects.get(pk=self.first.pk).cell_id.startswith('SYNRENAMED-SYNCHIP-'))
+
+    def test_other_saves_leave_cell_ids(self):
+        table = SublibraryInformation._meta.db_table
+        self.library.title = 'changed'
+        self.sample.notes = 'changed'
+        with CaptureQueriesContext(connection) as queries:
+            self.library.save()
+            self.sample.save()
+            # Not saved, so not renamed yet
+            self.library.pool_id = 'SYNCHIP'
+            self.library.save(update_fields=['title'])
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE') and table in query['sql']])
+
+    def test_resolve(self):
+        other = SublibraryInformation.objects.filter(library=self.library).order_by('id')[1]
+        response = self.client.post(
+            '/api/sublibraries/resolve/', [other.cell_id, self.first.cell_id, 'SYNMISSING'], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row['id'] for row in response.data['results']], [other.id, self.first.id, self.copy.id])
+        self.assertEqual(response.data['missing'], ['SYNMISSING'])
+        self.assertEqual(response.data['results'][1]['metadata']['region_code'], self.first.chip_region.region_code)
+        self.assertIsNone(response.data['results'][2]['metadata'])
+
+
+class ChangeFeedTests(ApiClientMixin, LimsTestCase):
+    scale = 2
+
+    def poll(self, cursor='', **params):
+        params.update(models='core.sample', cursor=cursor)
+        response = self.get('/api/changes/?%s' % urlencode(params))
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def hide_history(self, sample):
+        """Remove the history row of sample, as if its transaction had not committed yet."""
+        row = Sample.history.filter(id=sample.pk).values()[0]
+        Sample.history.filter(history_id=row['history_id']).delete()
+        return row
+
+    def test_created_updated_deleted(self):
+        data = self.poll()
+        self.assertFalse(data['more'])
+        self.assertEqual(data['changes']['core.sample']['created'], sorted(sample.pk for sample in self.samples))
+        cursor = data['cursor']
+        self.assertEqual(self.poll(cursor)['changes'], {})
+
+        created = Sample.objects.create(sample_id='SYNNEW', sample_type='P')
+        updated = Sample.objects.get(pk=self.samples[0].pk)
+        updated.notes = 'changed'
+        updated.save()
+        Sample.objects.get(pk=self.samples[1].pk).delete()
+
+        data = self.poll(cursor)
+        self.assertEqual(data['changes']['core.sample'], {
+            'created': [created.pk], 'updated': [updated.pk], 'deleted': [self.samples[1].pk]})
+        # Resuming from the new cursor reports nothing twice
+        self.assertEqual(self.poll(data['cursor'])['changes'], {})
+
+    def test_pages(self):
+        for index in range(3):
+            Sample.objects.create(sample_id='SYNPAGE%d' % index, sample_type='P')
+
+        created = []
+        cursor = ''
+        for _ in range(Sample.objects.count()):
+            data = self.poll(cursor, page_size=1)
+            created.extend(data['changes']['core.sample']['created'])
+            cursor = data['cursor']
+            if not data['more']:
+                break
+        self.assertFalse(data['more'])
+        self.assertEqual(created, sorted(Sample.objects.values_list('pk', flat=True)))
+
+        self.assertEqual(self.get('/api/changes/?page_size=0').status_code, 400)
+        self.assertEqual(self.get('/api/changes/?cursor=nonsense').status_code, 400)
+
+    def test_exact_pages(self):
+        def poll(cursor='', **params):
+            params.update(models='core.sample,dlp.dlplibrary', cursor=cursor)
+            return self.get('/api/changes/?%s' % urlencode(params)).data
+
+        cursor = poll()['cursor']
+        for index in range(2):
+            Sample.objects.create(sample_id='SYNEXACT%d' % index, sample_type='P')
+        data = poll(cursor, page_size=2)
+        self.assertEqual(len(data['changes']['core.sample']['created']), 2)
+        self.assertFalse(data['more'])
+
+        for index in range(2, 4):
+            Sample.objects.create(sample_id='SYNEXACT%d' % index, sample_type='P')
+        library = DlpLibrary.objects.order_by('id').first()
+        library.save()
+        data = poll(data['cursor'], page_size=2)
+        self.assertNotIn('dlp.dlplibrary', data['changes'])
+        self.assertTrue(data['more'])
+        data = poll(data['cursor'], page_size=2)
+        self.assertEqual(data['changes']['dlp.dlplibrary']['updated'], [library.pk])
+        self.assertFalse(data['more'])
+
+    def test_late_commits(self):
+        cursor = self.poll()['cursor']
+        late = Sample.objects.create(sample_id='SYNLATE', sample_type='P')
+        early = Sample.objects.create(sample_id='SYNEARLY', sample_type='P')
+        row = self.hide_history(late)
+
+        data = self.poll(cursor)
+        self.assertEqual(data['changes']['core.sample']['created'], [early.pk])
+
+        Sample.history.model.objects.create(**row)
+        data = self.poll(data['cursor'])
+        self.assertEqual(data['changes']['core.sample']['created'], [late.pk])
+        self.assertEqual(self.poll(data['cursor'])['changes'], {})
+
+    def test_gaps_expire(self):
+        cursor = self.poll()['cursor']
+        late = Sample.objects.create(sample_id='SYNLATE', sample_type='P')
+        early = Sample.objects.create(sample_id='SYNEARLY', sample_type='P')
+        row = self.hide_history(late)
+        # Written long enough ago for the transaction of late to have given up
+        Sample.history.filter(id=early.pk).update(
+            history_date=row['history_date'] - changes.GAP_WINDOW - datetime.timedelta(minutes=1))
+
+        data = self.poll(cursor)
+        self.assertEqual(data['changes']['core.sample']['created'], [early.pk])
+        Sample.history.model.objects.create(**row)
+        self.assertEqual(self.poll(data['cursor'])['changes'], {})
+
+    def test_gaps_are_capped_across_models(self):
+        expires = int(timezone.now().timestamp()) + 3600
+        positions = dict(
+            ('app.model%d' % model, [10 ** 9, [[n * 2, n * 2, expires + n] for n in range(changes.MAX_GAPS)]])
+            for model in range(30)
+        )
+        trimmed = changes.trim_gaps(positions)
+        self.assertEqual(sum(len(gaps) for _, gaps in trimmed.values()), changes.MAX_GAPS)
+        # The newest gaps are kept
+        self.assertEqual(min(gap[2] for _, gaps in trimmed.values() for gap in gaps), expires + changes.MAX_GAPS - 2)
+        self.assertLess(len(changes.encode_cursor(trimmed)), 8192)
+
+    def test_since(self):
+        since = timezone.now()
+        Sample.history.all().update(history_date=since - datetime.timedelta(days=1))
+        created = Sample.objects.create(sample_id='SYNSINCE', sample_type='P')
+
+        data = self.poll(since=since.isoformat())
+        self.assertEqual(data['changes']['core.sample'], {'created': [created.pk], 'updated': [], 'deleted': []})
+        self.assertEqual(self.poll(data['cursor'])['changes'], {})
+        # Nothing written since then starts the feed after the last row
+        data = self.poll(since=(since + datetime.timedelta(days=1)).isoformat())
+        self.assertEqual(data['changes'], {})
+        updated = Sample.objects.get(pk=self.samples[0].pk)
+        updated.save()
+        self.assertEqual(self.poll(data['cursor'])['changes']['core.sample']['updated'], [updated.pk])
+
+        self.assertEqual(self.get('/api/changes/?since=nonsense').status_code, 400)
+        self.assertEqual(self.get('/api/changes/?%s' % urlencode(
+            {'since': since.isoformat(), 'cursor': data['cursor']})).status_code, 400)
+
+
+class ConditionalGetTests(ApiClientMixin, LimsTestCase):
+
+    def test_not_modified(self):
+        response = self.get('/api/sample/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get('/api/sample/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(
+            self.get('/api/sample/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        # The ETag covers the query string and the media type
+        self.assertNotEqual(self.get('/api/sample/?page=1')['ETag'], response['ETag'])
+        self.assertNotEqual(self.get('/api/sample/', HTTP_ACCEPT='text/html')['ETag'], response['ETag'])
+
+    def test_writes_change_the_etag(self):
+        etag = self.get('/api/sample/')['ETag']
+        sample = Sample.objects.get(pk=self.samples[0].pk)
+        sample.notes = 'changed'
+        sample.save()
+        # Versions move on commit
+        self.assertEqual(self.get('/api/sample/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.run_commit_hooks()
+
+        response = self.get('/api/sample/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # Related rows read by the serializer count too
+        etag = self.get('/api/library/')['ETag']
+        sample.save()
+        self.run_commit_hooks()
+        self.assertEqual(self.get('/api/library/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bumps_are_merged(self):
+        self.run_commit_hooks()
+        version = ModelVersion.objects.get_versions([Sample])[Sample].version
+        sample = Sample.objects.get(pk=self.samples[0].pk)
+        for _ in range(3):
+            sample.save()
+        self.run_commit_hooks()
+        self.assertEqual(ModelVersion.objects.get_versions([Sample])[Sample].version, version + 1)
+
+    def test_rolled_back_bumps(self):
+        self.run_commit_hooks()
+        version = ModelVersion.objects.get_versions([Sample])[Sample].version
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                ModelVersion.objects.bump(Sample)
+                raise ValueError()
+        self.run_commit_hooks()
+        self.assertEqual(ModelVersion.objects.get_versions([Sample])[Sample].version, version)
+
+        # A bump after the rollback is not merged into the one rolled back
+        ModelVersion.objects.bump(Sample)
+        self.run_commit_hooks()
+        self.assertEqual(ModelVersion.objects.get_versions([Sample])[Sample].version, version + 1)
+
+    def test_bumps_kept_by_a_savepoint(self):
+        self.run_commit_hooks()
+        version = ModelVersion.objects.get_versions([Sample])[Sample].version
+        with transaction.atomic():
+            ModelVersion.objects.bump(Sample)
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                ModelVersion.objects.bump(Sample)
+                raise ValueError()
+        self.run_commit_hooks()
+        self.assertEqual(ModelVersion.objects.get_versions([Sample])[Sample].version, version + 1)
+
+
+class BulkWriteTests(ApiClientMixin, LimsTestCase):
+
+    def setUp(self):
+        super(BulkWriteTests, self).setUp()
+        self.sequencing = DlpSequencing.objects.order_by('id').first()
+
+    def bulk(self, method, items, url='/api/lane/bulk/'):
+        return getattr(self.client, method)(url, items, format='json')
+
+    def lanes(self, *flow_cell_ids):
+        return [{'sequencing': self.sequencing.pk, 'flow_cell_id': flow_cell_id} for flow_cell_id in flow_cell_ids]
+
+    def identifiers(self):
+        """Return the identifiers in the search document of the sequencing."""
+        return SearchDocument.objects.get(
+            app_label='dlp', model_name='dlpsequencing', object_id=self.sequencing.pk).identifiers
+
+    def test_create(self):
+        response = self.bulk('post', self.lanes('SYNBULK1XX', 'SYNBULK2XX'))
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual([lane['flow_cell_id'] for lane in response.data], ['SYNBULK1XX', 'SYNBULK2XX'])
+
+        lanes = DlpLane.objects.filter(pk__in=[lane['id'] for lane in response.data])
+        self.assertEqual(
+            sorted(lanes.values_list('flow_cell_id', 'sequencing')),
+            [('SYNBULK1XX', self.sequencing.pk), ('SYNBULK2XX', self.sequencing.pk)])
+        history = DlpLane.history.filter(id__in=[lane.pk for lane in lanes])
+        self.assertEqual(sorted(history.values_list('history_type', 'history_user')), [('+', self.user.pk)] * 2)
+
+    def test_update(self):
+        created = self.bulk('post', self.lanes('SYNBULK1XX', 'SYNBULK2XX')).data
+        response = self.bulk('patch', [
+            {'id': created[0]['id'], 'flow_cell_id': 'SYNBULK3XX'},
+            {'id': created[1]['id'], 'path_to_archive': '/archive'},
+        ])
+        self.assertEqual(response.status_code, 200, response.data)
+
+        first, second = DlpLane.objects.filter(pk__in=[lane['id'] for lane in created]).order_by('id')
+        self.assertEqual((first.flow_cell_id, first.path_to_archive), ('SYNBULK3XX', None))
+        self.assertEqual((second.flow_cell_id, second.path_to_archive), ('SYNBULK2XX', '/archive'))
+        history = DlpLane.history.filter(id=first.pk).order_by('history_id')
+        self.assertEqual(
+            list(history.values_list('history_type', 'history_user', 'flow_cell_id')),
+            [('+', self.user.pk, 'SYNBULK1XX'), ('~', self.user.pk, 'SYNBULK3XX')])
+
+    def test_invalid_items_write_nothing(self):
+        count = DlpLane.objects.count()
+        history_count = DlpLane.history.count()
+        items = self.lanes('SYNBULK1XX', 'SYNBULK2XX')
+        del items[1]['flow_cell_id']
+        self.assertEqual(self.bulk('post', items).status_code, 400)
+
+        lane = DlpLane.objects.order_by('id').first()
+        for items in [
+            [{'id': lane.pk, 'flow_cell_id': 'SYNBULK3XX'}, {'id': lane.pk + 10 ** 6, 'flow_cell_id': 'SYNBULK4XX'}],
+            [{'id': lane.pk, 'flow_cell_id': 'SYNBULK3XX'}, {'id': lane.pk, 'flow_cell_id': 'SYNBULK4XX'}],
+            [{'id': lane.pk, 'flow_cell_id': 'SYNBULK3XX'}, {'id': lane.pk + 1, 'sequencing': 10 ** 6}],
+        ]:
+            with self.subTest(items=items):
+                self.assertEqual(self.bulk('patch', items).status_code, 400)
+
+        # A write failing half way is rolled back
+        with mock.patch.object(LaneViewSet, 'save_related', side_effect=IntegrityError('duplicate key')):
+            self.assertEqual(self.bulk('post', self.lanes('SYNBULK1XX')).status_code, 400)
+            self.assertEqual(self.bulk('patch', [{'id': lane.pk, 'flow_cell_id': 'SYNBULK3XX'}]).status_code, 400)
+
+        self.assertEqual(DlpLane.objects.count(), count)
+        self.assertEqual(DlpLane.history.count(), history_count)
+        self.assertEqual(DlpLane.objects.get(pk=lane.pk).flow_cell_id, lane.flow_cell_id)
+
+    def test_versions_and_documents(self):
+        etag = self.get('/api/lane/')['ETag']
+        created = self.bulk('post', self.lanes('SYNBULK1XX')).data
+        self.run_commit_hooks()
+        self.assertEqual(self.get('/api/lane/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.assertIn('SYNBULK1XX', self.identifiers())
+
+        etag = self.get('/api/lane/')['ETag']
+        self.bulk('patch', [{'id': created[0]['id'], 'flow_cell_id': 'SYNBULK2XX'}])
+        self.run_commit_hooks()
+        self.assertEqual(self.get('/api/lane/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertIn('SYNBULK2XX', self.identifiers())
+        self.assertNotIn('SYNBULK1XX', self.identifiers())
+
+    def test_sublibrary_cell_ids(self):
+        sublibrary = SublibraryInformation.objects.select_related('library', 'sample_id').order_by('id').first()
+        item = {'library': sublibrary.library_id, 'sample_id': sublibrary.sample_id_id, 'row': 70, 'column': 71}
+        response = self.bulk('post', [item], url='/api/sublibraries/bulk/')
+        self.assertEqual(response.status_code, 201, response.data)
+        created = SublibraryInformation.objects.get(pk=response.data[0]['id'])
+        self.assertEqual(created.cell_id, created.build_cell_id())
+
+        response = self.bulk('patch', [{'id': created.pk, 'row': 72}], url='/api/sublibraries/bulk/')
+        self.assertEqual(response.status_code, 200, response.data)
+        created.refresh_from_db()
+        self.assertEqual(created.cell_id, created.build_cell_id())
+        self.assertIn('-R72-C71', created.cell_id)
+
+
+@unittest.skipIf(columnar.pyarrow is None, 'pyarrow is not installed')
+class ColumnarTests(ApiClientMixin, LimsTestCase):
+    scale = 2
+
+    def read(self, format):
+        response = self.get('/api/sublibraries/?format=%s' % format, HTTP_ACCEPT='*/*')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('application/vnd.apache.%s' % format))
+        buffer = columnar.pyarrow.BufferReader(response.body)
+        if format == 'arrow':
+            return columnar.pyarrow.ipc.open_stream(buffer).read_all()
+        return columnar.pyarrow.parquet.ParquetFile(buffer)
+
+    def check_table(self, table):
+        self.assertEqual(table.schema.names, [name.replace('__', '.') for name in SublibraryViewSet.columnar_fields])
+        self.assertEqual(table.schema.field('id').type, columnar.pyarrow.int64())
+        self.assertEqual(table.schema.field('cell_id').type, columnar.pyarrow.string())
+        self.assertEqual(table.num_rows, SublibraryInformation.objects.count())
+        self.assertEqual(
+            table.column('cell_id').to_pylist(),
+            list(SublibraryInformation.objects.order_by('id').values_list('cell_id', flat=True)))
+
+    def test_arrow(self):
+        with mock.patch.object(SublibraryViewSet, 'stream_batch_size', 5):
+            self.check_table(self.read('arrow'))
+
+    def test_parquet(self):
+        with mock.patch.object(SublibraryViewSet, 'stream_batch_size', 3), \
+                mock.patch.object(columnar, 'PARQUET_ROW_GROUP_SIZE', 10):
+            parquet = self.read('parquet')
+        self.check_table(parquet.read())
+        # 32 rows read 3 at a time, written 10 to a row group
+        self.assertEqual(
+            [parquet.metadata.row_group(index).num_rows for index in range(parquet.num_row_groups)],
+            [10, 10, 10, 2])
+
+
+class StreamingTests(ApiClientMixin, LimsTestCase):
+    scale = 3
+
+    def setUp(self):
+        super(StreamingTests, self).setUp()
+        # Several batches per response
+        patcher = mock.patch.object(SublibraryViewSet, 'stream_batch_size', 7)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def paginated(self, url):
+        """Return every row of a list route, read page by page."""
+        response = self.get(url + '?page_size=1000')
+        self.assertIsNone(response.data['next'])
+        return json.loads(response.body.decode('utf-8'))['results']
+
+    def test_json(self):
+        for url in ('/api/sample/', '/api/sublibraries/'):
+            with self.subTest(url=url):
+                response = self.get(url + '?no_pagination')
+                self.assertTrue(response.streaming)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                data = json.loads(response.body.decode('utf-8'))
+                rows = self.paginated(url)
+                self.assertEqual(data, {'count': len(rows), 'results': rows})
+
+    def test_ndjson(self):
+        response = self.get('/api/sublibraries/?no_pagination=ndjson')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = response.body.decode('utf-8').split('\n')
+        self.assertEqual(lines[-1], '')
+        self.assertEqual([json.loads(line) for line in lines[:-1]], self.paginated('/api/sublibraries/'))
+
+    def test_filters(self):
+        sample = self.samples[1]
+        response = self.get('/api/sublibraries/?no_pagination=ndjson&sample_id__sample_id=%s' % sample.sample_id)
+        rows = [json.loads(line) for line in response.body.decode('utf-8').splitlines()]
+        self.assertEqual(
+            [row['cell_id'] for row in rows],
+            list(SublibraryInformation.objects.filter(sample_id=sample).order_by('id').values_list('cell_id', flat=True)))
+
+    def test_pages_that_ignore_no_pagination(self):
+        # LargeResultsSetPagination has always returned its page
+        response = self.get('/api/sublibraries_brief/?no_pagination&page_size=5')
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNotNone(response.data['next'])
+
+
+class KeysetPaginationTests(ApiClientMixin, LimsTestCase):
+    scale = 2
+
+    def walk(self, url):
+        """Return the rows of every page following the next links from url, and the pages read."""
+        rows, pages = [], 0
+        while url:
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            rows.extend(response.data['results'])
+            pages += 1
+            url = response.data['next']
+        return rows, pages
+
+    def test_pages(self):
+        ids = list(SublibraryInformation.objects.order_by('id').values_list('id', flat=True))
+        rows, pages = self.walk('/api/sublibraries_brief/?cursor=&page_size=5')
+        self.assertEqual([row['id'] for row in rows], ids)
+        self.assertEqual(pages, (len(ids) + 4) // 5)
+
+        rows, _ = self.walk('/api/sample/?cursor=&page_size=1')
+        self.assertEqual([row['id'] for row in rows], sorted(sample.pk for sample in self.samples))
+
+    def test_rows_added_while_paging(self):
+        response = self.get('/api/sample/?cursor=&page_size=1')
+        new = Sample.objects.create(sample_id='SYNNEW', sample_type='P')
+        rows, _ = self.walk(response.data['next'])
+        self.assertEqual([row['id'] for row in rows], [self.samples[1].pk, new.pk])
+
+    def test_deep_pages_cost_the_same(self):
+        url = '/api/sublibraries_brief/?cursor=&page_size=2'
+        with CaptureQueriesContext(connection) as first:
+            response = self.get(url)
+        for _ in range(10):
+            response = self.get(response.data['next'])
+        with CaptureQueriesContext(connection) as deep:
+            self.assertEqual(len(self.get(response.data['next']).data['results']), 2)
+
+        self.assertEqual(len(deep.captured_queries), len(first.captured_queries))
+        [query] = [q['sql'] for q in deep.captured_queries if 'core_sublibraryinformation' in q['sql']]
+        self.assertIn('"core_sublibraryinformation"."id" >', query)
+        self.assertNotIn('OFFSET', query)
+
+    def test_page_numbers_still_work(self):
+        response = self.get('/api/sample/?page=2&page_size=1')
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['results'][0]['id'], self.samples[1].pk)
+
+
+class PrefetchTests(ApiClientMixin, LimsTestCase):
+    scale = 3
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_plan(self):
+        plan = plan_related(LibrarySerializer())
+        self.assertLessEqual(
+            {'sample', 'sample__additionalsampleinformation', 'dlplibrarysampledetail'}, plan.select_related)
+        self.assertLessEqual(
+            {'dlpsequencing_set', 'dlpsequencing_set__dlplane_set', 'projects'}, plan.prefetch_related)
+        self.assertIn(DlpLane, plan.models)
+        # Every column is read when all fields are rendered
+        self.assertEqual(plan.only, set())
+
+    def test_rows_cost_no_queries(self):
+        for url in ('/api/library/', '/api/sequencing/', '/api/sublibraries/', '/api/analysis_information/'):
+            with self.subTest(url=url):
+                one, _ = self.count_queries(url + '?page_size=1')
+                every, response = self.count_queries(url + '?page_size=100')
+                self.assertGreater(len(response.data['results']), 1)
+                self.assertEqual(every, one)
+
+    def test_region_metadata(self):
+        queries, response = self.count_queries('/api/sublibraries/?page_size=100')
+        self.assertEqual(queries, self.count_queries('/api/sublibraries/?page_size=1')[0])
+        rows = response.data['results']
+        self.assertEqual(len(rows), SublibraryInformation.objects.count())
+        for row in rows:
+            region = SublibraryInformation.objects.get(cell_id=row['cell_id']).chip_region
+            expected = dict(
+                (metadata.metadata_field.field, metadata.metadata_value)
+                for metadata in region.chipregionmetadata_set.all())
+            expected['region_code'] = region.region_code
+            self.assertEqual(row['metadata'], expected)
+            self.assertEqual(row['metadata']['sample_id'], row['sample_id']['sample_id'])
+
+
+class SparseFieldsTests(ApiClientMixin, LimsTestCase):
+
+    def test_fields(self):
+        library = DlpLibrary.objects.get(sample=self.samples[0])
+        response = self.get('/api/library/%d/?fields=id,pool_id,sample.sample_id' % library.pk)
+        self.assertEqual(response.data, {
+            'id': library.pk, 'pool_id': library.pool_id, 'sample': {'sample_id': library.sample.sample_id}})
+
+        [row] = self.get('/api/library/?fields=pool_id').data['results']
+        self.assertEqual(row, {'pool_id': library.pool_id})
+
+    def test_expand(self):
+        library = DlpLibrary.objects.get(sample=self.samples[0])
+        url = '/api/library/%d/?fields=id,sample,dlpsequencing_set' % library.pk
+        # Nested objects are returned as primary keys unless expanded
+        data = self.get(url).data
+        self.assertEqual(data['sample'], library.sample_id)
+        self.assertEqual(data['dlpsequencing_set'], sorted(library.dlpsequencing_set.values_list('id', flat=True)))
+
+        data = self.get(url + '&expand=sample').data
+        self.assertEqual(data['sample']['sample_id'], library.sample.sample_id)
+        self.assertIn('additionalsampleinformation', data['sample'])
+        self.assertEqual(self.get('/api/library/%d/' % library.pk).data, self.get(
+            '/api/library/%d/?expand=sample' % library.pk).data)
+
+    def test_fewer_queries(self):
+        def count(url):
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.get(url).status_code, 200)
+            return len(context.captured_queries)
+
+        self.assertLess(count('/api/library/?fields=id,pool_id'), count('/api/library/'))
+        with CaptureQueriesContext(connection) as context:
+            self.get('/api/library/?fields=id,pool_id')
+        [query] = [
+            q['sql'] for q in context.captured_queries
+            if 'FROM "dlp_dlplibrary"' in q['sql'] and 'COUNT' not in q['sql']
+        ]
+        self.assertNotIn('"dlp_dlplibrary"."description"', query)
+
+    def test_writes_return_every_field(self):
+        response = self.client.patch(
+            '/api/sample/%d/?fields=id' % self.samples[0].pk, {'notes': 'changed'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['notes'], 'changed')
+        self.assertIn('sample_id', response.data)
+
+
+class QueryRouteTests(ApiClientMixin, LimsTestCase):
+    scale = 3
+
+    def query(self, url, body, **params):
+        response = self.client.post(url + ('?' + urlencode(params) if params else ''), body, format='json')
+        if response.status_code == 200:
+            content = b''.join(response.streaming_content).decode('utf-8')
+            if response['Content-Type'] == 'application/x-ndjson':
+                response.data = [json.loads(line) for line in content.splitlines()]
+            else:
+                response.data = json.loads(content)
+        return response
+
+    def test_ids(self):
+        ids = [self.samples[2].pk, self.samples[0].pk, 10 ** 6]
+        for body in ({'id': ids}, ids):
+            response = self.query('/api/sample/query/', body)
+            self.assertEqual(response.status_code, 200)
+            # In id order, each found row once
+            self.assertEqual([row['id'] for row in response.data['results']], sorted(ids[:2]))
+            self.assertEqual(response.data['count'], 2)
+        response = self.query('/api/sample/query/', ids, no_pagination='ndjson')
+        self.assertEqual([row['id'] for row in response.data], sorted(ids[:2]))
+
+    def test_natural_keys(self):
+        names = [sample.sample_id for sample in self.samples[:2]]
+        response = self.query('/api/sample/query/', {'sample_id': names})
+        self.assertEqual([row['sample_id'] for row in response.data['results']], names)
+
+        pool_ids = list(DlpLibrary.objects.order_by('id').values_list('pool_id', flat=True)[:2])
+        response = self.query('/api/kududlplibrary_list/query/', {'pool_id': pool_ids})
+        self.assertEqual([row['pool_id'] for row in response.data], pool_ids)
+
+    def test_filters_and_fields(self):
+        sublibraries = SublibraryInformation.objects.order_by('id')
+        cell_ids = list(sublibraries.values_list('cell_id', flat=True))
+        response = self.query(
+            '/api/sublibraries/query/', {'cell_id': cell_ids}, fields='cell_id,row',
+            sample_id__sample_id=self.samples[1].sample_id)
+        self.assertEqual(response.data['results'], [
+            {'cell_id': cell_id, 'row': row}
+            for cell_id, row in sublibraries.filter(sample_id=self.samples[1]).values_list('cell_id', 'row')
+        ])
+
+    def test_invalid(self):
+        for body in ({'sample_type': ['P']}, {'id': 1}, {'id': ['one']}, {'id': [1], 'sample_id': ['SA1']}, 'SA1'):
+            with self.subTest(body=body):
+                self.assertEqual(self.query('/api/sample/query/', body).status_code, 400)
+
+
+# The Kudu lists, and the models whose rows they list
+KUDU_LISTS = OrderedDict([
+    ('/api/kuduproject_list/', Project),
+    ('/api/kudusample_list/', Sample),
+    ('/api/kududlplibrary_list/', DlpLibrary),
+    ('/api/kududlpsequencing_list/', DlpSequencing),
+    ('/api/kududlpanalysis_list/', DlpAnalysisInformation),
+    ('/api/kudutenxlibrary_list/', TenxLibrary),
+    ('/api/kudutenxchip_list/', TenxChip),
+    ('/api/kudutenxpool_list/', TenxPool),
+    ('/api/kudutenxsequencing_list/', TenxSequencing),
+    ('/api/kudutenxanalysis_list/', TenxAnalysis),
+])
+
+
+class KuduCacheTests(ApiClientMixin, LimsTestCase):
+
+    def test_cached(self):
+        for url in KUDU_LISTS:
+            with self.subTest(url=url):
+                content = self.get(url).body
+                # Only the versions of the models read are looked up
+                with self.assertNumQueries(1):
+                    response = self.get(url)
+                self.assertEqual(response.body, content)
+
+    def test_writes_invalidate(self):
+        self.get('/api/kudusample_list/')
+        self.get('/api/kududlplibrary_list/')
+        sample = Sample.objects.get(pk=self.samples[0].pk)
+        sample.sample_id = 'SYNRENAMED'
+        sample.save()
+        self.run_commit_hooks()
+
+        self.assertIn('SYNRENAMED', [row['sample_id'] for row in json.loads(self.get('/api/kudusample_list/').body)])
+        # Lists reading the sample through a relation miss too
+        self.assertIn(b'SYNRENAMED', self.get('/api/kududlplibrary_list/').body)
+
+    def test_filters_are_cached_apart(self):
+        Sample.objects.create(sample_id='SYNNEW', sample_type='P')
+        self.run_commit_hooks()
+        self.assertEqual(len(json.loads(self.get('/api/kudusample_list/').body)), 2)
+        response = self.get('/api/kudusample_list/?id__in=%d' % self.samples[0].pk)
+        self.assertEqual([row['sample_id'] for row in json.loads(response.body)], [self.samples[0].sample_id])
+
+
+class ProjectionTests(ApiClientMixin, LimsTestCase):
+    scale = 2
+
+    def test_same_as_serializers(self):
+        for url in list(KUDU_LISTS) + ['/api/sublibraries_brief/']:
+            with self.subTest(url=url):
+                projected = json.loads(self.get(url + '?page_size=100').body.decode('utf-8'))
+                # "expand" renders with the serializer without changing its output
+                serialized = json.loads(self.get(url + '?page_size=100&expand=').body.decode('utf-8'))
+                self.assertTrue(projected)
+                self.assertEqual(projected, serialized)
+
+    def test_no_model_instances(self):
+        url = '/api/sublibraries_brief/?page_size=100'
+        with mock.patch.object(SublibraryInformation, '__init__', side_effect=AssertionError('instance created')):
+            response = self.get(url)
+            self.assertEqual(len(response.data['results']), SublibraryInformation.objects.count())
+            self.get('/api/sublibraries_brief/?no_pagination=ndjson')
+            with self.assertRaises(AssertionError):
+                self.get(url + '&expand=')
+
+        # Chip names are formatted from their ids
+        cache.clear()
+        with mock.patch.object(TenxChip, '__init__', side_effect=AssertionError('instance created')):
+            rows = json.loads(self.get('/api/kudutenxchip_list/').body.decode('utf-8'))
+        self.assertTrue(rows)
+        self.assertEqual(
+            dict((row['id'], row['name']) for row in rows),
+            dict((chip.id, chip.get_id()) for chip in TenxChip.objects.all()))
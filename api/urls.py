@@ -70,6 +70,10 @@ urlpatterns = [
     url(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     url(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     url(r'^kudusearch/(?P<query>.+)$', views.kudu_search, name='kudu_search_query'),
+    url(r'^changes/$', views.ChangeFeed.as_view(), name='changes'),
+    url(r'^stats/$', views.StatsView.as_view(), name='stats'),
+    url(r'^stats/(?P<name>\w+)/$', views.StatsView.as_view(), name='stats_detail'),
+    url(r'^graph/$', views.GraphView.as_view(), name='graph'),
     url(r'^auth/$', obtain_jwt_token),
     url(r'^auth/refresh/$', refresh_jwt_token)
 ]
@@ -8,22 +8,34 @@ Updated by Spencer Vatrt-Watts (github.com/Spenca)
 #============================
 # Django & Django rest framework imports
 #----------------------------
+import datetime
 import json
 import os
+from collections import OrderedDict
 
 import django_filters
 import rest_framework.exceptions
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from rest_framework import pagination, viewsets, generics, mixins
+from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils import encoders
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
 from django.core.urlresolvers import reverse
+from django.db.models import Q
 from django.shortcuts import get_object_or_404, redirect
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import quote_etag
 
 #============================
 # App imports
 #----------------------------
-from core.search_util.search_helper import return_text_search
+from core.search_util.search_helper import get_start, return_text_search
+from core.stats import STATS, get_stats
 from core.utils import generate_samplesheet, generate_tenx_pool_sample_csv
 from .serializers import (
     SampleSerializer,
@@ -54,6 +66,18 @@ from .serializers import (
     KuduTenxChipSerializer,
     KuduTenxPoolSerializer,
     KuduTenxSequencingSerializer,
+    SublibraryInformationProjectionBrief,
+    KuduTenxLibraryListProjection,
+    KuduDLPLibraryListProjection,
+    KuduProjectProjection,
+    KuduSampleProjection,
+    KuduTenxAnalysisProjection,
+    KuduDLPAnalysisProjection,
+    KuduDLPSequencingProjection,
+    KuduTenxChipProjection,
+    KuduTenxPoolProjection,
+    KuduTenxSequencingProjection,
+    get_chip_region_metadata,
 )
 
 from core.models import (
@@ -62,6 +86,7 @@ from core.models import (
     ChipRegion,
     JiraUser,
     Project,
+    format_cell_id,
 )
 
 from dlp.models import (
@@ -71,6 +96,13 @@ from dlp.models import (
 )
 
 from tenx.models import *
+from api.bulk import BulkWriteMixin
+from api.cache import CachedListMixin
+from api.changes import decode_cursor, encode_cursor, get_changes, get_history_models, start_positions
+from api.columnar import ColumnarListMixin
+from api.conditional import ConditionalGetMixin, compute_validators, conditional_response
+from api.graph import get_models, parse_query, run_query
+from api.prefetch import SerializerPrefetchMixin
 from api.filters import (
     SampleFilter,
     SublibraryInformationFilter,
@@ -85,7 +117,51 @@ from sisyphus.models import DlpAnalysisInformation, AnalysisRun
 #============================
 # Other imports
 #----------------------------
-class VariableResultsSetPagination(pagination.PageNumberPagination):
+class KeysetResultsSetPagination(pagination.CursorPagination):
+    """Cursor pagination on the id ordering every RestrictedQueryMixin view uses.
+
+    Each page is a "WHERE id > ..." range scan, so deep pages cost the same as
+    the first one and no COUNT(*) is issued.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+
+
+class KeysetPaginationMixin(object):
+    """Opt in to keyset pagination by passing "cursor" (empty for the first page).
+
+    Follow the "next" link of each response to get the following page.
+    """
+    keyset_pagination_class = KeysetResultsSetPagination
+    keyset_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.keyset_pagination_class.cursor_query_param in request.query_params:
+            self.keyset_paginator = self.keyset_pagination_class()
+            self.keyset_paginator.page_size = self.page_size
+            return self.keyset_paginator.paginate_queryset(queryset, request, view)
+        return super(KeysetPaginationMixin, self).paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super(KeysetPaginationMixin, self).get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.to_html()
+        return super(KeysetPaginationMixin, self).to_html()
+
+    def get_schema_fields(self, view):
+        fields = super(KeysetPaginationMixin, self).get_schema_fields(view)
+        names = set(field.name for field in fields)
+        return fields + [
+            field for field in self.keyset_pagination_class().get_schema_fields(view)
+            if field.name not in names
+        ]
+
+
+class VariableResultsSetPagination(KeysetPaginationMixin, pagination.PageNumberPagination):
     page_size_query_param = 'page_size'
     page_size = 10
 
@@ -105,14 +181,48 @@ class VariableResultsSetPagination(pagination.PageNumberPagination):
             ]))
 
 
-class RestrictedQueryMixin(object):
+def dumps_json(data):
+    """Encode data the same way the compact rest framework JSON renderer does."""
+    return json.dumps(
+        data,
+        cls=encoders.JSONEncoder,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    )
+
+
+class RestrictedQueryMixin(ConditionalGetMixin, SerializerPrefetchMixin):
     """Cause view to fail on invalid filter query parameter.
 
     Thanks to rrauenza on Stack Overflow for their post here:
     https://stackoverflow.com/questions/27182527/how-can-i-stop-django-rest-framework-to-show-all-records-if-query-parameter-is-w/50957733#50957733
+
+    Also streams list responses requested with "no_pagination", where the
+    paginator honours it, so that pulling a whole table never holds every
+    row in memory at once. Use
+    "no_pagination=ndjson" to get one JSON object per line instead of a
+    JSON document.
+
+    List and detail responses carry ETag and Last-Modified headers and
+    answer matching conditional requests with 304 Not Modified.
+
+    POST a JSON body such as {"id": [1, 2, 3]} to "query/" to fetch any
+    number of rows by id, or by one of the natural keys in query_keys, in
+    a single streamed response.
+
+    Views with a projection_class render list and query/ rows with it
+    straight from values(), unless "fields" or "expand" is given.
     """
+    stream_batch_size = 500
+
+    # Natural keys, besides id, that rows can be looked up by through query/
+    query_keys = ()
+
+    # A ProjectionSerializer rendering the same rows as serializer_class
+    projection_class = None
+
     def get_queryset(self):
-        non_filter_params = set(['limit', 'offset', 'page', 'page_size', 'format', 'no_pagination'])
+        non_filter_params = set(['limit', 'offset', 'page', 'page_size', 'format', 'no_pagination', 'cursor', 'fields', 'expand'])
 
         qs = super(RestrictedQueryMixin, self).get_queryset().order_by('id')
 
@@ -142,13 +252,125 @@ class RestrictedQueryMixin(object):
 
         return qs
 
+    def streams_list(self, request):
+        """
+        Return whether a list request asks for every row with
+        "no_pagination", of a view unpaginated or paginated by
+        VariableResultsSetPagination. Other paginators return their page.
+        """
+        if 'no_pagination' not in request.query_params or request.accepted_renderer.format != 'json':
+            return False
+        return self.paginator is None or isinstance(self.paginator, VariableResultsSetPagination)
+
+    def list(self, request, *args, **kwargs):
+        if self.streams_list(request):
+            return self.conditional_response(self.stream_list, request)
+        return super(RestrictedQueryMixin, self).list(request, *args, **kwargs)
+
+    def get_projection_class(self):
+        """Return projection_class if it can render the current request."""
+        if self.action not in ('list', 'query'):
+            return None
+        if 'fields' in self.request.query_params or 'expand' in self.request.query_params:
+            return None
+        return self.projection_class
+
+    def get_serializer(self, *args, **kwargs):
+        projection_class = self.get_projection_class()
+        if projection_class is not None and kwargs.get('many'):
+            kwargs['context'] = self.get_serializer_context()
+            return projection_class(*args, **kwargs)
+        return super(RestrictedQueryMixin, self).get_serializer(*args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        projection_class = self.get_projection_class()
+        if projection_class is not None:
+            queryset = projection_class.get_queryset(queryset)
+        return super(RestrictedQueryMixin, self).paginate_queryset(queryset)
+
+    def iterate_batches(self, queryset):
+        """Yield lists of objects, fetching one id ordered batch at a time.
+
+        Slicing by id rather than using queryset.iterator() keeps any
+        prefetch_related lookups working for every batch. values() rows
+        are batched the same way.
+        """
+        last_id = None
+        while True:
+            batch = queryset if last_id is None else queryset.filter(id__gt=last_id)
+            batch = list(batch.order_by('id')[:self.stream_batch_size])
+            if not batch:
+                return
+            yield batch
+            last = batch[-1]
+            last_id = last['id'] if isinstance(last, dict) else last.id
+
+    def iterate_serialized(self, queryset):
+        projection_class = self.get_projection_class()
+        if projection_class is not None:
+            queryset = projection_class.get_queryset(queryset)
+        for batch in self.iterate_batches(queryset):
+            for item in self.get_serializer(batch, many=True).data:
+                yield item
+
+    @action(detail=False, methods=['post'])
+    def query(self, request, *args, **kwargs):
+        """Stream the rows matching a list of ids or natural keys."""
+        data = request.data
+        if isinstance(data, list):
+            data = {'id': data}
+        if not isinstance(data, dict) or len(data) != 1:
+            raise rest_framework.exceptions.ParseError(
+                'Expected an object with one of %s' % ', '.join(('id',) + tuple(self.query_keys)))
+
+        (key, values), = data.items()
+        if key != 'id' and key not in self.query_keys:
+            raise rest_framework.exceptions.ParseError('no query key %s' % key)
+        if not isinstance(values, list) or not all(isinstance(v, (int, str)) for v in values):
+            raise rest_framework.exceptions.ParseError('Expected a list of values for %s' % key)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.stream_list(request, queryset.filter(self.get_query_filter(key, values)))
+
+    def get_query_filter(self, key, values):
+        """Return a Q matching the rows whose key is any of values."""
+        if key == 'id':
+            try:
+                values = [int(value) for value in values]
+            except ValueError:
+                raise rest_framework.exceptions.ParseError('ids must be integers')
+        return Q(**{key + '__in': values})
+
+    def stream_list(self, request, queryset=None):
+        if queryset is None:
+            queryset = self.filter_queryset(self.get_queryset())
+
+        if request.query_params.get('no_pagination') == 'ndjson':
+            content = (dumps_json(item) + '\n' for item in self.iterate_serialized(queryset))
+            return StreamingHttpResponse(content, content_type='application/x-ndjson')
+
+        # Keep the same document shape the paginated and unpaginated views
+        # already return for no_pagination
+        if self.paginator is not None:
+            content = self.stream_json_array(queryset, prefix='{"count":%d,"results":' % queryset.count(), suffix='}')
+        else:
+            content = self.stream_json_array(queryset)
+        return StreamingHttpResponse(content, content_type='application/json')
+
+    def stream_json_array(self, queryset, prefix='', suffix=''):
+        yield prefix + '['
+        separator = ''
+        for item in self.iterate_serialized(queryset):
+            yield separator + dumps_json(item)
+            separator = ','
+        yield ']' + suffix
+
 
 class ProjectViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
     """
     View for Sample that is queryable by sample_ID.
     Try adding "?sample_id=SA928" without the quotes to the end of the url.
     """
-
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = (IsAuthenticated, )
@@ -157,6 +379,7 @@ class ProjectViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
         'id',
         'name',
     )
+    query_keys = ('name',)
 
 
 class SampleViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
@@ -164,15 +387,15 @@ class SampleViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
     View for Sample that is queryable by sample_ID.
     Try adding "?sample_id=SA928" without the quotes to the end of the url.
     """
-
     queryset = Sample.objects.all()
     serializer_class = SampleSerializer
     permission_classes = (IsAuthenticated, )
     pagination_class = VariableResultsSetPagination
     filter_class = SampleFilter
+    query_keys = ('sample_id',)
 
 
-class LaneViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+class LaneViewSet(RestrictedQueryMixin, BulkWriteMixin, viewsets.ModelViewSet):
     """
     View for Lanes.
 
@@ -192,6 +415,7 @@ class LaneViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
         'sequencing',
         'sequencing__library__pool_id',
     )
+    query_keys = ('flow_cell_id',)
 
 
 class SequencingViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
@@ -216,6 +440,7 @@ class SequencingViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
         'sequencing_center',
         'external_gsc_id',
     )
+    query_keys = ('gsc_library_id',)
 
 
 class LibraryViewSet(RestrictedQueryMixin, viewsets.ReadOnlyModelViewSet):
@@ -235,30 +460,89 @@ class LibraryViewSet(RestrictedQueryMixin, viewsets.ReadOnlyModelViewSet):
         'normal_sample_id',
         'normal_sample_library_id',
     )
+    query_keys = ('pool_id', 'jira_ticket')
 
 
-class SublibraryViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+class CellIdQueryMixin(object):
+    """
+    Look sublibraries up by their stored cell ids through query/ and
+    resolve/, and keep the cell ids of bulk written sublibraries up to date.
+    """
+    query_keys = ('cell_id',)
+
+    @action(detail=False, methods=['post'])
+    def resolve(self, request, *args, **kwargs):
+        """
+        Resolve a list of cell ids to their sublibraries, each with the
+        metadata of its chip region, in the order they were given. Every
+        sublibrary of a cell id is returned, as a reused chip id gives the
+        same id to several.
+        Returns {"results": [...], "missing": [cell ids not found]}.
+        """
+        cell_ids = request.data.get('cell_id') if isinstance(request.data, dict) else request.data
+        if not isinstance(cell_ids, list) or not all(isinstance(cell_id, str) for cell_id in cell_ids):
+            raise rest_framework.exceptions.ParseError('Expected a list of cell ids')
+        cell_ids = list(OrderedDict.fromkeys(cell_ids))
+
+        queryset = self.filter_queryset(self.get_queryset()).filter(cell_id__in=cell_ids).order_by('id')
+        rows = SublibraryInformationProjectionBrief(SublibraryInformationProjectionBrief.get_queryset(queryset)).data
+        region_metadata = get_chip_region_metadata(row['chip_region'] for row in rows if row['chip_region'])
+
+        found = {}
+        for row in rows:
+            row['metadata'] = region_metadata.get(row['chip_region'])
+            found.setdefault(row['cell_id'], []).append(row)
+        return Response({
+            'results': [row for cell_id in cell_ids for row in found.get(cell_id, [])],
+            'missing': [cell_id for cell_id in cell_ids if cell_id not in found],
+        })
+
+    def prepare_bulk_write(self, objs):
+        sample_ids = dict(Sample.objects.filter(
+            pk__in=set(obj.sample_id_id for obj in objs)).values_list('pk', 'sample_id'))
+        pool_ids = dict(DlpLibrary.objects.filter(
+            pk__in=set(obj.library_id for obj in objs)).values_list('pk', 'pool_id'))
+        for obj in objs:
+            obj.cell_id = None
+            if obj.sample_id_id is not None:
+                obj.cell_id = format_cell_id(
+                    sample_ids[obj.sample_id_id], pool_ids[obj.library_id], obj.row, obj.column)
+        return ['cell_id']
+
+
+class SublibraryViewSet(CellIdQueryMixin, RestrictedQueryMixin, ColumnarListMixin, BulkWriteMixin, viewsets.ModelViewSet):
     """
     View for Library's Sublibraries that is queryable by Library's pool_id (aka chip id)
+
+    Add "?format=arrow" or "?format=parquet" to get every matching cell as
+    one Arrow stream or Parquet file.
     """
     queryset = SublibraryInformation.objects.all()
     serializer_class = SublibraryInformationSerializer
+    bulk_serializer_class = SublibraryInformationSerializerBrief
     permission_classes = (IsAuthenticated, )
     pagination_class = VariableResultsSetPagination
     filter_class = SublibraryInformationFilter
+    columnar_fields = [
+        'cell_id',
+        'sample_id__sample_id',
+        'library__pool_id',
+        'chip_region__region_code',
+    ] + [field.name for field in SublibraryInformation._meta.concrete_fields if field.name != 'cell_id']
 
 
-class LargeResultsSetPagination(pagination.PageNumberPagination):
+class LargeResultsSetPagination(KeysetPaginationMixin, pagination.PageNumberPagination):
     page_size = 1000
     page_size_query_param = 'page_size'
 
 
-class SublibraryViewSetBrief(RestrictedQueryMixin, viewsets.ModelViewSet):
+class SublibraryViewSetBrief(CellIdQueryMixin, RestrictedQueryMixin, ColumnarListMixin, BulkWriteMixin, viewsets.ModelViewSet):
     """
     View for Library's Sublibraries that is queryable by Library's pool_id (aka chip id)
     """
     queryset = SublibraryInformation.objects.all()
     serializer_class = SublibraryInformationSerializerBrief
+    projection_class = SublibraryInformationProjectionBrief
     permission_classes = (IsAuthenticated, )
     pagination_class = LargeResultsSetPagination
     filter_fields = (
@@ -276,6 +560,7 @@ class AnalysisInformationViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated, )
     pagination_class = VariableResultsSetPagination
     filter_class = AnalysisInformationFilter
+    query_keys = ('analysis_jira_ticket',)
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -285,7 +570,7 @@ class AnalysisInformationViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
         return AnalysisInformationSerializer
 
 
-class AnalysisRunViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+class AnalysisRunViewSet(RestrictedQueryMixin, BulkWriteMixin, viewsets.ModelViewSet):
     """
     View for AnalaysisRun Objects
     Should be be AllowAll so that Sisyphus can modify it
@@ -325,6 +610,7 @@ class JiraUserViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
     serializer_class = JiraUserSerializer
     permission_classes = (IsAuthenticated, )
     pagination_class = VariableResultsSetPagination
+    query_keys = ('username',)
 
 
 class TenxLibraryViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
@@ -341,6 +627,7 @@ class TenxLibraryViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
         'chips',
         'sample__sample_id',
     )
+    query_keys = ('name', 'gsc_library_id', 'jira_ticket')
 
 
 class TenxAnalysisViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
@@ -349,6 +636,7 @@ class TenxAnalysisViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
     serializer_class = TenxAnalysisSerializer
     pagination_class = VariableResultsSetPagination
     filter_class = TenxAnalysisFilter
+    query_keys = ('jira_ticket',)
 
 
 class TenxSequencingViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
@@ -363,9 +651,10 @@ class TenxSequencingViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
         'sequencing_center',
         'gsc_library_id',
     )
+    query_keys = ('gsc_library_id',)
 
 
-class TenxLaneViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
+class TenxLaneViewSet(RestrictedQueryMixin, BulkWriteMixin, viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated, )
     queryset = TenxLane.objects.all()
     serializer_class = TenxLaneSerializer
@@ -375,6 +664,7 @@ class TenxLaneViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
         'flow_cell_id',
         'sequencing',
     )
+    query_keys = ('flow_cell_id',)
 
 
 class TenxChipViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
@@ -400,6 +690,7 @@ class TenxPoolViewSet(RestrictedQueryMixin, viewsets.ModelViewSet):
         'gsc_pool_name',
         'construction_location',
     )
+    query_keys = ('pool_name', 'gsc_pool_name')
 
 
 def dlp_sequencing_get_samplesheet(request, pk):
@@ -441,23 +732,111 @@ def pool_name_to_id_redirect(request, pool_name):
     return redirect('api:tenx_pool_sample_sheet', pk=pk)
 
 
+def parse_timestamp(value):
+    """Parse an ISO 8601 datetime or date, in local time if no offset is given."""
+    # An unescaped "+" in a query string arrives as a space
+    value = value.replace(' ', '+')
+    try:
+        timestamp = parse_datetime(value)
+        if timestamp is None:
+            date = parse_date(value)
+            if date is not None:
+                timestamp = datetime.datetime.combine(date, datetime.time())
+    except ValueError:
+        timestamp = None
+    if timestamp is None:
+        raise rest_framework.exceptions.ParseError('invalid timestamp %s' % value)
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+class ChangeFeed(APIView):
+    """
+    Ids of the objects created, updated and deleted since a cursor, read
+    from the history tables, so that mirrors can sync just the delta.
+
+    Leave "cursor" out to start from the first change, or pass an ISO 8601
+    timestamp as "since" to start from the changes written at or after it,
+    then pass the "cursor" of each response to the next request. Each response reads at
+    most "page_size" history rows, 1000 by default, and has "more" set
+    while there are more to read. "models" restricts the feed to a comma
+    separated list of model labels, e.g. "?models=dlp.dlplibrary,dlp.dlpsequencing".
+    Only models that keep history are covered.
+
+    Changes committed late, by long transactions or bulk imports, are
+    reported by a later request, see api.changes.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    page_size = 1000
+    max_page_size = 10000
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if since and request.query_params.get('cursor'):
+            raise rest_framework.exceptions.ParseError('pass since or cursor, not both')
+        since = parse_timestamp(since) if since else None
+        try:
+            positions = decode_cursor(request.query_params.get('cursor', ''))
+        except ValueError as e:
+            raise rest_framework.exceptions.ParseError(str(e))
+        try:
+            page_size = int(request.query_params.get('page_size', self.page_size))
+        except ValueError:
+            page_size = 0
+        if not 0 < page_size <= self.max_page_size:
+            raise rest_framework.exceptions.ParseError('page_size must be from 1 to %d' % self.max_page_size)
+
+        models = get_history_models()
+        labels = request.query_params.get('models')
+        if labels:
+            labels = [label for label in labels.lower().split(',') if label]
+            for label in labels:
+                if label not in models:
+                    raise rest_framework.exceptions.ParseError('no model %s' % label)
+            models = OrderedDict((label, models[label]) for label in sorted(labels))
+
+        if since is not None:
+            positions = start_positions(models, since)
+        changes, positions, more = get_changes(models, positions, page_size)
+        return Response(OrderedDict([
+            ('cursor', encode_cursor(positions)),
+            ('more', more),
+            ('changes', changes),
+        ]))
+
+
 #============================
 # KUDU API
 #----------------------------
 def kudu_search(request, query):
+    """
+    The best matches of query of each group, or of "group" only, after the
+    first "start". "counts" has the number of matches of each group, and
+    "next" the URL of the following matches of those with more.
+    """
     result_dict = {}
-    query_dict = return_text_search(query)
+    query_dict = return_text_search(query, start=get_start(request.GET), group=request.GET.get('group'))
     result_dict['query'] = query_dict.pop('query')
     result_dict['total'] = query_dict.pop('total')
+    result_dict['counts'] = {}
+    result_dict['next'] = {}
     for app in query_dict:
         result_dict[app] = {}
-        for model in query_dict[app]:
-            result_dict[app][model] = [m.id for m in query_dict[app][model]]
+        result_dict['counts'][app] = {}
+        for model, matches in query_dict[app].items():
+            result_dict[app][model] = [m.object_id for m in matches]
+            result_dict['counts'][app][model] = matches.total
+            if matches.more:
+                url = replace_query_param(request.build_absolute_uri(), 'group', '%s.%s' % (app, model))
+                result_dict['next'].setdefault(app, {})[model] = replace_query_param(url, 'start', matches.end)
 
     return HttpResponse(json.dumps(result_dict))
 
 
-class KuduList(RestrictedQueryMixin, viewsets.ModelViewSet):
+class KuduList(RestrictedQueryMixin, CachedListMixin, viewsets.ModelViewSet):
+    """Unpaginated lists for Kudu, cached until the models they read change."""
     permission_classes = (IsAuthenticated, )
     pagination_class = None
 
@@ -466,31 +845,39 @@ class KuduList(RestrictedQueryMixin, viewsets.ModelViewSet):
 class KuduProjectList(KuduList):
     queryset = Project.objects.all()
     serializer_class = KuduProjectSerializer
+    projection_class = KuduProjectProjection
     filter_class = get_filter_model(Project)
+    query_keys = ('name',)
 
 
 class KuduSampleList(KuduList):
     queryset = Sample.objects.all()
     serializer_class = KuduSampleSerializer
+    projection_class = KuduSampleProjection
     filter_class = get_filter_model(Sample)
+    query_keys = ('sample_id',)
 
 
 #DLP
 class KuduDLPLibraryList(KuduList):
     queryset = DlpLibrary.objects.all()
     serializer_class = KuduDLPLibraryListSerializer
+    projection_class = KuduDLPLibraryListProjection
     filter_class = get_filter_model(DlpLibrary)
+    query_keys = ('pool_id',)
 
 
 class KuduDLPSequencingList(KuduList):
     queryset = DlpSequencing.objects.all()
     serializer_class = KuduDLPSequencingSerializer
+    projection_class = KuduDLPSequencingProjection
     filter_class = get_filter_model(DlpSequencing)
 
 
 class KuduDLPAnalysisList(KuduList):
     queryset = DlpAnalysisInformation.objects.all()
     serializer_class = KuduDLPAnalysisSerializer
+    projection_class = KuduDLPAnalysisProjection
     filter_class = get_filter_model(DlpAnalysisInformation)
 
 
@@ -498,28 +885,85 @@ class KuduDLPAnalysisList(KuduList):
 class KuduTenxLibraryList(KuduList):
     queryset = TenxLibrary.objects.all()
     serializer_class = KuduTenxLibraryListSerializer
+    projection_class = KuduTenxLibraryListProjection
     filter_class = get_filter_model(TenxLibrary)
+    query_keys = ('name',)
 
 
 class KuduTenxChipList(KuduList):
     queryset = TenxChip.objects.all()
     serializer_class = KuduTenxChipSerializer
+    projection_class = KuduTenxChipProjection
     filter_class = get_filter_model(TenxChip)
 
 
 class KuduTenxPoolList(KuduList):
     queryset = TenxPool.objects.all()
     serializer_class = KuduTenxPoolSerializer
+    projection_class = KuduTenxPoolProjection
     filter_class = get_filter_model(TenxPool)
 
 
 class KuduTenxSequencingList(KuduList):
     queryset = TenxSequencing.objects.all()
     serializer_class = KuduTenxSequencingSerializer
+    projection_class = KuduTenxSequencingProjection
     filter_class = get_filter_model(TenxSequencing)
 
 
 class KuduTenxAnalysisList(KuduList):
     queryset = TenxAnalysis.objects.all()
     serializer_class = KuduTenxAnalysisSerializer
+    projection_class = KuduTenxAnalysisProjection
     filter_class = get_filter_model(TenxAnalysis)
+
+
+class StatsView(APIView):
+    """
+    Aggregate statistics computed in the database, see core.stats.
+
+    "/api/stats/" returns every statistic in one response, or those named in
+    "?names=totals,analysis_status"; "/api/stats/<name>/" returns one.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request, name=None):
+        if name is not None:
+            names = [name]
+        elif request.query_params.get('names'):
+            names = [n for n in request.query_params['names'].split(',') if n]
+        else:
+            names = list(STATS)
+        for n in names:
+            if n not in STATS:
+                raise rest_framework.exceptions.NotFound('no statistic %s' % n)
+
+        results, version = get_stats(names)
+        etag = quote_etag(version)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(results[name] if name is not None else results)
+        response['ETag'] = etag
+        return response
+
+
+class GraphView(APIView):
+    """
+    Nested rows of several related models in one response, see api.graph.
+
+    POST the query as JSON, or GET it as "?query=<json>" to get an ETag
+    and 304 Not Modified for repeated queries.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request):
+        try:
+            query = json.loads(request.query_params.get('query', ''), object_pairs_hook=OrderedDict)
+        except ValueError:
+            raise rest_framework.exceptions.ParseError('query must be a JSON object')
+        roots = parse_query(query)
+        return conditional_response(
+            compute_validators(request, get_models(roots)), lambda request: Response(run_query(roots)), request)
+
+    def post(self, request):
+        return Response(run_query(parse_query(request.data)))
@@ -0,0 +1,273 @@
+"""
+Per-request timing: database query count and time, serializer time and
+template render time are reported in a Server-Timing header and a JSON log
+line on the "colossus.timing" logger, and request durations are kept in
+rolling per-view latency histograms (see latency_report).
+
+Work done while a streaming response is being consumed happens after the
+response has left the middleware and is not included.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.http import JsonResponse
+from django.template.base import Template
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.serializers import BaseSerializer
+
+
+logger = logging.getLogger('colossus.timing')
+
+_state = threading.local()
+
+
+def get_current_timings():
+    """Return the RequestTimings of the request being handled, if any."""
+    return getattr(_state, 'timings', None)
+
+
+class RequestTimings(object):
+    """Durations in seconds, by name, measured while handling one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = defaultdict(float)
+        self.depth = defaultdict(int)
+        self.queries = 0
+
+    @contextmanager
+    def measure(self, name):
+        # Only the outermost of nested measurements counts, so a template
+        # including another or a serializer rendering another is not
+        # counted twice
+        self.depth[name] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.depth[name] -= 1
+            if not self.depth[name]:
+                self.durations[name] += time.perf_counter() - start
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.start
+
+
+@contextmanager
+def measure(name):
+    timings = get_current_timings()
+    if timings is None:
+        yield
+    else:
+        with timings.measure(name):
+            yield
+
+
+class TimedCursor(object):
+    """Count and time the queries run through a database cursor."""
+
+    def __init__(self, cursor, timings):
+        self.cursor = cursor
+        self.timings = timings
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return self.cursor.__exit__(type, value, traceback)
+
+    def callproc(self, procname, params=None):
+        self.timings.queries += 1
+        with self.timings.measure('db'):
+            return self.cursor.callproc(procname, params)
+
+    def execute(self, sql, params=None):
+        self.timings.queries += 1
+        with self.timings.measure('db'):
+            return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.timings.queries += 1
+        with self.timings.measure('db'):
+            return self.cursor.executemany(sql, param_list)
+
+
+def timed_method(method, name):
+    def timed(*args, **kwargs):
+        with measure(name):
+            return method(*args, **kwargs)
+    timed.__wrapped__ = method
+    return timed
+
+
+def timed_property(prop, name):
+    return property(timed_method(prop.fget, name), prop.fset, prop.fdel, prop.__doc__)
+
+
+_installed = False
+
+
+def install_instrumentation():
+    """Wrap database cursors, serializer data and template rendering, once."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    from api.projection import ProjectionSerializer
+
+    prepare_cursor = BaseDatabaseWrapper._prepare_cursor
+
+    def _prepare_cursor(self, cursor):
+        cursor = prepare_cursor(self, cursor)
+        timings = get_current_timings()
+        return cursor if timings is None else TimedCursor(cursor, timings)
+
+    BaseDatabaseWrapper._prepare_cursor = _prepare_cursor
+    BaseSerializer.data = timed_property(BaseSerializer.data, 'serializer')
+    ProjectionSerializer.data = timed_property(ProjectionSerializer.data, 'serializer')
+    Template.render = timed_method(Template.render, 'template')
+
+
+# Upper bounds, in milliseconds, of the latency histogram buckets; the last
+# bucket counts everything slower
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram(object):
+    """Request durations bucketed by LATENCY_BUCKETS over a rolling period.
+
+    Counts are kept per window of window_seconds, and only the last
+    window_count windows are kept.
+    """
+
+    def __init__(self, window_seconds=60, window_count=15):
+        self.window_seconds = window_seconds
+        self.window_count = window_count
+        self.windows = deque()
+
+    def expire(self, now):
+        oldest = now - self.window_seconds * self.window_count
+        while self.windows and self.windows[0][0] <= oldest:
+            self.windows.popleft()
+
+    def observe(self, milliseconds, now=None):
+        now = time.time() if now is None else now
+        self.expire(now)
+        window_start = now - now % self.window_seconds
+        if not self.windows or self.windows[-1][0] != window_start:
+            self.windows.append((window_start, [0] * (len(LATENCY_BUCKETS) + 1)))
+        self.windows[-1][1][bisect.bisect_left(LATENCY_BUCKETS, milliseconds)] += 1
+
+    def get_counts(self, now=None):
+        self.expire(time.time() if now is None else now)
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for _, window in self.windows:
+            counts = [a + b for a, b in zip(counts, window)]
+        return counts
+
+    def get_percentile(self, counts, percentile):
+        """Return the upper bound of the bucket holding the percentile, None if unbounded."""
+        rank = sum(counts) * percentile / 100.0
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (None,), counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+    def summary(self, now=None):
+        counts = self.get_counts(now)
+        return {
+            'count': sum(counts),
+            'buckets': dict(
+                ('le_%s' % bound if bound is not None else 'inf', count)
+                for bound, count in zip(LATENCY_BUCKETS + (None,), counts)
+            ),
+            'p50': self.get_percentile(counts, 50),
+            'p95': self.get_percentile(counts, 95),
+            'p99': self.get_percentile(counts, 99),
+        }
+
+
+latency_histograms = defaultdict(LatencyHistogram)
+latency_lock = threading.Lock()
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return match.view_name or match._func_path
+
+
+class ServerTimingMiddleware(MiddlewareMixin):
+    """Time each request and report it in Server-Timing and the timing log."""
+
+    def __init__(self, get_response=None):
+        install_instrumentation()
+        super(ServerTimingMiddleware, self).__init__(get_response)
+
+    def process_request(self, request):
+        _state.timings = RequestTimings()
+
+    def process_response(self, request, response):
+        timings = get_current_timings()
+        if timings is None:
+            return response
+        _state.timings = None
+
+        total = timings.total * 1000
+        db = timings.durations['db'] * 1000
+        serializer = timings.durations['serializer'] * 1000
+        template = timings.durations['template'] * 1000
+
+        response['Server-Timing'] = ', '.join([
+            'db;dur=%.1f;desc="%d queries"' % (db, timings.queries),
+            'serializer;dur=%.1f' % serializer,
+            'template;dur=%.1f' % template,
+            'total;dur=%.1f' % total,
+        ])
+
+        view_name = get_view_name(request)
+        if view_name is not None:
+            with latency_lock:
+                latency_histograms[view_name].observe(total)
+
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'total_ms': round(total, 1),
+            'db_ms': round(db, 1),
+            'db_queries': timings.queries,
+            'serializer_ms': round(serializer, 1),
+            'template_ms': round(template, 1),
+        }))
+        return response
+
+
+@staff_member_required
+def latency_report(request):
+    """Return the rolling latency histogram of every view, in milliseconds."""
+    with latency_lock:
+        report = dict(
+            (view_name, histogram.summary())
+            for view_name, histogram in latency_histograms.items()
+        )
+    return JsonResponse(report)
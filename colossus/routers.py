@@ -0,0 +1,130 @@
+"""
+Sends the reads of safe requests to the API, exports and reports to the
+"replica" database, when one is configured, and every other query to
+"default".
+
+The DatabaseCache table is always read from "default", so the caches kept
+in it (see api.cache and core.stats) see the entries just written and
+deleted rather than those the replica has caught up with.
+
+A client that has just written reads from "default" for the next
+REPLICA_PIN_SECONDS, so it sees its own writes despite replication lag.
+Clients are told apart by their Authorization header, their session's
+user, or failing both a cookie.
+
+To try it locally, set COLOSSUS_POSTGRESQL_REPLICA_HOST (and _PORT, _NAME)
+to a streaming standby of the database, or to a second instance restored
+from a dump of it.
+"""
+import hashlib
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.deprecation import MiddlewareMixin
+
+
+REPLICA_DB_ALIAS = 'replica'
+
+PIN_COOKIE = 'colossus_pinned'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# The app label DatabaseCache gives the model of its table
+CACHE_APP_LABEL = 'django_cache'
+
+_state = threading.local()
+
+
+def use_replica(value):
+    _state.replica = value
+
+
+def reading_from_replica():
+    return getattr(_state, 'replica', False) and REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def reset_replica(**kwargs):
+    use_replica(False)
+
+
+# Streamed responses are read after the middleware has returned, so reads
+# go back to "default" only once the response has been sent
+request_finished.connect(reset_replica, dispatch_uid='reset_replica')
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS if reading_from_replica() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is migrated by replication
+        return db == DEFAULT_DB_ALIAS
+
+
+def get_pin_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        return 'replica:pinned:%s' % hashlib.md5(authorization.encode('utf-8')).hexdigest()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return 'replica:pinned:user:%d' % user.pk
+    return None
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    """
+    Route the reads of safe requests to REPLICA_READ_PATHS to the replica,
+    except those to REPLICA_EXCLUDE_PATHS. POSTs to REPLICA_QUERY_PATHS only
+    read, so are routed the same way.
+    """
+
+    def __init__(self, get_response=None):
+        self.read_paths = [re.compile(pattern) for pattern in settings.REPLICA_READ_PATHS]
+        self.query_paths = [re.compile(pattern) for pattern in settings.REPLICA_QUERY_PATHS]
+        self.exclude_paths = [re.compile(pattern) for pattern in settings.REPLICA_EXCLUDE_PATHS]
+        super(ReplicaMiddleware, self).__init__(get_response)
+
+    def is_read(self, request):
+        """Return whether request only reads, whatever its method."""
+        if request.method in SAFE_METHODS:
+            return True
+        return request.method == 'POST' and any(pattern.match(request.path_info) for pattern in self.query_paths)
+
+    def is_pinned(self, request):
+        if PIN_COOKIE in request.COOKIES:
+            return True
+        key = get_pin_key(request)
+        return key is not None and cache.get(key) is not None
+
+    def process_request(self, request):
+        use_replica(
+            REPLICA_DB_ALIAS in settings.DATABASES
+            and self.is_read(request)
+            and any(pattern.match(request.path_info) for pattern in self.read_paths)
+            and not any(pattern.match(request.path_info) for pattern in self.exclude_paths)
+            and not self.is_pinned(request)
+        )
+
+    def process_response(self, request, response):
+        # Rejected and failed requests wrote nothing to wait for
+        if (not self.is_read(request) and response.status_code < 400
+                and REPLICA_DB_ALIAS in settings.DATABASES):
+            seconds = settings.REPLICA_PIN_SECONDS
+            key = get_pin_key(request)
+            if key is not None:
+                cache.set(key, True, seconds)
+            response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True)
+        return response
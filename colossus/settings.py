@@ -66,6 +66,7 @@ INSTALLED_APPS = [
 CRISPY_TEMPLATE_PACK = 'bootstrap3'
 
 MIDDLEWARE_CLASSES = [
+    'colossus.middleware.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -73,6 +74,7 @@ MIDDLEWARE_CLASSES = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'colossus.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
@@ -81,6 +83,28 @@ MIDDLEWARE_CLASSES = [
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^.*$'
 
+# One JSON line per request from colossus.middleware.ServerTimingMiddleware
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'timing': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'colossus.timing': {
+            'handlers': ['timing'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 
 ROOT_URLCONF = 'colossus.urls'
 
@@ -116,6 +140,63 @@ DATABASES = {
     }
 }
 
+# Optional read replica, e.g. a streaming standby of the database above.
+# Safe requests to REPLICA_READ_PATHS read from it, unless the same client
+# wrote in the last REPLICA_PIN_SECONDS (see colossus.routers).
+if os.environ.get('COLOSSUS_POSTGRESQL_REPLICA_HOST'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=os.environ.get('COLOSSUS_POSTGRESQL_REPLICA_NAME', DATABASES['default']['NAME']),
+        HOST=os.environ.get('COLOSSUS_POSTGRESQL_REPLICA_HOST'),
+        PORT=os.environ.get('COLOSSUS_POSTGRESQL_REPLICA_PORT', '5432'),
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['colossus.routers.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = 15
+
+REPLICA_READ_PATHS = [
+    r'^/api/',
+    r'^/core/project/export',
+    r'^/dlp/library/\d+/export',
+    r'^/dlp/summary',
+]
+
+REPLICA_QUERY_PATHS = [
+    r'^/api/graph/$',
+    r'^/api/\w+/query/$',
+    r'^/api/\w+/resolve/$',
+]
+
+# Always read from "default": the change feed's cursor must only move past
+# history rows that have committed on the primary
+REPLICA_EXCLUDE_PATHS = [
+    r'^/api/changes/',
+]
+
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# Create the table with "python manage.py createcachetable"
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'colossus_cache',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    }
+}
+
+# Search pages kept by each process, for how long, and how long a search
+# waits for the same search running in another thread (see
+# core.search_util.search_cache)
+SEARCH_CACHE_MAX_ENTRIES = 500
+SEARCH_CACHE_TIMEOUT = 60 * 10
+SEARCH_CACHE_WAIT = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
@@ -0,0 +1,36 @@
+"""
+Settings for running the test suite:
+
+    python3 manage.py test --settings=colossus.settings_test
+
+The test database is created straight from the models, files are stored
+locally and responses are cached in memory.
+"""
+from colossus.settings import *
+
+
+class DisableMigrations(object):
+    def __contains__(self, item):
+        return True
+
+    def __getitem__(self, item):
+        return None
+
+
+MIGRATION_MODULES = DisableMigrations()
+
+DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+LOGGING['loggers']['colossus.timing']['level'] = 'WARNING'
+
+# Tests run inside transactions that a second connection would not see
+DATABASES.pop('replica', None)
@@ -0,0 +1,191 @@
+"""
+Tests of the routing of reads to the replica database (see
+colossus.routers), checked without a second database as the middleware
+and router only look for "replica" in the settings, and of the request
+timings (see colossus.middleware).
+"""
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from colossus.middleware import LatencyHistogram, latency_histograms
+from colossus.routers import PIN_COOKIE, ReplicaMiddleware, ReplicaRouter, reset_replica
+from core import stats
+from core.models import Sample
+
+
+REPLICA_DATABASES = dict(settings.DATABASES, replica=settings.DATABASES['default'])
+
+
+@override_settings(DATABASES=REPLICA_DATABASES)
+class ReplicaRoutingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'reader')
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = ReplicaMiddleware()
+        self.router = ReplicaRouter()
+        cache.clear()
+        self.addCleanup(reset_replica)
+
+    def route(self, method, path, user=None, cookies=None, status=200):
+        """Return the database the reads of a request go to, and its response."""
+        request = getattr(self.factory, method)(path)
+        request.user = user or AnonymousUser()
+        request.COOKIES.update(cookies or {})
+        self.middleware.process_request(request)
+        database = self.router.db_for_read(Sample)
+        response = self.middleware.process_response(request, HttpResponse(status=status))
+        reset_replica()
+        return database, response
+
+    def test_reads(self):
+        self.assertEqual(self.route('get', '/api/sample/')[0], 'replica')
+        self.assertEqual(self.route('head', '/dlp/summary')[0], 'replica')
+        self.assertEqual(self.route('post', '/api/sample/query/')[0], 'replica')
+        self.assertEqual(self.route('post', '/api/graph/')[0], 'replica')
+
+    def test_default(self):
+        self.assertEqual(self.route('get', '/core/sample/list')[0], 'default')
+        self.assertEqual(self.route('post', '/api/sample/')[0], 'default')
+        self.assertEqual(self.route('get', '/api/changes/')[0], 'default')
+        self.assertEqual(self.route('get', '/api/changes/?models=core.sample')[0], 'default')
+
+    def test_writes_pin_the_user(self):
+        _, response = self.route('post', '/api/sample/', user=self.user)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        # Without the cookie, e.g. from another client of the same user
+        self.assertEqual(self.route('get', '/api/sample/', user=self.user)[0], 'default')
+        self.assertEqual(self.route('get', '/api/sample/')[0], 'replica')
+
+        cache.clear()
+        self.assertEqual(self.route('get', '/api/sample/', user=self.user)[0], 'replica')
+
+    def test_writes_pin_anonymous_clients_by_cookie(self):
+        _, response = self.route('post', '/api/sample/')
+        cookies = {PIN_COOKIE: response.cookies[PIN_COOKIE].value}
+        self.assertEqual(self.route('get', '/api/sample/', cookies=cookies)[0], 'default')
+
+    def test_failed_writes_do_not_pin(self):
+        for status in (400, 403, 405, 500):
+            _, response = self.route('post', '/api/sample/', user=self.user, status=status)
+            self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.route('get', '/api/sample/', user=self.user)[0], 'replica')
+
+    def test_reads_do_not_pin(self):
+        _, response = self.route('get', '/api/sample/', user=self.user)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        _, response = self.route('post', '/api/sample/query/', user=self.user)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.route('get', '/api/sample/', user=self.user)[0], 'replica')
+
+    def totals_database(self, method, path):
+        """Return the database get_totals() reads from during a request."""
+        self.middleware.process_request(getattr(self.factory, method)(path))
+        try:
+            with mock.patch.object(stats, 'connections') as connections:
+                cursor = connections.__getitem__.return_value.cursor.return_value.__enter__.return_value
+                cursor.fetchone.return_value = (0,) * len(stats.TOTALS)
+                stats.get_totals()
+        finally:
+            reset_replica()
+        [(database,), _] = connections.__getitem__.call_args
+        return database
+
+    def test_stats(self):
+        self.assertEqual(self.totals_database('get', '/api/stats/'), 'replica')
+        self.assertEqual(self.totals_database('get', '/api/stats/totals/'), 'replica')
+        self.assertEqual(self.totals_database('get', '/dlp/summary'), 'replica')
+        self.assertEqual(self.totals_database('post', '/api/sample/'), 'default')
+
+    def test_cache_reads_use_default(self):
+        cache_model = DatabaseCache('colossus_cache', {}).cache_model_class
+        self.middleware.process_request(self.factory.get('/api/sample/'))
+        self.assertEqual(self.router.db_for_read(Sample), 'replica')
+        self.assertEqual(self.router.db_for_read(cache_model), 'default')
+
+    def test_writes_and_migrations_use_default(self):
+        self.middleware.process_request(self.factory.get('/api/sample/'))
+        self.assertEqual(self.router.db_for_write(Sample), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica', 'core'))
+
+    @override_settings(DATABASES=dict((k, v) for k, v in REPLICA_DATABASES.items() if k != 'replica'))
+    def test_no_replica(self):
+        self.assertEqual(self.route('get', '/api/sample/')[0], 'default')
+        _, response = self.route('post', '/api/sample/')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class ServerTimingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('timer', 'timer@example.com', 'timer')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def get_timings(self, response):
+        """Return {name: (milliseconds, description)} from the Server-Timing header."""
+        timings = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, duration, *description = metric.split(';')
+            timings[name] = (float(duration[len('dur='):]), description[0][len('desc='):] if description else None)
+        return timings
+
+    def test_header(self):
+        Sample.objects.create(sample_id='SYNTIMED', sample_type='P')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/sample/', HTTP_ACCEPT='application/json')
+        timings = self.get_timings(response)
+        self.assertEqual(set(timings), {'db', 'serializer', 'template', 'total'})
+        self.assertEqual(timings['db'][1], '"%d queries"' % len(context.captured_queries))
+        self.assertGreater(timings['serializer'][0], 0)
+        self.assertEqual(timings['template'][0], 0)
+        self.assertLessEqual(timings['db'][0] + timings['serializer'][0], timings['total'][0])
+
+        self.assertGreater(self.get_timings(self.client.get('/core/sample/list'))['template'][0], 0)
+
+    def test_timing_log(self):
+        with self.assertLogs('colossus.timing', 'INFO') as logs:
+            self.client.get('/api/sample/', HTTP_ACCEPT='application/json')
+        [line] = logs.records
+        record = json.loads(line.getMessage())
+        self.assertEqual((record['path'], record['status'], record['view']), ('/api/sample/', 200, 'api:sample-list'))
+
+    def test_latency_report(self):
+        latency_histograms.clear()
+        for _ in range(3):
+            self.client.get('/api/sample/', HTTP_ACCEPT='application/json')
+        report = json.loads(self.client.get('/timings/').content.decode('utf-8'))
+        self.assertEqual(report['api:sample-list']['count'], 3)
+
+        self.client.logout()
+        self.assertEqual(self.client.get('/timings/').status_code, 302)
+
+    def test_histogram(self):
+        histogram = LatencyHistogram(window_seconds=60, window_count=2)
+        for milliseconds in [1] * 90 + [30] * 9 + [20000]:
+            histogram.observe(milliseconds, now=1000)
+        summary = histogram.summary(now=1000)
+        self.assertEqual((summary['count'], summary['p50'], summary['p95'], summary['p99']), (100, 5, 50, 50))
+        self.assertEqual(summary['buckets']['inf'], 1)
+        # Windows older than window_count windows are dropped
+        histogram.observe(1, now=1030)
+        self.assertEqual(histogram.summary(now=1030)['count'], 101)
+        self.assertEqual(histogram.summary(now=1100)['count'], 1)
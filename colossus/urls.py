@@ -26,6 +26,7 @@ from django.conf.urls import url, include, static
 from django.contrib import admin
 from django.views.generic import TemplateView
 
+from colossus.middleware import latency_report
 from core import views
 
 urlpatterns = [
@@ -39,6 +40,7 @@ urlpatterns = [
     url(r'^account/', include('account.urls')),
     url(r'^api/', include('api.urls')),
     url(r'^sisyphus/', include('sisyphus.urls')),
+    url(r'^timings/$', latency_report, name='timings'),
     url(r'^userguide', TemplateView.as_view(template_name="core/vue/userguide.html"), name='userguide'),
 ]
 
@@ -9,7 +9,21 @@ Updated Oct 19, 2017 by Spencer Vatrt-Watts (github.com/Spenca)
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import pre_migrate
+
+
+def create_extensions(using, **kwargs):
+    # Databases built without migrations, such as the test database, need
+    # pg_trgm as much as those made by core.0016_searchdocument
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
 
 
 class CoreConfig(AppConfig):
-    name = 'core'
\ No newline at end of file
+    name = 'core'
+
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
+        pre_migrate.connect(create_extensions, sender=self, dispatch_uid='create_extensions')
\ No newline at end of file
@@ -0,0 +1,284 @@
+"""
+Times the hot paths of the LIMS against whatever is in the database, usually
+a data set grown with "manage.py generate_synthetic_lims". Run with
+"manage.py run_benchmarks".
+
+Each benchmark is a request made through the Django test client as a
+superuser. It is timed end to end, and the Server-Timing header (see
+colossus.middleware) splits the time into database, serializer and
+template work.
+"""
+import json
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from core.forms import GSCFormDeliveryInfo, GSCFormSubmitterInfo
+from core.models import ChipRegion, Project, Sample, SublibraryInformation
+from core.search_util.search_cache import search_cache
+from dlp.models import DlpLane, DlpLibrary, DlpSequencing
+from pbal.models import PbalLibrary
+from sisyphus.models import DlpAnalysisInformation
+from tenx.models import TenxChip, TenxLibrary, TenxPool, TenxSequencing
+
+
+# Models whose row counts are recorded with the results
+COUNTED_MODELS = (
+    Project,
+    Sample,
+    DlpLibrary,
+    DlpSequencing,
+    DlpLane,
+    DlpAnalysisInformation,
+    ChipRegion,
+    SublibraryInformation,
+    TenxLibrary,
+    TenxChip,
+    TenxPool,
+    TenxSequencing,
+    PbalLibrary,
+)
+
+LIST_PAGES = (
+    '/',
+    '/core/sample/list',
+    '/core/project/list',
+    '/dlp/library/list',
+    '/dlp/sequencing/list',
+    '/dlp/summary',
+    '/tenx/library/list',
+    '/tenx/sequencing/list',
+    '/tenx/chip/list',
+    '/tenx/pool/list',
+    '/tenx/analysis/list',
+    '/sisyphus/information/',
+    '/pbal/library/list',
+    '/pbal/sequencing/list',
+)
+
+API_LISTS = (
+    'project',
+    'sample',
+    'library',
+    'sequencing',
+    'lane',
+    'analysis_information',
+    'tenxlibrary',
+    'tenxchip',
+    'tenxsequencing',
+    'kududlplibrary_list',
+    'kudutenxlibrary_list',
+)
+
+
+class Benchmark(object):
+    """A request to time, and how to prepare for it.
+
+    prepare is called with the client before every timed request, for
+    requests that depend on earlier ones.
+    """
+
+    def __init__(self, name, path, method='get', data=None, content_type=None, prepare=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+        self.content_type = content_type
+        self.prepare = prepare
+
+    def request(self, client):
+        kwargs = {}
+        if self.content_type is not None:
+            kwargs['content_type'] = self.content_type
+        response = getattr(client, self.method)(self.path, self.data, **kwargs)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, len(content)
+
+
+def json_post(name, path, data):
+    return Benchmark(name, path, method='post', data=json.dumps(data), content_type='application/json')
+
+
+def get_form_data(*form_classes):
+    """Return POST data filling every field of the forms with a valid value."""
+    data = {}
+    for form_class in form_classes:
+        for name, field in form_class.base_fields.items():
+            value = field.initial() if callable(field.initial) else field.initial
+            if value is None and getattr(field, 'choices', None):
+                value = field.choices[0][0]
+            elif value is None and field.required:
+                value = 'benchmark@example.com' if 'email' in name else 'Benchmark'
+            if value is not None:
+                data[name] = value
+    return data
+
+
+def get_benchmarks():
+    """Return the benchmarks that the data in the database allows."""
+    benchmarks = [Benchmark('list_page %s' % path, path) for path in LIST_PAGES]
+    benchmarks += [Benchmark('api_list %s' % route, '/api/%s/' % route) for route in API_LISTS]
+    benchmarks.append(Benchmark('api_stats', '/api/stats/'))
+
+    sample = Sample.objects.order_by('id').first()
+    if sample is not None:
+        benchmarks += [
+            Benchmark('search sample', '/search/?query_str=%s' % sample.sample_id),
+            Benchmark('api_search sample', '/api/kudusearch/%s' % sample.sample_id),
+        ]
+
+    status_path = '/core/status/request'
+    benchmarks += [
+        json_post('pipeline_status %s' % status_type.lower(), status_path, {'type': status_type, 'name': None})
+        for status_type in ('INCOMPLETE', 'NO ANALYSIS', 'WETLAB')
+    ]
+    project = Project.objects.order_by('id').first()
+    if project is not None:
+        benchmarks.append(json_post(
+            'pipeline_status projects', status_path, {'type': 'PROJECTS', 'name': project.name}))
+
+    # The library with the most cells
+    library = DlpLibrary.objects.order_by('-num_sublibraries', 'id').first()
+    if library is not None:
+        benchmarks += [
+            Benchmark('detail_page dlp library', '/dlp/library/%d' % library.id),
+            Benchmark('export sublibrary_csv', '/dlp/library/%d/export' % library.id),
+            json_post('export download_sublibrary_info', '/core/download_sublibrary', {'libraryPk': library.id}),
+            Benchmark('api_list sublibraries', '/api/sublibraries/?library__pool_id=%s' % library.pool_id),
+            Benchmark(
+                'api_list sublibraries_brief no_pagination',
+                '/api/sublibraries_brief/?library__pool_id=%s&no_pagination' % library.pool_id,
+            ),
+            Benchmark(
+                'api_list sublibraries parquet',
+                '/api/sublibraries/?library__pool_id=%s&format=parquet' % library.pool_id,
+            ),
+            json_post('api_graph library', '/api/graph/', {'library': {
+                'filter': {'pool_id': library.pool_id},
+                'include': {
+                    'sequencings': {'include': {'lanes': {}}},
+                    'analyses': {'include': {'analysis_run': {}}},
+                    'chip_regions': {'include': {'metadata': {}}},
+                },
+            }}),
+        ]
+    benchmarks.append(Benchmark('export projects_csv', '/core/project/export'))
+
+    lane = DlpLane.objects.order_by('id').first()
+    if lane is not None:
+        benchmarks.append(Benchmark('samplesheet dlp', '/api/samplesheet/%d' % lane.id))
+    pool = TenxPool.objects.order_by('id').first()
+    if pool is not None:
+        benchmarks.append(Benchmark('samplesheet tenx pool', '/api/tenxpool_sheet/%d' % pool.id))
+
+    sequencing = DlpSequencing.objects.order_by('id').first()
+    if sequencing is not None:
+        form_path = '/dlp/sequencing/gsc_form/create/%d' % sequencing.id
+        form_data = get_form_data(GSCFormDeliveryInfo, GSCFormSubmitterInfo)
+        # The download reads the form data that the form view saves in the session
+        benchmarks.append(Benchmark(
+            'gsc_form dlp',
+            '/dlp/sequencing/gsc_form/download/%d' % sequencing.id,
+            prepare=lambda client: client.post(form_path, form_data),
+        ))
+
+    return benchmarks
+
+
+def parse_server_timing(header):
+    """Return {name: milliseconds} from a Server-Timing header."""
+    durations = {}
+    for metric in header.split(','):
+        parts = metric.strip().split(';')
+        for param in parts[1:]:
+            if param.startswith('dur='):
+                durations[parts[0]] = float(param[len('dur='):])
+    return durations
+
+
+def run_benchmark(client, benchmark, repeat=5, warm=False):
+    """Request the benchmark repeat times and return its timings in milliseconds.
+
+    A request that raises is reported with its error instead of timings.
+    """
+    result = {
+        'name': benchmark.name,
+        'method': benchmark.method.upper(),
+        'path': benchmark.path,
+    }
+    totals = []
+    phases = {}
+    try:
+        for _ in range(repeat):
+            if benchmark.prepare is not None:
+                benchmark.prepare(client)
+            if not warm:
+                cache.clear()
+                search_cache.clear()
+
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response, size = benchmark.request(client)
+                totals.append((time.perf_counter() - start) * 1000)
+
+            for name, duration in parse_server_timing(response.get('Server-Timing', '')).items():
+                phases.setdefault(name, []).append(duration)
+    except Exception as e:
+        result['error'] = repr(e)
+        return result
+
+    result.update({
+        'status': response.status_code,
+        'queries': len(context.captured_queries),
+        'bytes': size,
+        'min_ms': round(min(totals), 1),
+        'median_ms': round(statistics.median(totals), 1),
+        'max_ms': round(max(totals), 1),
+        'median_phase_ms': dict(
+            (name, round(statistics.median(durations), 1)) for name, durations in phases.items()
+        ),
+    })
+    return result
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_client(user):
+    # The test client's default host has to be allowed
+    host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+    client = Client(SERVER_NAME=host)
+    client.force_login(user)
+    return client
+
+
+def run_benchmarks(user, repeat=5, warm=False, names=None):
+    """Run the benchmarks whose names contain one of names, or all of them."""
+    client = get_client(user)
+    benchmarks = [
+        benchmark for benchmark in get_benchmarks()
+        if not names or any(name in benchmark.name for name in names)
+    ]
+    return {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': get_revision(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'repeat': repeat,
+        'warm_cache': warm,
+        'rows': dict((model.__name__, model.objects.count()) for model in COUNTED_MODELS),
+        'results': [run_benchmark(client, benchmark, repeat, warm) for benchmark in benchmarks],
+    }
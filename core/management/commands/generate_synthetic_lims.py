@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.synthetic import create_lims
+
+
+class Command(BaseCommand):
+    help = 'Add synthetic samples, libraries, chips, sequencings and analyses to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=int, default=10,
+            help='Number of samples to create, each with a DLP, 10x and PBAL library.',
+        )
+        parser.add_argument(
+            '--cells', type=int, default=2000,
+            help='Number of cells on each DLP chip.',
+        )
+        parser.add_argument(
+            '--sequencings', type=int, default=2,
+            help='Number of sequencings of each DLP library.',
+        )
+        parser.add_argument(
+            '--lanes', type=int, default=2,
+            help='Number of lanes of each DLP sequencing.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10,
+            help='Number of samples created per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        batch_size = options['batch_size']
+        if scale < 1 or batch_size < 1:
+            raise CommandError('--scale and --batch-size must be positive')
+
+        created = 0
+        while created < scale:
+            samples = create_lims(
+                scale=min(batch_size, scale - created),
+                cells_per_library=options['cells'],
+                sequencings_per_library=options['sequencings'],
+                lanes_per_sequencing=options['lanes'],
+            )
+            created += len(samples)
+            self.stdout.write('Created %d/%d samples, up to %s' % (created, scale, samples[-1].sample_id))
+
+        self.stdout.write(self.style.SUCCESS('Created %d samples' % created))
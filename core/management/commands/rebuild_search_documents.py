@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search_util.search_documents import SEARCH_FIELDS, get_search_models, update_search_documents
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the search documents, after migrating to core.0016_searchdocument '
+        'or after rows were written without model signals'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models', nargs='*',
+            help='Labels of the models to rebuild, e.g. dlp.DlpLibrary. All of them by default.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows whose documents are rebuilt in one transaction',
+        )
+
+    def handle(self, *args, **options):
+        labels = options['models']
+        unknown = [label for label in labels if label not in SEARCH_FIELDS]
+        if unknown:
+            raise CommandError('No search documents for %s, choose from %s' % (
+                ', '.join(unknown), ', '.join(SEARCH_FIELDS)))
+
+        for model in get_search_models():
+            if labels and model._meta.label not in labels:
+                continue
+            updated = update_search_documents(model, batch_size=options['batch_size'])
+            self.stdout.write('Rebuilt %d %s documents' % (updated, model._meta.label))
@@ -0,0 +1,59 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Time the hot paths against the current database and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Number of times each request is timed.',
+        )
+        parser.add_argument(
+            '--warm-cache', dest='warm', action='store_true', default=False,
+            help='Keep cached responses between requests instead of clearing the cache.',
+        )
+        parser.add_argument(
+            '--only', dest='names', action='append', default=[],
+            help='Only run benchmarks whose name contains this, can be repeated.',
+        )
+        parser.add_argument(
+            '--username',
+            help='Superuser to make the requests as, the first superuser by default.',
+        )
+        parser.add_argument(
+            '--output',
+            help='File to write the results to, standard output by default.',
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive')
+
+        users = User.objects.filter(is_superuser=True).order_by('id')
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No superuser to make the requests as, create one with createsuperuserargs')
+
+        results = run_benchmarks(user, options['repeat'], options['warm'], options['names'])
+
+        for result in results['results']:
+            if 'error' in result:
+                self.stderr.write('%-50s %s' % (result['name'], result['error']))
+            else:
+                self.stderr.write('%-50s %4d %5d queries %9.1f ms' % (
+                    result['name'], result['status'], result['queries'], result['median_ms']))
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Index history_date so the API change feed reads only recent history."""
+
+    dependencies = [
+        ('core', '0012_modelversion'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX "additional_sample_information_history_history_date_idx" ON "additional_sample_information_history" ("history_date")',
+            reverse_sql='DROP INDEX "additional_sample_information_history_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "chip_region_history_history_date_idx" ON "chip_region_history" ("history_date")',
+            reverse_sql='DROP INDEX "chip_region_history_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "chip_region_metadata_history_history_date_idx" ON "chip_region_metadata_history" ("history_date")',
+            reverse_sql='DROP INDEX "chip_region_metadata_history_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "doublet_information_history_history_date_idx" ON "doublet_information_history" ("history_date")',
+            reverse_sql='DROP INDEX "doublet_information_history_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "jira_user_history_history_date_idx" ON "jira_user_history" ("history_date")',
+            reverse_sql='DROP INDEX "jira_user_history_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "metadata_history_history_date_idx" ON "metadata_history" ("history_date")',
+            reverse_sql='DROP INDEX "metadata_history_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "history_sample_history_date_idx" ON "history_sample" ("history_date")',
+            reverse_sql='DROP INDEX "history_sample_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "sub_library_information_history_history_date_idx" ON "sub_library_information_history" ("history_date")',
+            reverse_sql='DROP INDEX "sub_library_information_history_history_date_idx"',
+        ),
+    ]
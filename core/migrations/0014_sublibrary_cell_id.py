@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 18:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models.functions import Cast, Concat
+
+
+def zero_padded(field_name):
+    return Concat(
+        models.Case(
+            models.When(**{field_name + '__range': (0, 9), 'then': models.Value('0')}),
+            default=models.Value(''),
+            output_field=models.TextField(),
+        ),
+        Cast(field_name, models.TextField()),
+    )
+
+
+def populate_cell_ids(apps, schema_editor):
+    """Store the cell id of every sublibrary, one UPDATE per sample and library."""
+    SublibraryInformation = apps.get_model('core', 'SublibraryInformation')
+    pairs = SublibraryInformation.objects.exclude(sample_id=None).values_list(
+        'sample_id', 'library', 'sample_id__sample_id', 'library__pool_id').distinct()
+    for sample, library, sample_id, pool_id in pairs:
+        SublibraryInformation.objects.filter(sample_id=sample, library=library).update(cell_id=Concat(
+            models.Value('%s-%s-R' % (sample_id, pool_id)),
+            zero_padded('row'),
+            models.Value('-C'),
+            zero_padded('column'),
+            output_field=models.TextField(),
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_history_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalsublibraryinformation',
+            name='cell_id',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=120, null=True, verbose_name='Cell ID'),
+        ),
+        migrations.AddField(
+            model_name='sublibraryinformation',
+            name='cell_id',
+            field=models.CharField(blank=True, editable=False, max_length=120, null=True, verbose_name='Cell ID'),
+        ),
+        migrations.RunPython(populate_cell_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 18:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Kept apart from 0014, so that the index is built once the cell ids are
+    stored rather than updated with every one of them.
+    """
+
+    dependencies = [
+        ('core', '0014_sublibrary_cell_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sublibraryinformation',
+            name='cell_id',
+            field=models.CharField(blank=True, editable=False, max_length=120, null=True, db_index=True, verbose_name='Cell ID'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 18:58
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Search documents, see core.search_util.search_documents, with their text
+    in a GIN index and their identifiers in a pg_trgm one. Fill the table
+    with "manage.py rebuild_search_documents" once migrated.
+    """
+
+    dependencies = [
+        ('core', '0015_sublibrary_cell_id_index'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_label', models.CharField(max_length=50)),
+                ('model_name', models.CharField(max_length=50)),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('url', models.CharField(max_length=255)),
+                ('identifiers', models.TextField(blank=True, default='')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_searchdocument_vector_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchdocument',
+            unique_together=set([('app_label', 'model_name', 'object_id')]),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "core_searchdocument_identifiers_trgm_idx" ON "core_searchdocument" USING gin (UPPER("identifiers"::text) gin_trgm_ops)',
+            reverse_sql='DROP INDEX "core_searchdocument_identifiers_trgm_idx"',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_searchdocument'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sample',
+            index=models.Index(fields=['sample_id'], name='core_sample_sample_id_idx'),
+        ),
+    ]
@@ -12,10 +12,16 @@ from __future__ import unicode_literals
 # Django imports
 #----------------------------
 import datetime
+import threading
+import weakref
 
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator, int_list_validator, \
     validate_comma_separated_integer_list
 
@@ -55,8 +61,8 @@ class Project(models.Model, FieldValue):
         return reverse("core:project_detail", kwargs={"pk": self.pk})
 
     def get_libraries(self):
-        return list(self.dlplibrary_set.all()) + list(self.pballibrary_projects.all()) + list(
-            self.tenxlibrary_set.all())
+        return list(self.dlplibrary_set.select_related('sample')) + list(
+            self.pballibrary_projects.select_related('sample')) + list(self.tenxlibrary_set.all())
 
     class Meta:
         ordering = ['name']
@@ -71,6 +77,7 @@ class Sample(models.Model, FieldValue):
     """
     class Meta:
         ordering = ['sample_id']
+        indexes = [models.Index(fields=['sample_id'], name='core_sample_sample_id_idx')]
 
     # track history
     history = HistoricalRecords(table_name='history_sample')
@@ -260,6 +267,49 @@ class ChipRegion(models.Model, FieldValue):
         return "{}".format(self.region_code)
 
 
+def format_cell_id(sample_id, pool_id, row, column):
+    """Return the cell id <sample>-<library>-R<row>-C<column> of a sublibrary."""
+    return '-'.join([sample_id, pool_id, 'R' + str(row).zfill(2), 'C' + str(column).zfill(2)])
+
+
+def zero_padded(field_name):
+    """Expression for an integer field as text padded to two digits, like str.zfill(2)."""
+    return Concat(
+        models.Case(
+            models.When(**{field_name + '__range': (0, 9), 'then': models.Value('0')}),
+            default=models.Value(''),
+            output_field=models.TextField(),
+        ),
+        Cast(field_name, models.TextField()),
+    )
+
+
+class SublibraryInformationQuerySet(models.QuerySet):
+    def update_cell_ids(self):
+        """
+        Rewrite the stored cell ids that no longer match their sample,
+        library, row and column, with one UPDATE per sample and library.
+        """
+        updated = 0
+        pairs = self.exclude(sample_id=None).values_list(
+            'sample_id', 'library', 'sample_id__sample_id', 'library__pool_id').distinct()
+        for sample, library, sample_id, pool_id in pairs:
+            cell_id = Concat(
+                models.Value('%s-%s-R' % (sample_id, pool_id)),
+                zero_padded('row'),
+                models.Value('-C'),
+                zero_padded('column'),
+                output_field=models.TextField(),
+            )
+            updated += self.filter(sample_id=sample, library=library).exclude(cell_id=cell_id).update(cell_id=cell_id)
+        updated += self.filter(sample_id=None).exclude(cell_id=None).update(cell_id=None)
+
+        # update() sends no signals
+        if updated:
+            ModelVersion.objects.bump(SublibraryInformation)
+        return updated
+
+
 class SublibraryInformation(models.Model, FieldValue):
     """
     Sublibrary Information from the SmartChipApp output file.
@@ -268,8 +318,10 @@ class SublibraryInformation(models.Model, FieldValue):
 
     history = HistoricalRecords(table_name='sub_library_information_history')
 
-    fields_to_exclude = ['ID', 'Library', 'Sample_ID', 'Chip_Region']
-    values_to_exclude = ['id', 'library', 'sample_id', 'chip_region']
+    fields_to_exclude = ['ID', 'Library', 'Sample_ID', 'Chip_Region', 'Cell ID']
+    values_to_exclude = ['id', 'library', 'sample_id', 'chip_region', 'cell_id']
+
+    objects = SublibraryInformationQuerySet.as_manager()
 
     # database relationships
     library = models.ForeignKey(
@@ -316,14 +368,28 @@ class SublibraryInformation(models.Model, FieldValue):
     spot_well = create_chrfield("Spot_Well")
     num_drops = create_intfield("Num_Drops")
 
+    # <sample>-<library>-R<row>-C<column>, kept in step with the fields it
+    # is built from by save(), the bulk API and update_cell_ids(). Not
+    # unique: a chip id may be reused, giving several cells the same id.
+    cell_id = create_chrfield("Cell ID", max_length=120, db_index=True, editable=False)
+
+    def build_cell_id(self):
+        if self.sample_id_id is None:
+            return None
+        return format_cell_id(self.sample_id.sample_id, self.library.pool_id, self.row, self.column)
+
+    def save(self, *args, **kwargs):
+        self.cell_id = self.build_cell_id()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'cell_id'}
+        super(SublibraryInformation, self).save(*args, **kwargs)
+
     def get_sublibrary_id(self):
-        return '-'.join([
-            self.sample_id.sample_id, self.library.pool_id, 'R' + str(self.row).zfill(2),
-            'C' + str(self.column).zfill(2)
-        ])
+        return self.cell_id
 
     def __str__(self):
-        return self.get_sublibrary_id()
+        return self.get_sublibrary_id() or ''
 
 
 class DoubletInformation(models.Model):
@@ -452,3 +518,152 @@ class JiraUser(models.Model):
 
     def __str__(self):
         return self.name
+
+
+#============================
+# Change tracking
+#----------------------------
+class VersionBump(object):
+    """Moves the version of label on, once the transaction that changed it commits."""
+
+    def __init__(self, manager, label, pending):
+        self.manager = manager
+        self.label = label
+        self.pending = pending
+
+    def __call__(self):
+        if self.pending.get(self.label) is self:
+            del self.pending[self.label]
+        self.manager.increment([self.label])
+
+
+# {database alias: {label: VersionBump}} of the bumps waiting for the
+# transaction of this thread's connection to commit
+_pending_bumps = threading.local()
+
+
+class ModelVersionManager(models.Manager):
+    def get_pending_bumps(self):
+        """
+        Return {label: VersionBump} of the bumps registered in the current
+        transaction. It holds them weakly: a bump rolled back with its
+        transaction or savepoint is dropped by Django, and with it from here.
+        """
+        by_db = getattr(_pending_bumps, 'by_db', None)
+        if by_db is None:
+            by_db = _pending_bumps.by_db = {}
+        return by_db.setdefault(self.db, weakref.WeakValueDictionary())
+
+    def bump(self, *model_classes):
+        """
+        Record that rows of the given models were created, changed or deleted.
+
+        In a transaction, the versions move once it commits, each label once
+        however many times it was bumped. So the version rows are only
+        locked for an instant rather than until the commit, and no one sees
+        a version before the rows it stands for.
+        """
+        labels = set(model._meta.label_lower for model in model_classes)
+        if not transaction.get_connection(self.db).in_atomic_block:
+            self.increment(labels)
+            return
+
+        pending = self.get_pending_bumps()
+        for label in sorted(labels):
+            if pending.get(label) is None:
+                pending[label] = callback = VersionBump(self, label, pending)
+                transaction.on_commit(callback, using=self.db)
+
+    def increment(self, labels):
+        now = timezone.now()
+        for label in labels:
+            updated = self.filter(label=label).update(
+                version=models.F('version') + 1,
+                last_modified=now,
+            )
+            if not updated:
+                self.get_or_create(label=label, defaults={'version': 1, 'last_modified': now})
+
+    def get_versions(self, model_classes):
+        """Return {model: ModelVersion} for the given models."""
+        model_classes = set(model_classes)
+        versions = {
+            v.label: v for v in
+            self.filter(label__in=[model._meta.label_lower for model in model_classes])
+        }
+
+        result = {}
+        for model in model_classes:
+            label = model._meta.label_lower
+            if label not in versions:
+                # Models that have not changed since versions were first
+                # tracked start from their latest history entry
+                last_modified = None
+                if hasattr(model, 'history'):
+                    last_modified = model.history.aggregate(
+                        last_modified=models.Max('history_date'))['last_modified']
+                versions[label], _ = self.get_or_create(
+                    label=label,
+                    defaults={'last_modified': last_modified or timezone.now()},
+                )
+            result[model] = versions[label]
+        return result
+
+
+class ModelVersion(models.Model):
+    """
+    Counts changes to each model, so that the API can tell whether a response
+    may have changed without reading the rows it is built from. ETags, the
+    Kudu list and stats caches and the search cache all depend on it.
+
+    Saves, deletes and many to many changes bump the versions through model
+    signals (see core.signals). Writes that send no signals must call
+    ModelVersion.objects.bump() with the models they wrote, or responses
+    built from the old rows keep being served:
+
+    - QuerySet.update(), bulk_create() and bulk_create_with_history()
+    - raw SQL, and fixtures loaded with "manage.py loaddata"
+    - writers outside of Django, such as scripts and pipelines writing to
+      the database directly, which can run
+      UPDATE core_modelversion SET version = version + 1, last_modified = now()
+      WHERE label IN ('<app_label>.<model_name>', ...)
+    """
+
+    label = models.CharField(max_length=100, unique=True)
+    version = models.PositiveIntegerField(default=0)
+    last_modified = models.DateTimeField(default=timezone.now)
+
+    objects = ModelVersionManager()
+
+    def __str__(self):
+        return "{} v{}".format(self.label, self.version)
+
+
+#============================
+# Search
+#----------------------------
+class SearchDocument(models.Model):
+    """
+    The search document of one row of a searchable model, kept up to date by
+    core.search_util.search_documents, so that global search reads a single
+    indexed table.
+    """
+
+    app_label = models.CharField(max_length=50)
+    model_name = models.CharField(max_length=50)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=255)
+    url = models.CharField(max_length=255)
+    # Matched by substring and similarity, on a trigram index
+    identifiers = models.TextField(blank=True, default='')
+    search_vector = SearchVectorField(null=True)
+
+    class Meta:
+        unique_together = ('app_label', 'model_name', 'object_id')
+        indexes = [GinIndex(fields=['search_vector'], name='core_searchdocument_vector_idx')]
+
+    def __str__(self):
+        return self.title
+
+    def get_absolute_url(self):
+        return self.url
@@ -0,0 +1,116 @@
+"""
+Search cache.
+
+The same searches are made over and over, so every process keeps the
+pages of its latest searches, least recently used dropped first, each for
+at most SEARCH_CACHE_TIMEOUT seconds. They are stored under the search
+generation, the ModelVersion counters of the documents and of the other
+rows that searches read, so a page is used until any of them changes.
+Identical searches made at the same time by several threads wait for the
+one of them that got there first instead of repeating its work, for at
+most SEARCH_CACHE_WAIT seconds. Both the pages and this coalescing are per
+process: other processes, and other servers, search for themselves.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from core.models import ChipRegionMetadata, ModelVersion, SearchDocument, SublibraryInformation
+
+
+# The models that searches read, see search_helper.exact_matches and
+# search_planner
+GENERATION_MODELS = (SearchDocument, ChipRegionMetadata, SublibraryInformation)
+
+
+def get_generation():
+    """Return the search generation, which changes with every write searches may see."""
+    versions = ModelVersion.objects.get_versions(GENERATION_MODELS)
+    return '|'.join('%s:%d' % (versions[model].label, versions[model].version) for model in GENERATION_MODELS)
+
+
+class Flight(object):
+    """A value being computed, waited for by the threads that need it too."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.failed = True
+
+
+class SearchCache(object):
+    """
+    A thread safe LRU cache whose values expire timeout seconds after they
+    are set. It lives in the memory of one process, and so does the waiting
+    of get_or_set().
+    """
+
+    def __init__(self, max_entries, timeout, wait):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.wait = wait
+        self.entries = OrderedDict()
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value of key, or None if it is missing or has expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_set(self, key, compute):
+        """
+        Return the value of key, computing and storing it if it is missing.
+        Threads of this process asking for a key that is being computed wait
+        up to self.wait seconds for it, and compute it themselves if that
+        fails or takes longer.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+
+        if not leader:
+            if flight.done.wait(self.wait) and not flight.failed:
+                return flight.value
+            return compute()
+
+        try:
+            flight.value = compute()
+            flight.failed = False
+            self.set(key, flight.value)
+            return flight.value
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+search_cache = SearchCache(
+    settings.SEARCH_CACHE_MAX_ENTRIES, settings.SEARCH_CACHE_TIMEOUT, settings.SEARCH_CACHE_WAIT)
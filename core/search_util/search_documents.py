@@ -0,0 +1,360 @@
+"""
+Search documents.
+
+Every row of a searchable model has a SearchDocument holding its title and
+URL, a tsvector of the fields listed for it in search_fields, fields of
+related rows and the labels of choices included, and its identifiers,
+e.g. pool and flow cell IDs, for substring and similarity matching.
+
+Documents are rebuilt whenever a row or one of the rows its document
+reads is saved or deleted, and all at once with
+"manage.py rebuild_search_documents". search() then finds and ranks the
+matches of a query over the GIN indexes of the table, and get_page() cuts
+the best of each model out of them in the same query.
+"""
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.apps import apps
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.lookups import PostgresSimpleLookup
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import transaction
+from django.db.models import (
+    Case, CharField, F, FloatField, Func, OuterRef, Q, Subquery, TextField, Transform, Value, When,
+)
+from django.db.models.query import EmptyQuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from core.models import ModelVersion, SearchDocument
+from core.search_util.search_fields import (
+    CORE_LIBRARY,
+    CORE_SEQUENCING,
+    DLP_ANALYSES,
+    DLP_ANALYSES_IDENTIFIERS,
+    DLP_LIBRARY,
+    DLP_LIBRARY_IDENTIFIERS,
+    DLP_SEQUENCING,
+    DLP_SEQUENCING_IDENTIFIERS,
+    PBAL_LIBRARY,
+    PBAL_SEQUENCING,
+    PBAL_SEQUENCING_IDENTIFIERS,
+    PROJECT,
+    PROJECT_IDENTIFIERS,
+    SAMPLE,
+    SAMPLE_IDENTIFIERS,
+    TENX_ANALYSIS,
+    TENX_ANALYSIS_IDENTIFIERS,
+    TENX_CHIP,
+    TENX_CHIP_IDENTIFIERS,
+    TENX_LIBRARY,
+    TENX_LIBRARY_IDENTIFIERS,
+    TENX_POOL,
+    TENX_POOL_IDENTIFIERS,
+    TENX_SEQUENCING,
+    TENX_SEQUENCING_IDENTIFIERS,
+)
+
+
+# The lookups making up the search document of each model
+SEARCH_FIELDS = OrderedDict([
+    ('core.Sample', SAMPLE),
+    ('core.Project', PROJECT),
+    ('dlp.DlpLibrary', CORE_LIBRARY + DLP_LIBRARY),
+    ('dlp.DlpSequencing', CORE_SEQUENCING + DLP_SEQUENCING),
+    ('sisyphus.DlpAnalysisInformation', DLP_ANALYSES),
+    ('pbal.PbalLibrary', CORE_LIBRARY + PBAL_LIBRARY),
+    ('pbal.PbalSequencing', CORE_SEQUENCING + PBAL_SEQUENCING),
+    ('tenx.TenxChip', TENX_CHIP),
+    ('tenx.TenxPool', TENX_POOL),
+    ('tenx.TenxLibrary', CORE_LIBRARY + TENX_LIBRARY),
+    ('tenx.TenxSequencing', TENX_SEQUENCING),
+    ('tenx.TenxAnalysis', TENX_ANALYSIS),
+])
+
+IDENTIFIER_FIELDS = {
+    'core.Project': PROJECT_IDENTIFIERS,
+    'core.Sample': SAMPLE_IDENTIFIERS,
+    'dlp.DlpLibrary': DLP_LIBRARY_IDENTIFIERS,
+    'dlp.DlpSequencing': DLP_SEQUENCING_IDENTIFIERS,
+    'sisyphus.DlpAnalysisInformation': DLP_ANALYSES_IDENTIFIERS,
+    'pbal.PbalSequencing': PBAL_SEQUENCING_IDENTIFIERS,
+    'tenx.TenxChip': TENX_CHIP_IDENTIFIERS,
+    'tenx.TenxPool': TENX_POOL_IDENTIFIERS,
+    'tenx.TenxLibrary': TENX_LIBRARY_IDENTIFIERS,
+    'tenx.TenxSequencing': TENX_SEQUENCING_IDENTIFIERS,
+    'tenx.TenxAnalysis': TENX_ANALYSIS_IDENTIFIERS,
+}
+
+# The related rows read by the titles of the documents of each model
+TITLE_RELATED = {
+    'dlp.DlpLibrary': ['sample'],
+    'dlp.DlpSequencing': ['library__sample'],
+    'pbal.PbalLibrary': ['sample'],
+    'pbal.PbalSequencing': ['library__sample'],
+}
+
+
+class PrefixSearchQuery(SearchQuery):
+    """Match documents with a word starting with each word of the query."""
+
+    def as_sql(self, compiler, connection):
+        words = ["'%s':*" % word.replace('\\', '\\\\').replace("'", "''") for word in self.value.split()]
+        return 'to_tsquery(%s)', [' & '.join(words)]
+
+
+class UpperText(Transform):
+    """UPPER(<expression>::text), the expression of the identifiers trigram index."""
+    function = 'UPPER'
+    template = '%(function)s(%(expressions)s::text)'
+
+    def __init__(self, expression, **extra):
+        super(UpperText, self).__init__(expression, output_field=CharField(), **extra)
+
+
+@UpperText.register_lookup
+class TrigramWordSimilar(PostgresSimpleLookup):
+    """Match text with a word similar to the value, answered from a trigram index."""
+    lookup_name = 'trigram_word_similar'
+    operator = '%%>'
+
+
+class TrigramWordSimilarity(Func):
+    function = 'WORD_SIMILARITY'
+
+    def __init__(self, string, expression, **extra):
+        super(TrigramWordSimilarity, self).__init__(Value(string), expression, output_field=FloatField(), **extra)
+
+
+def get_search_models():
+    return [apps.get_model(label) for label in SEARCH_FIELDS]
+
+
+def get_relations(model, lookup):
+    """Yield (path, related model, field) for each relation lookup follows from model."""
+    path = []
+    for name in lookup.split('__')[:-1]:
+        field = model._meta.get_field(name)
+        path.append(name)
+        model = field.related_model
+        yield '__'.join(path), model, field
+
+
+def get_lookups(label):
+    """Return every lookup that the documents of label's rows read."""
+    return (
+        SEARCH_FIELDS[label] + IDENTIFIER_FIELDS.get(label, [])
+        + [path + '__pk' for path in TITLE_RELATED.get(label, [])]
+    )
+
+
+def get_text(model, lookup):
+    """Return the value of lookup, followed by the label of its choice if it has one."""
+    related = model
+    for _, related, _ in get_relations(model, lookup):
+        pass
+    field = related._meta.get_field(lookup.split('__')[-1])
+    if not field.choices:
+        return F(lookup)
+    return Case(
+        *[When(**{lookup: value, 'then': Value('%s %s' % (value, label))}) for value, label in field.flatchoices],
+        default=F(lookup), output_field=TextField()
+    )
+
+
+def get_expressions(model, lookups):
+    """
+    Return the text of each lookup of model's rows. Values read across a one
+    to many relation, which must be the first relation of their lookup, are
+    joined into one string so that every row has one text per lookup.
+    """
+    expressions = []
+    for lookup in lookups:
+        relations = list(get_relations(model, lookup))
+        many = [index for index, (_, _, field) in enumerate(relations) if field.one_to_many or field.many_to_many]
+        if not many:
+            expressions.append(get_text(model, lookup))
+            continue
+
+        path, related, field = relations[0]
+        if many != [0] or not field.one_to_many:
+            raise ValueError('%s: only the first relation may be one to many' % lookup)
+        back = field.field.name
+        values = related._default_manager.filter(**{back: OuterRef('pk')}).order_by().values(back)
+        text = StringAgg(get_text(related, lookup[len(path) + 2:]), ' ')
+        expressions.append(Subquery(values.annotate(text=text).values('text'), output_field=TextField()))
+    return expressions
+
+
+def build_documents(model, queryset):
+    """Return the unsaved SearchDocuments of the rows of queryset."""
+    label = model._meta.label
+    identifiers = get_expressions(model, IDENTIFIER_FIELDS.get(label, [])) or [Value('')]
+    rows = queryset.select_related(*TITLE_RELATED.get(label, [])).annotate(
+        document=SearchVector(*get_expressions(model, SEARCH_FIELDS[label])),
+        identifier_text=Func(Value(' '), *identifiers, function='CONCAT_WS', output_field=TextField()),
+    )
+    return [
+        SearchDocument(
+            app_label=model._meta.app_label,
+            model_name=model._meta.model_name,
+            object_id=row.pk,
+            title=str(row)[:255],
+            url=row.get_absolute_url(),
+            identifiers=row.identifier_text,
+            search_vector=row.document,
+        )
+        for row in rows
+    ]
+
+
+def get_model_documents(model):
+    return SearchDocument.objects.filter(app_label=model._meta.app_label, model_name=model._meta.model_name)
+
+
+def update_search_documents(model, pks=None, batch_size=1000):
+    """Rebuild the documents of the rows of model with pks, or of all of them."""
+    documents = get_model_documents(model)
+    if pks is None:
+        # Also drop the documents of rows deleted without signals
+        deleted, _ = documents.exclude(object_id__in=model._default_manager.values('pk')).delete()
+        if deleted:
+            ModelVersion.objects.bump(SearchDocument)
+        pks = model._default_manager.order_by('pk').values_list('pk', flat=True)
+    pks = list(pks)
+
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start:start + batch_size]
+        with transaction.atomic():
+            documents.filter(object_id__in=batch).delete()
+            SearchDocument.objects.bulk_create(build_documents(model, model._default_manager.filter(pk__in=batch)))
+            # Moves on the search generation, see search_cache
+            ModelVersion.objects.bump(SearchDocument)
+    return len(pks)
+
+
+@lru_cache(maxsize=None)
+def get_dependents(model):
+    """Return [(searchable model, lookup)] of the documents that read rows of model."""
+    dependents = []
+    for searchable in get_search_models():
+        paths = set(['pk'] if searchable is model else [])
+        for lookup in get_lookups(searchable._meta.label):
+            paths.update(path for path, related, _ in get_relations(searchable, lookup) if related is model)
+        dependents.extend((searchable, path) for path in sorted(paths))
+    return dependents
+
+
+def get_dependent_pks(model, pks):
+    """Yield (searchable model, pks) of the documents that read the rows of model with pks."""
+    for searchable, path in get_dependents(model):
+        if path == 'pk':
+            yield searchable, pks
+        else:
+            yield searchable, set(
+                searchable._default_manager.filter(**{path + '__in': pks}).values_list('pk', flat=True))
+
+
+def update_dependent_documents(model, pks):
+    """Rebuild the documents that read the rows of model with pks."""
+    for searchable, dependent_pks in get_dependent_pks(model, pks):
+        if dependent_pks:
+            update_search_documents(searchable, dependent_pks)
+
+
+def search_documents_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_dependent_documents(sender, [instance.pk])
+
+
+def search_documents_deleting(sender, instance, **kwargs):
+    # The rows reading instance cannot be found once it is gone
+    instance._search_dependents = list(get_dependent_pks(sender, [instance.pk]))
+
+
+def search_documents_deleted(sender, instance, **kwargs):
+    # Rows deleted with instance lose their documents here too, as they
+    # cannot be rebuilt
+    for searchable, pks in getattr(instance, '_search_dependents', []):
+        if pks:
+            update_search_documents(searchable, pks)
+
+
+def connect_search_signals():
+    models = set()
+    for searchable in get_search_models():
+        models.add(searchable)
+        for lookup in get_lookups(searchable._meta.label):
+            models.update(related for _, related, _ in get_relations(searchable, lookup))
+
+    for model in models:
+        uid = 'search_documents_%s' % model._meta.label_lower
+        post_save.connect(search_documents_saved, sender=model, dispatch_uid=uid)
+        pre_delete.connect(search_documents_deleting, sender=model, dispatch_uid=uid)
+        post_delete.connect(search_documents_deleted, sender=model, dispatch_uid=uid)
+
+
+def get_documents(*querysets):
+    """
+    Return the documents of the rows of querysets, as a union so that each
+    is found through the unique index of the table rather than by scanning
+    the documents of its model. They rank as full matches of search().
+    """
+    documents = [
+        get_model_documents(queryset.model).filter(object_id__in=queryset.values('pk')).annotate(
+            identifier_text=UpperText('identifiers'),
+            rank=Value(1.0, output_field=FloatField()),
+        )
+        for queryset in querysets
+    ]
+    if not documents:
+        return SearchDocument.objects.none()
+    return documents[0].union(*documents[1:])
+
+
+def search(query):
+    """
+    Return the documents with words starting with the words of query, or
+    identifiers containing it or similar to it, annotated with their rank.
+    """
+    term = query.upper()
+    return SearchDocument.objects.annotate(identifier_text=UpperText('identifiers')).filter(
+        Q(search_vector=PrefixSearchQuery(query))
+        | Q(identifier_text__contains=term)
+        | Q(identifier_text__trigram_word_similar=term)
+    ).annotate(
+        rank=SearchRank(F('search_vector'), PrefixSearchQuery(query))
+        + TrigramWordSimilarity(term, F('identifier_text'))
+    )
+
+
+# Numbers the documents of each model best match first, once each
+PAGE_SQL = """
+SELECT * FROM (
+    SELECT *,
+        ROW_NUMBER() OVER (PARTITION BY app_label, model_name ORDER BY rank DESC, title, id) AS position,
+        COUNT(*) OVER (PARTITION BY app_label, model_name) AS group_count
+    FROM (
+        SELECT DISTINCT ON (id) * FROM (%s) matches %s ORDER BY id, rank DESC
+    ) documents
+) ranked
+WHERE position > %%s AND position <= %%s
+ORDER BY app_label, model_name, position
+"""
+
+
+def get_page(documents, limit, start=0, model=None):
+    """
+    Return the best matches of each model in documents, or of model only,
+    after the first start, at most limit of them. Each has the position of
+    its match and the number of matches of its model, so that every group
+    is ranked, cut and counted in the same query.
+    """
+    if isinstance(documents, EmptyQuerySet):
+        return []
+    sql, params = documents.query.sql_with_params()
+    where = ''
+    if model is not None:
+        where = 'WHERE app_label = %s AND model_name = %s'
+        params += (model._meta.app_label, model._meta.model_name)
+    return list(SearchDocument.objects.raw(PAGE_SQL % (sql, where), params + (start, start + limit)))
@@ -22,7 +22,9 @@ SAMPLE = [
     "additionalsampleinformation__receptor_status", "additionalsampleinformation__sample_treatment_status",
     "additionalsampleinformation__patient_treatment_status", "additionalsampleinformation__grade",
     "additionalsampleinformation__stage", "additionalsampleinformation__tumour_content",
-    "additionalsampleinformation__family_information"
+    "additionalsampleinformation__family_information", "sample_type", "additionalsampleinformation__sex",
+    "additionalsampleinformation__tissue_type", "additionalsampleinformation__tissue_state",
+    "additionalsampleinformation__pathology_occurrence"
 ]
 
 CORE_LIBRARY = ["description", "result"]
@@ -84,6 +86,19 @@ TENX_SEQUENCING = [
 
 DLP_ANALYSES = [
     "priority_level", "smoothing", "verified", "reference_genome__reference_genome", "version__version",
-    "analysis_jira_ticket"
+    "analysis_jira_ticket", "aligner"
 ]
 TENX_ANALYSIS = ["version", "jira_ticket", "run_status", "description"]
+
+#identifiers matched by substring and similarity, see search_documents
+PROJECT_IDENTIFIERS = ["name"]
+SAMPLE_IDENTIFIERS = ["sample_id"]
+DLP_LIBRARY_IDENTIFIERS = ["pool_id", "jira_ticket"]
+DLP_SEQUENCING_IDENTIFIERS = ["gsc_library_id", "dlplane__flow_cell_id"]
+DLP_ANALYSES_IDENTIFIERS = ["analysis_jira_ticket"]
+PBAL_SEQUENCING_IDENTIFIERS = ["gsc_library_id", "pballane__flow_cell_id"]
+TENX_LIBRARY_IDENTIFIERS = ["name", "jira_ticket", "gsc_library_id"]
+TENX_CHIP_IDENTIFIERS = ["lab_name"]
+TENX_POOL_IDENTIFIERS = ["gsc_pool_name", "pool_name"]
+TENX_SEQUENCING_IDENTIFIERS = ["gsc_library_id", "tenxlane__flow_cell_id"]
+TENX_ANALYSIS_IDENTIFIERS = ["jira_ticket"]
@@ -0,0 +1,72 @@
+"""
+Search planner.
+
+Most searches are one identifier typed or pasted in full: a sample ID, a
+DLP chip ID, a Jira ticket, a GSC library ID, a flow cell, a 10x pool or a
+cell ID. key_matches() recognizes these by their shape and looks them up
+in the indexed columns holding them, finding their documents in one query
+without reading the full text indexes. Queries of no known shape, and
+identifiers matching nothing, are left to search().
+"""
+import re
+
+from django.apps import apps
+
+from core.search_util.search_documents import get_documents
+
+
+# The shapes of the identifiers, and the lookups of the rows naming them
+KEY_SHAPES = [
+    ('sample', r'SA\d[A-Z0-9]*', [
+        ('core.Sample', 'sample_id'),
+        ('dlp.DlpLibrary', 'sample__sample_id'),
+        ('dlp.DlpSequencing', 'library__sample__sample_id'),
+    ]),
+    ('chip', r'A\d+[A-Z]?', [
+        ('dlp.DlpLibrary', 'pool_id'),
+        ('dlp.DlpSequencing', 'library__pool_id'),
+    ]),
+    ('jira', r'SC-\d+', [
+        ('dlp.DlpLibrary', 'jira_ticket'),
+        ('sisyphus.DlpAnalysisInformation', 'analysis_jira_ticket'),
+        ('tenx.TenxLibrary', 'jira_ticket'),
+        ('tenx.TenxAnalysis', 'jira_ticket'),
+    ]),
+    ('gsc', r'PX\d+', [
+        ('dlp.DlpSequencing', 'gsc_library_id'),
+        ('pbal.PbalSequencing', 'gsc_library_id'),
+        ('tenx.TenxLibrary', 'gsc_library_id'),
+        ('tenx.TenxSequencing', 'gsc_library_id'),
+        ('tenx.TenxSequencing', 'tenxlane__gsc_sublibrary_names__contains'),
+    ]),
+    ('tenx_pool', r'TENXPOOL\d+', [
+        ('tenx.TenxPool', 'pool_name'),
+        ('tenx.TenxSequencing', 'tenx_pool__pool_name'),
+    ]),
+    ('flow_cell', r'[A-Z0-9]{5,}X[XY0-9](_\d+)?', [
+        ('dlp.DlpSequencing', 'dlplane__flow_cell_id'),
+        ('pbal.PbalSequencing', 'pballane__flow_cell_id'),
+        ('tenx.TenxSequencing', 'tenxlane__flow_cell_id'),
+    ]),
+    ('cell', r'.+-.+-R\d{2}-C\d{2}', [
+        ('dlp.DlpLibrary', 'sublibraryinformation__cell_id'),
+    ]),
+]
+
+
+def get_key_querysets(query):
+    """Return querysets of the rows holding query in a column its shapes name."""
+    key = query.strip().upper()
+    querysets = []
+    for _, pattern, lookups in KEY_SHAPES:
+        if not re.fullmatch(pattern, key):
+            continue
+        for label, lookup in lookups:
+            value = [key] if lookup.endswith('__contains') else key
+            querysets.append(apps.get_model(label)._default_manager.filter(**{lookup: value}))
+    return querysets
+
+
+def key_matches(query):
+    """Return the documents of the rows that query names by an identifier."""
+    return get_documents(*get_key_querysets(query))
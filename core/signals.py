@@ -0,0 +1,78 @@
+"""
+Keeps ModelVersion counters, stored sublibrary cell ids and search
+documents up to date as LIMS records change. Writes that send no signals
+must bump the counters themselves, see core.models.ModelVersion.
+"""
+
+from __future__ import unicode_literals
+
+from django.apps import apps
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
+
+from .models import ModelVersion, Sample, SearchDocument, SublibraryInformation
+from .search_util.search_documents import connect_search_signals
+
+
+TRACKED_APPS = ('core', 'dlp', 'pbal', 'tenx', 'sisyphus')
+
+
+def get_tracked_models():
+    """Return the LIMS models, leaving out their history tables and derived data."""
+    return [
+        model for app_label in TRACKED_APPS
+        for model in apps.get_app_config(app_label).get_models()
+        if model not in (ModelVersion, SearchDocument) and not hasattr(model, 'instance_type')
+    ]
+
+
+def bump_model_version(sender, **kwargs):
+    if not kwargs.get('raw', False):
+        ModelVersion.objects.bump(sender)
+
+
+def bump_m2m_versions(sender, instance, action, model, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        ModelVersion.objects.bump(instance.__class__, model)
+
+
+def cell_id_field(model):
+    """Return the field of model that cell ids embed."""
+    return 'sample_id' if model is Sample else 'pool_id'
+
+
+def remember_cell_id_field(sender, instance, **kwargs):
+    # Left out of instance.__dict__ when deferred
+    instance._loaded_cell_id_field = instance.__dict__.get(cell_id_field(sender))
+
+
+def update_cell_ids(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Rewrite the cell ids of the sublibraries of a renamed sample or library."""
+    field = cell_id_field(sender)
+    if raw or (update_fields is not None and field not in update_fields):
+        return
+    loaded, instance._loaded_cell_id_field = instance._loaded_cell_id_field, instance.__dict__.get(field)
+    if created or loaded == instance._loaded_cell_id_field:
+        return
+    relation = 'sample_id' if sender is Sample else 'library'
+    SublibraryInformation.objects.filter(**{relation: instance}).update_cell_ids()
+
+
+def connect_signals():
+    for model in get_tracked_models():
+        uid = 'model_version_%s' % model._meta.label_lower
+        post_save.connect(bump_model_version, sender=model, dispatch_uid=uid)
+        post_delete.connect(bump_model_version, sender=model, dispatch_uid=uid)
+        for field in model._meta.local_many_to_many:
+            m2m_changed.connect(
+                bump_m2m_versions,
+                sender=field.remote_field.through,
+                dispatch_uid='model_version_%s' % field.remote_field.through._meta.label_lower,
+            )
+
+    # Cell ids embed the sample id and the library pool id
+    for model in (Sample, apps.get_model('dlp', 'DlpLibrary')):
+        uid = 'cell_ids_%s' % model._meta.label_lower
+        post_init.connect(remember_cell_id_field, sender=model, dispatch_uid=uid)
+        post_save.connect(update_cell_ids, sender=model, dispatch_uid=uid)
+
+    connect_search_signals()
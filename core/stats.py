@@ -0,0 +1,158 @@
+"""
+Aggregate statistics over the LIMS, computed with grouped queries in the
+database and cached under the ModelVersion counters of the models each one
+reads, so a cached statistic is used until one of those models changes.
+"""
+import hashlib
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncMonth
+
+from core.models import ModelVersion, Project, Sample, SublibraryInformation
+from dlp.models import DlpLane, DlpLibrary, DlpLibrarySampleDetail, DlpSequencing
+from pbal.models import PbalLibrary, PbalSequencing
+from sisyphus.models import AnalysisRun, DlpAnalysisInformation
+from tenx.models import TenxAnalysis, TenxChip, TenxLane, TenxLibrary, TenxPool, TenxSequencing
+
+
+def count_by(queryset, key):
+    """Return {key value: number of rows} from one grouped query."""
+    return dict(queryset.order_by().values(key).annotate(count=Count('id')).values_list(key, 'count'))
+
+
+def count_subquery(queryset, key):
+    """Expression counting the rows of queryset whose key is the outer row."""
+    return Coalesce(Subquery(
+        queryset.filter(**{key: OuterRef('pk')}).order_by().values(key).annotate(count=Count('id')).values('count'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+TOTALS = OrderedDict([
+    ('samples', Sample),
+    ('projects', Project),
+    ('dlp_libraries', DlpLibrary),
+    ('dlp_sequencings', DlpSequencing),
+    ('dlp_analyses', DlpAnalysisInformation),
+    ('analysis_runs', AnalysisRun),
+    ('sublibraries', SublibraryInformation),
+    ('pbal_libraries', PbalLibrary),
+    ('pbal_sequencings', PbalSequencing),
+    ('tenx_libraries', TenxLibrary),
+    ('tenx_sequencings', TenxSequencing),
+    ('tenx_chips', TenxChip),
+    ('tenx_pools', TenxPool),
+    ('tenx_analyses', TenxAnalysis),
+])
+
+
+def get_totals():
+    """Rows of each model in TOTALS, counted in one query."""
+    # Raw SQL is not routed, so ask the router where the querysets of the
+    # other statistics read from
+    connection = connections[router.db_for_read(Sample)]
+    counts = ', '.join(
+        '(SELECT COUNT(*) FROM %s)' % connection.ops.quote_name(model._meta.db_table)
+        for model in TOTALS.values()
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + counts)
+        return OrderedDict(zip(TOTALS, cursor.fetchone()))
+
+
+def get_sample_libraries():
+    """Libraries of each kind and DLP cells per sample."""
+    return list(Sample.objects.order_by('sample_id').annotate(
+        dlp_libraries=count_subquery(DlpLibrary.objects.all(), 'sample'),
+        tenx_libraries=count_subquery(TenxLibrary.objects.all(), 'sample'),
+        pbal_libraries=count_subquery(PbalLibrary.objects.all(), 'sample'),
+        sublibraries=count_subquery(SublibraryInformation.objects.all(), 'sample_id'),
+    ).values('id', 'sample_id', 'dlp_libraries', 'tenx_libraries', 'pbal_libraries', 'sublibraries'))
+
+
+def get_sequencing_lanes():
+    """Lanes sequenced against lanes requested for each sequencing."""
+    dlp = DlpSequencing.objects.order_by('id').annotate(lanes=Count('dlplane')).values(
+        'id', 'gsc_library_id', 'number_of_lanes_requested', 'lanes', library_name=F('library__pool_id'))
+    tenx = TenxSequencing.objects.order_by('id').annotate(lanes=Count('tenxlane')).values(
+        'id', 'gsc_library_id', 'number_of_lanes_requested', 'lanes', library_name=F('library__name'))
+    return OrderedDict([('dlp', list(dlp)), ('tenx', list(tenx))])
+
+
+def get_analysis_status():
+    """Analyses per run status."""
+    return OrderedDict([
+        ('dlp', count_by(DlpAnalysisInformation.objects.all(), 'analysis_run__run_status')),
+        ('tenx', count_by(TenxAnalysis.objects.all(), 'run_status')),
+    ])
+
+
+def get_project_cells():
+    """DLP cells per project and month their chips were spotted."""
+    rows = SublibraryInformation.objects.order_by().values(
+        project=F('library__projects__name'),
+        month=TruncMonth('library__dlplibrarysampledetail__sample_spot_date'),
+    ).annotate(cells=Count('id')).order_by('project', 'month')
+    return [
+        OrderedDict([
+            ('project', row['project']),
+            ('month', row['month'].strftime('%Y-%m') if row['month'] is not None else None),
+            ('cells', row['cells']),
+        ])
+        for row in rows
+    ]
+
+
+class Stat(object):
+    def __init__(self, compute, models):
+        self.compute = compute
+        self.models = models
+
+
+STATS = OrderedDict([
+    ('totals', Stat(get_totals, tuple(TOTALS.values()))),
+    ('sample_libraries', Stat(get_sample_libraries, (
+        Sample, DlpLibrary, TenxLibrary, PbalLibrary, SublibraryInformation,
+    ))),
+    ('sequencing_lanes', Stat(get_sequencing_lanes, (
+        DlpSequencing, DlpLane, DlpLibrary, TenxSequencing, TenxLane, TenxLibrary,
+    ))),
+    ('analysis_status', Stat(get_analysis_status, (
+        DlpAnalysisInformation, AnalysisRun, TenxAnalysis,
+    ))),
+    ('project_cells', Stat(get_project_cells, (
+        SublibraryInformation, DlpLibrary, DlpLibrarySampleDetail, Project,
+    ))),
+])
+
+
+def get_stats(names):
+    """
+    Return ({name: result}, version key) for the given statistics, from the
+    cache where none of the models they read has changed. The version key
+    changes whenever any of the results may have.
+    """
+    stats = [(name, STATS[name]) for name in names]
+    versions = ModelVersion.objects.get_versions(set(model for _, stat in stats for model in stat.models))
+
+    keys = OrderedDict(
+        (name, 'stats:%s:%s' % (name, hashlib.md5('|'.join(sorted(
+            '%s:%d' % (versions[model].label, versions[model].version) for model in stat.models
+        )).encode('utf-8')).hexdigest()))
+        for name, stat in stats
+    )
+    cached = cache.get_many(list(keys.values()))
+
+    results = OrderedDict()
+    computed = {}
+    for name, stat in stats:
+        if keys[name] in cached:
+            results[name] = cached[keys[name]]
+        else:
+            results[name] = computed[keys[name]] = stat.compute()
+    if computed:
+        cache.set_many(computed)
+    return results, hashlib.md5('|'.join(keys.values()).encode('utf-8')).hexdigest()
@@ -0,0 +1,219 @@
+"""
+Generates synthetic LIMS data for tests and benchmarks.
+
+Each sample gets a DLP library with sequencings, lanes, an analysis and a
+chip of cells, a 10x library with its chip, pool, sequencing, lane and
+analysis, and a PBAL library. Every name starts with SYN, so synthetic rows
+never take the name of a real one, and is numbered after the highest sample
+id in the database, so it can be run repeatedly to grow a data set.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import (
+    AdditionalSampleInformation,
+    ChipRegion,
+    ChipRegionMetadata,
+    MetadataField,
+    ModelVersion,
+    Project,
+    Sample,
+    SublibraryInformation,
+    format_cell_id,
+)
+from core.search_util.search_documents import get_search_models, update_search_documents
+from dlp.models import (
+    DlpLane,
+    DlpLibrary,
+    DlpLibraryConstructionInformation,
+    DlpLibraryQuantificationAndStorage,
+    DlpLibrarySampleDetail,
+    DlpSequencing,
+)
+from pbal.models import PbalLibrary
+from sisyphus.models import (
+    AnalysisRun,
+    DlpAnalysisInformation,
+    DlpAnalysisVersion,
+    ReferenceGenome,
+)
+from tenx.models import (
+    TenxAnalysis,
+    TenxChip,
+    TenxLane,
+    TenxLibrary,
+    TenxLibraryConstructionInformation,
+    TenxLibraryQuantificationAndStorage,
+    TenxLibrarySampleDetail,
+    TenxPool,
+    TenxSequencing,
+)
+
+
+# Columns of a DLP chip
+CHIP_COLUMNS = 72
+
+CHIP_REGIONS = ('A', 'B', 'C', 'D')
+
+METADATA_FIELDS = ('sample_id', 'cell_call', 'experimental_condition')
+
+SEQUENCING_INSTRUMENTS = [code for code, _ in DlpSequencing._meta.get_field('sequencing_instrument').choices]
+
+
+@transaction.atomic
+def create_lims(scale=1, cells_per_library=1024, sequencings_per_library=2, lanes_per_sequencing=2):
+    """Create scale samples and everything hanging off them, return the samples."""
+    # The documents of the rows created are built at the end
+    search_models = get_search_models()
+    last_pks = dict(
+        (model, model._default_manager.aggregate(pk=Coalesce(Max('pk'), 0))['pk'])
+        for model in search_models
+    )
+
+    projects = [Project.objects.get_or_create(name=name)[0] for name in ('Synthetic A', 'Synthetic B')]
+    fields = [MetadataField.objects.get_or_create(field=field)[0] for field in METADATA_FIELDS]
+    version = DlpAnalysisVersion.objects.get_or_create(version='v0.2.25')[0]
+    reference_genome = ReferenceGenome.objects.get_or_create(reference_genome='grch37')[0]
+
+    offset = Sample.objects.aggregate(offset=Coalesce(Max('id'), 0))['offset']
+    samples = []
+    for index in range(offset, offset + scale):
+        sample = Sample.objects.create(
+            sample_id='SYNSA%06d' % index,
+            sample_type='P',
+            anonymous_patient_id='SYN%d' % index,
+        )
+        AdditionalSampleInformation.objects.create(
+            sample=sample,
+            anatomic_site='breast',
+            tissue_type='N',
+            cancer_type='bc',
+        )
+        create_dlp_library(
+            sample, index, projects, fields, version, reference_genome,
+            cells_per_library, sequencings_per_library, lanes_per_sequencing,
+        )
+        create_tenx_library(sample, index, projects)
+        PbalLibrary.objects.create(sample=sample)
+        samples.append(sample)
+
+    # bulk_create() and related managers' add() send no post_save signals
+    ModelVersion.objects.bump(SublibraryInformation, ChipRegionMetadata)
+    for model in search_models:
+        update_search_documents(
+            model, model._default_manager.filter(pk__gt=last_pks[model]).values_list('pk', flat=True))
+    return samples
+
+
+def create_dlp_library(sample, index, projects, fields, version, reference_genome,
+                       cells, sequencings_per_library, lanes_per_sequencing):
+    library = DlpLibrary.objects.create(
+        pool_id='SYNA%06d' % index,
+        jira_ticket='SYN-%d' % (100000 + index),
+        sample=sample,
+        description='Synthetic library %d' % index,
+        num_sublibraries=cells,
+    )
+    library.projects.add(*projects[:1 + index % len(projects)])
+    DlpLibrarySampleDetail.objects.create(library=library, cell_state='C')
+    DlpLibraryConstructionInformation.objects.create(library=library)
+    DlpLibraryQuantificationAndStorage.objects.create(library=library)
+
+    sequencings = []
+    lanes = []
+    for sequencing_index in range(sequencings_per_library):
+        sequencing = DlpSequencing.objects.create(
+            library=library,
+            gsc_library_id='SYNPX%06d%d' % (index, sequencing_index),
+            # A library is sequenced once per center and instrument
+            sequencing_instrument=SEQUENCING_INSTRUMENTS[sequencing_index % len(SEQUENCING_INSTRUMENTS)],
+        )
+        sequencings.append(sequencing)
+        for lane_index in range(lanes_per_sequencing):
+            lanes.append(DlpLane.objects.create(
+                sequencing=sequencing,
+                flow_cell_id='SYNH%06d%dALXX_%d' % (index, sequencing_index, lane_index + 1),
+                sequencing_date=timezone.now(),
+            ))
+
+    analysis = DlpAnalysisInformation.objects.create(
+        library=library,
+        version=version,
+        analysis_jira_ticket='SYN-%d' % (200000 + index),
+        analysis_run=AnalysisRun.objects.create(run_status='idle'),
+        reference_genome=reference_genome,
+    )
+    analysis.sequencings.add(*sequencings)
+    analysis.lanes.add(*lanes)
+
+    rows = (cells + CHIP_COLUMNS - 1) // CHIP_COLUMNS
+    regions = [
+        ChipRegion.objects.create(library=library, region_code='%s%d' % (code, index))
+        for code in CHIP_REGIONS
+    ]
+    ChipRegionMetadata.objects.bulk_create([
+        ChipRegionMetadata(chip_region=region, metadata_field=field, metadata_value=value)
+        for region_index, region in enumerate(regions)
+        for field, value in zip(fields, (sample.sample_id, 'C%d' % region_index, 'condition%d' % region_index))
+    ])
+    SublibraryInformation.objects.bulk_create([
+        SublibraryInformation(
+            library=library,
+            chip_region=regions[row * len(regions) // rows],
+            sample_id=sample,
+            row=row + 1,
+            column=column + 1,
+            img_col=column,
+            num_live=1,
+            condition='A',
+            index_i5='i5-%d' % column,
+            index_i7='i7-%d' % row,
+            primer_i5='ACGT',
+            primer_i7='TTGA',
+            pick_met='C1',
+            spot_well='R%02d_C%02d' % (row + 1, column + 1),
+            cell_id=format_cell_id(sample.sample_id, library.pool_id, row + 1, column + 1),
+        )
+        for row, column in (divmod(cell, CHIP_COLUMNS) for cell in range(cells))
+    ])
+    return library
+
+
+def create_tenx_library(sample, index, projects):
+    chip = TenxChip.objects.create(lab_name='SA')
+    library = TenxLibrary.objects.create(
+        name='SYN10X_CHIP%04d_%03d' % (chip.id, 1),
+        sample=sample,
+        chips=chip,
+        jira_ticket='SYN-%d' % (300000 + index),
+        gsc_library_id='SYN9%06d' % index,
+    )
+    library.projects.add(projects[index % len(projects)])
+    TenxLibrarySampleDetail.objects.create(library=library)
+    TenxLibraryConstructionInformation.objects.create(library=library)
+    TenxLibraryQuantificationAndStorage.objects.create(library=library)
+
+    pool = TenxPool.objects.create(pool_name='SYNPOOL%06d' % index, gsc_pool_name='SYNGSC%d' % index)
+    pool.libraries.add(library)
+    sequencing = TenxSequencing.objects.create(
+        library=library,
+        tenx_pool=pool,
+        gsc_library_id='SYN8%06d' % index,
+        submission_date=datetime.date.today(),
+    )
+    TenxLane.objects.create(
+        sequencing=sequencing,
+        flow_cell_id='SYNT%06d' % index,
+        gsc_sublibrary_names=[library.gsc_library_id],
+    )
+    TenxAnalysis.objects.create(
+        input_type='FASTQ',
+        version='v1',
+        jira_ticket='SYN-%d' % (400000 + index),
+        tenx_library=library,
+    )
+    return library
@@ -0,0 +1,101 @@
+"""
+Test cases run against a synthetic LIMS (see core.synthetic), shared by the
+tests of every app.
+"""
+from collections import OrderedDict
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.models import ModelVersion
+from core.search_util.search_cache import search_cache
+from core.signals import get_tracked_models
+from core.synthetic import create_lims
+
+
+def run_commit_hooks():
+    """
+    Run the transaction.on_commit() callbacks, such as ModelVersion bumps,
+    which the transactions that TestCase runs in hold back.
+    """
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
+
+class LimsTestCase(TestCase):
+    """A superuser and scale synthetic samples, created once for the class."""
+    scale = 1
+    cells_per_library = 16
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('tester', 'tester@example.com', 'tester')
+        cls.samples = create_lims(scale=cls.scale, cells_per_library=cls.cells_per_library)
+        run_commit_hooks()
+        # Versions are created the first time they are asked for
+        ModelVersion.objects.get_versions(get_tracked_models())
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        cache.clear()
+        search_cache.clear()
+
+    def run_commit_hooks(self):
+        run_commit_hooks()
+
+    def get(self, url, **extra):
+        """Get url, with the whole of its content, streamed or not, in response.body."""
+        response = self.client.get(url, **extra)
+        response.body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response
+
+
+class ApiClientMixin(object):
+    """Make requests as an API client, authenticated without a session and accepting JSON."""
+    client_class = APIClient
+
+    def setUp(self):
+        super(ApiClientMixin, self).setUp()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, **extra):
+        extra.setdefault('HTTP_ACCEPT', 'application/json')
+        return super(ApiClientMixin, self).get(url, **extra)
+
+
+class QueryBudgetTestCase(LimsTestCase):
+    """
+    Checks the number of queries requests take, against budgets and as
+    the LIMS grows.
+    """
+    scale = 2
+    cells_per_library = 1000
+
+    def count_queries(self, url):
+        # Every request must do its work, not be answered from the cache
+        cache.clear()
+        search_cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(context.captured_queries)
+
+    def assertQueryBudgets(self, budgets):
+        """Check {url: budget}, before and after generating more rows."""
+        counts = OrderedDict((url, self.count_queries(url)) for url in budgets)
+        create_lims(scale=1, cells_per_library=self.cells_per_library)
+        run_commit_hooks()
+
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                self.assertLessEqual(
+                    counts[url], budget,
+                    '%s took %d queries, its budget is %d' % (url, counts[url], budget))
+                self.assertEqual(
+                    self.count_queries(url), counts[url],
+                    '%s needs more queries for more rows' % url)
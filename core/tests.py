@@ -2,14 +2,380 @@
 Created on May 16, 2016
 
 @author: Jafar Taghiyar (jtaghiyar@bccrc.ca)
+
+Query budgets for the list and detail pages, checked the same way as the
+API's (see api/tests.py), and tests of the core modules.
 """
+import datetime
+import io
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from core.models import Project, Sample, SublibraryInformation
+from core.search_util.search_cache import SearchCache
+from core.search_util.search_documents import get_model_documents, get_search_models
+from core.search_util.search_helper import return_text_search
+from core.search_util.search_planner import key_matches
+from core.stats import TOTALS, get_stats
+from core.synthetic import create_lims
+from core.testing import LimsTestCase, QueryBudgetTestCase
+from dlp.models import DlpLane, DlpLibrary, DlpSequencing
+from sisyphus.models import AnalysisRun, DlpAnalysisInformation
+from tenx.models import TenxAnalysis, TenxChip, TenxLibrary, TenxPool, TenxSequencing
+
+
+# Queries allowed for one request to each page, whatever the number of rows
+LIST_BUDGETS = OrderedDict([
+    ('/', 4),
+    ('/core/sample/list', 7),
+    ('/core/project/list', 15),
+    ('/dlp/library/list', 11),
+    ('/dlp/sequencing/list', 7),
+    ('/dlp/summary', 6),
+    ('/tenx/library/list', 7),
+    ('/tenx/sequencing/list', 5),
+    ('/tenx/chip/list', 5),
+    ('/tenx/pool/list', 6),
+    ('/tenx/analysis/list', 4),
+    ('/sisyphus/information/', 12),
+    ('/pbal/library/list', 8),
+    ('/pbal/sequencing/list', 3),
+    ('/search/?query_str=SYN', 5),
+    ('/search/?query_str=SYN&group=dlp.Libraries&start=1', 4),
+])
+
+# Queries allowed for each detail page, and the model of the row shown
+DETAIL_BUDGETS = OrderedDict([
+    ('/core/sample/%d', (Sample, 16)),
+    ('/core/project/detail/%d', (Project, 6)),
+    ('/dlp/library/%d', (DlpLibrary, 26)),
+    ('/dlp/sequencing/%d', (DlpSequencing, 9)),
+    ('/tenx/library/%d', (TenxLibrary, 14)),
+    ('/tenx/sequencing/%d', (TenxSequencing, 8)),
+    ('/tenx/chip/detail/%d', (TenxChip, 4)),
+    ('/tenx/pool/detail/%d', (TenxPool, 9)),
+    ('/tenx/analysis/detail/%d', (TenxAnalysis, 6)),
+    ('/sisyphus/information/%d', (DlpAnalysisInformation, 16)),
+])
+
+
+class PageQueryBudgetTests(QueryBudgetTestCase):
+
+    def test_list_pages(self):
+        self.assertQueryBudgets(LIST_BUDGETS)
+
+    def test_detail_pages(self):
+        self.assertQueryBudgets(OrderedDict(
+            (url % model.objects.order_by('id').first().id, budget)
+            for url, (model, budget) in DETAIL_BUDGETS.items()
+        ))
+
+
+class SyntheticTests(LimsTestCase):
+    scale = 2
+
+    def test_names_are_synthetic(self):
+        for sample in self.samples:
+            self.assertTrue(sample.sample_id.startswith('SYN'))
+        for model, field in ((DlpLibrary, 'pool_id'), (TenxPool, 'pool_name'), (DlpSequencing, 'gsc_library_id')):
+            self.assertFalse(model.objects.exclude(**{field + '__startswith': 'SYN'}).exists())
+
+    def test_rows_have_documents(self):
+        for model in get_search_models():
+            self.assertEqual(
+                get_model_documents(model).count(), model._default_manager.count(), model._meta.label)
+        sequencing = DlpSequencing.objects.order_by('id').first()
+        document = get_model_documents(DlpSequencing).get(object_id=sequencing.pk)
+        for lane in sequencing.dlplane_set.all():
+            self.assertIn(lane.flow_cell_id, document.identifiers)
+
+    def test_names_do_not_collide_after_deletes(self):
+        # Fewer samples than before, but the same highest id
+        Sample.objects.filter(id=self.samples[0].id).delete()
+        samples = create_lims(scale=2, cells_per_library=self.cells_per_library)
+        self.assertEqual(Sample.objects.count(), 3)
+        for model, field in ((Sample, 'sample_id'), (DlpLibrary, 'pool_id'), (TenxPool, 'pool_name')):
+            names = list(model.objects.values_list(field, flat=True))
+            self.assertEqual(len(names), len(set(names)), field)
+        self.assertGreater(samples[0].sample_id, self.samples[-1].sample_id)
+
+
+class StatsTests(LimsTestCase):
+    scale = 2
+
+    def stat(self, name):
+        response = self.client.get('/api/stats/%s/' % name, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_totals(self):
+        totals = self.stat('totals')
+        self.assertEqual(list(totals), list(TOTALS))
+        for name, model in TOTALS.items():
+            self.assertEqual(totals[name], model.objects.count(), name)
+        # Every synthetic sample has one library of each kind, with 16 cells
+        self.assertEqual(totals['samples'], 2)
+        self.assertEqual(totals['dlp_sequencings'], 4)
+        self.assertEqual(totals['sublibraries'], 32)
+
+    def test_sample_libraries(self):
+        sample = Sample.objects.create(sample_id='SYNEMPTY', sample_type='P')
+        rows = self.stat('sample_libraries')
+        self.assertEqual([row['sample_id'] for row in rows], sorted(Sample.objects.values_list('sample_id', flat=True)))
+        counts = dict((row['sample_id'], row) for row in rows)
+        for synthetic in self.samples:
+            self.assertEqual(counts[synthetic.sample_id], {
+                'id': synthetic.pk, 'sample_id': synthetic.sample_id,
+                'dlp_libraries': 1, 'tenx_libraries': 1, 'pbal_libraries': 1, 'sublibraries': 16,
+            })
+        self.assertEqual(counts['SYNEMPTY'], {
+            'id': sample.pk, 'sample_id': 'SYNEMPTY',
+            'dlp_libraries': 0, 'tenx_libraries': 0, 'pbal_libraries': 0, 'sublibraries': 0,
+        })
+
+    def test_sequencing_lanes(self):
+        sequencing = DlpSequencing.objects.order_by('id').first()
+        sequencing.number_of_lanes_requested = 3
+        sequencing.save()
+        DlpLane.objects.filter(sequencing=sequencing).first().delete()
+
+        lanes = self.stat('sequencing_lanes')
+        self.assertEqual(
+            [(row['id'], row['library_name'], row['number_of_lanes_requested'], row['lanes']) for row in lanes['dlp']],
+            [(s.pk, s.library.pool_id, s.number_of_lanes_requested, s.dlplane_set.count())
+             for s in DlpSequencing.objects.order_by('id')])
+        self.assertEqual(lanes['dlp'][0]['lanes'], 1)
+        self.assertEqual(lanes['dlp'][0]['number_of_lanes_requested'], 3)
+        self.assertEqual(
+            [(row['id'], row['library_name'], row['lanes']) for row in lanes['tenx']],
+            [(s.pk, s.library.name, 1) for s in TenxSequencing.objects.order_by('id')])
+
+    def test_analysis_status(self):
+        run = AnalysisRun.objects.filter(dlpanalysisinformation__isnull=False).order_by('id').first()
+        run.run_status = 'complete'
+        run.save()
+
+        status = self.stat('analysis_status')
+        self.assertEqual(status['dlp'], {'idle': 1, 'complete': 1})
+        self.assertEqual(
+            status['tenx'], dict(Counter(str(a.run_status) for a in TenxAnalysis.objects.all())))
+
+    def test_project_cells(self):
+        library = DlpLibrary.objects.get(sample=self.samples[0])
+        detail = library.dlplibrarysampledetail
+        detail.sample_spot_date = datetime.date(2019, 3, 5)
+        detail.save()
+
+        rows = self.stat('project_cells')
+        # The other chips were spotted on the day they were created
+        self.assertEqual([row for row in rows if row['month'] == '2019-03'], [
+            {'project': project.name, 'month': '2019-03', 'cells': 16}
+            for project in library.projects.order_by('name')
+        ])
+        self.assertEqual(sum(row['cells'] for row in rows), sum(
+            max(sublibrary.library.projects.count(), 1) for sublibrary in SublibraryInformation.objects.all()))
+
+    def test_writes_invalidate(self):
+        response = self.client.get('/api/stats/', HTTP_ACCEPT='application/json')
+        etag = response['ETag']
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['totals']['samples'], 2)
+
+        # Cached until one of the models read changes
+        with self.assertNumQueries(1):
+            results, version = get_stats(['totals'])
+        Sample.objects.create(sample_id='SYNNEW', sample_type='P')
+        self.run_commit_hooks()
+        self.assertNotEqual(get_stats(['totals'])[1], version)
+
+        response = self.client.get('/api/stats/', HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['totals']['samples'], 3)
+        self.assertEqual(
+            self.client.get('/api/stats/', HTTP_ACCEPT='application/json',
+                            HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class SearchTests(LimsTestCase):
+    scale = 3
+
+    def search(self, query, **kwargs):
+        return return_text_search(query, **kwargs)
+
+    def titles(self, group):
+        return [document.title for document in group]
+
+    def test_ranking(self):
+        sample = self.samples[1]
+        results = self.search(sample.sample_id)
+        samples = results['core']['Samples']
+        # The sample named comes first, then those with similar names
+        self.assertEqual(samples[0].object_id, sample.pk)
+        self.assertEqual(samples.total, len(samples))
+        self.assertEqual(
+            [document.rank for document in samples], sorted((document.rank for document in samples), reverse=True))
+        self.assertIn(sample.sample_id, self.titles(results['dlp']['Libraries'])[0])
+        self.assertEqual(results['total'], sum(
+            group.total for app in ('core', 'dlp', 'pbal', 'tenx') for group in results[app].values()))
+
+    def test_pages(self):
+        results = self.search('SYN', limit=2)
+        libraries = results['dlp']['Libraries']
+        self.assertEqual((len(libraries), libraries.total, libraries.more), (2, 3, True))
+        self.assertEqual(len(results['core']['Samples']), 2)
+
+        more = self.search('SYN', limit=2, start=2, group='dlp.Libraries')
+        self.assertEqual((more['dlp']['Libraries'].start, more['dlp']['Libraries'].more), (2, False))
+        # Other groups are not listed when loading more of one
+        self.assertEqual(len(more['core']['Samples']), 0)
+        self.assertEqual(
+            sorted(document.object_id for document in list(libraries) + list(more['dlp']['Libraries'])),
+            sorted(DlpLibrary.objects.values_list('id', flat=True)))
+
+    def test_identifier_shapes(self):
+        sample = Sample.objects.create(sample_id='SA1234', sample_type='P')
+        documents = key_matches(' sa1234 ')
+        self.assertEqual([(d.model_name, d.object_id) for d in documents], [('sample', sample.pk)])
+        self.assertEqual(list(key_matches('not an identifier')), [])
+
+        sublibrary = SublibraryInformation.objects.filter(sample_id=self.samples[0]).first()
+        library = self.search(sublibrary.cell_id)['dlp']['Libraries']
+        self.assertEqual([document.object_id for document in library], [sublibrary.library_id])
+
+    def test_substrings_and_typos(self):
+        library = DlpLibrary.objects.get(sample=self.samples[2])
+        # The end of a chip id
+        found = self.search(library.pool_id[-5:])['dlp']['Libraries']
+        self.assertEqual(found[0].object_id, library.pk)
+        # A character off
+        typo = library.pool_id[:-1] + ('9' if library.pool_id[-1] != '9' else '8')
+        self.assertIn(library.pk, [document.object_id for document in self.search(typo)['dlp']['Libraries']])
+
+    def test_documents_follow_writes(self):
+        sample = Sample.objects.get(pk=self.samples[0].pk)
+        sample.sample_id = 'SYNRENAMED'
+        sample.save()
+        self.run_commit_hooks()
+        self.assertEqual(
+            [document.object_id for document in self.search('SYNRENAMED')['core']['Samples']], [sample.pk])
+        # Documents reading the sample follow it
+        self.assertIn('SYNRENAMED', self.titles(self.search('SYNRENAMED')['dlp']['Libraries'])[0])
+
+        sample.delete()
+        self.run_commit_hooks()
+        self.assertEqual(self.search('SYNRENAMED')['total'], 0)
+        self.assertFalse(get_model_documents(Sample).filter(object_id=sample.pk).exists())
+
+    def test_cache(self):
+        query = self.samples[0].sample_id
+        first = self.search(query)
+        # Only the search generation is read
+        with self.assertNumQueries(1):
+            self.assertEqual(self.titles(self.search(query)['core']['Samples']), self.titles(first['core']['Samples']))
+
+        Sample.objects.create(sample_id=query + '1', sample_type='P')
+        self.run_commit_hooks()
+        self.assertEqual(self.search(query)['core']['Samples'].total, first['core']['Samples'].total + 1)
+
+
+class CommandTests(LimsTestCase):
+
+    def test_generate_synthetic_lims(self):
+        count = Sample.objects.count()
+        call_command('generate_synthetic_lims', scale=3, cells=4, batch_size=2, stdout=io.StringIO())
+        self.assertEqual(Sample.objects.count(), count + 3)
+        created = Sample.objects.order_by('-id')[:3]
+        self.assertEqual(SublibraryInformation.objects.filter(sample_id__in=created).count(), 12)
+
+        with self.assertRaises(CommandError):
+            call_command('generate_synthetic_lims', scale=0, stdout=io.StringIO())
+
+    def test_run_benchmarks(self):
+        # The exports write files and spreadsheets, and are left out
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('run_benchmarks', repeat=1, names=['api_', 'search', 'page'], stdout=stdout, stderr=stderr)
+        results = json.loads(stdout.getvalue())
+        self.assertEqual(results['rows']['Sample'], Sample.objects.count())
+        self.assertTrue(results['results'])
+        for result in results['results']:
+            with self.subTest(name=result['name']):
+                self.assertTrue(any(name in result['name'] for name in ('api_', 'search', 'page')))
+                self.assertNotIn('error', result)
+                self.assertEqual(result['status'], 200)
+                self.assertIn('db', result['median_phase_ms'])
+
+
+class SearchCacheTests(SimpleTestCase):
+
+    def test_lru_and_expiry(self):
+        cache = SearchCache(max_entries=2, timeout=60, wait=1)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get('a'))
+
+    def test_single_flight(self):
+        cache = SearchCache(max_entries=10, timeout=60, wait=5)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(threading.current_thread().name)
+            started.set()
+            release.wait(5)
+            return 'page'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.get_or_set('key', compute)))
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(target=lambda: results.append(cache.get_or_set('key', compute))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        # Let the followers find the leader's flight rather than its result
+        time.sleep(0.1)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+        self.assertEqual(results, ['page'] * 4)
+        self.assertEqual(len(calls), 1)
+
+    def test_waits_are_bounded(self):
+        cache = SearchCache(max_entries=10, timeout=60, wait=0.01)
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return 'slow'
 
-from django.test import TestCase
+        leader = threading.Thread(target=cache.get_or_set, args=('key', slow))
+        leader.start()
+        started.wait(5)
+        try:
+            # Computed again rather than waiting on the leader
+            self.assertEqual(cache.get_or_set('key', lambda: 'fast'), 'fast')
+        finally:
+            release.set()
+            leader.join(5)
 
-class SampleViewTests(TestCase):
+    def test_failures_are_not_shared(self):
+        cache = SearchCache(max_entries=10, timeout=60, wait=1)
 
-    def setup(self):
-        pass
+        def fail():
+            raise ValueError()
 
-    def test_sample(self):
-        print 'testing the test ...'
\ No newline at end of file
+        with self.assertRaises(ValueError):
+            cache.get_or_set('key', fail)
+        self.assertEqual(cache.get_or_set('key', lambda: 'page'), 'page')
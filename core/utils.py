@@ -351,7 +351,7 @@ def create_sublibrary_models(library, sublib_results, region_metadata):
     for idx, row in sublib_results.iterrows():
         row = row.drop('rev_class')
         sublib = SublibraryInformation(**row.to_dict())
-        sublib.library_id = library.pk
+        sublib.library = library
         try:
             sublib.chip_region_id = chip_spot_region_id[(row['row'], row['column'])]
             sublib.sample_id = chip_spot_sample_id[(row['row'], row['column'])]
@@ -37,7 +37,7 @@ from django.contrib.staticfiles.templatetags.staticfiles import static
 #============================
 # App imports
 #----------------------------
-from core.search_util.search_helper import return_text_search
+from core.search_util.search_helper import get_start, return_text_search
 from core.models import (ChipRegionMetadata)
 from dlp.models import (DlpLibrary)
 from pbal.models import (PbalLibrary)
@@ -74,6 +74,7 @@ from .utils import (
     validate_imported,
     fetch_row_objects,
 )
+from .stats import get_stats
 from .jira_templates.templates import (
     get_reference_genome_from_sample_id,
     generate_dlp_jira_description,
@@ -108,20 +109,21 @@ class IndexView(LoginRequiredMixin, TemplateView):
     template_name = "core/index.html"
 
     def get_context_data(self):
+        totals = get_stats(['totals'])[0]['totals']
         context = {
-            'sample_size': Sample.objects.count(),
-            'project_size': Project.objects.count(),
-            'tenxanalysis_size': TenxAnalysis.objects.count(),
-            'dlp_library_size': DlpLibrary.objects.count(),
-            'dlp_sequencing_size': DlpSequencing.objects.count(),
-            'pbal_library_size': PbalLibrary.objects.count(),
-            'pbal_sequencing_size': PbalSequencing.objects.count(),
-            'tenx_library_size': TenxLibrary.objects.count(),
-            'tenx_sequencing_size': TenxSequencing.objects.count(),
-            'tenx_chips_size': TenxChip.objects.count(),
-            'tenx_pools_size': TenxPool.objects.count(),
-            'analysisinformation_size': DlpAnalysisInformation.objects.count(),
-            'analysisrun_size': AnalysisRun.objects.count(),
+            'sample_size': totals['samples'],
+            'project_size': totals['projects'],
+            'tenxanalysis_size': totals['tenx_analyses'],
+            'dlp_library_size': totals['dlp_libraries'],
+            'dlp_sequencing_size': totals['dlp_sequencings'],
+            'pbal_library_size': totals['pbal_libraries'],
+            'pbal_sequencing_size': totals['pbal_sequencings'],
+            'tenx_library_size': totals['tenx_libraries'],
+            'tenx_sequencing_size': totals['tenx_sequencings'],
+            'tenx_chips_size': totals['tenx_chips'],
+            'tenx_pools_size': totals['tenx_pools'],
+            'analysisinformation_size': totals['dlp_analyses'],
+            'analysisrun_size': totals['analysis_runs'],
         }
         return context
 
@@ -232,7 +234,11 @@ class SampleList(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self):
         context = {
-            'samples': Sample.objects.all().order_by('sample_id'),
+            'samples': Sample.objects.all().order_by('sample_id').prefetch_related(
+                'dlplibrary_set__sample',
+                'dlplibrary_set__dlpsequencing_set',
+                'tenxlibrary_set__tenxsequencing_set',
+            ),
         }
         return context
 
@@ -413,6 +419,7 @@ class LibraryDetail(LoginRequiredMixin, TemplateView):
             metadata_fields=None,
             doubletinfo_fields=None,
             additional_samples=None,
+            sublibraries=None,
     ):
         library_dict = self.sort_library_order(library)
         context = {
@@ -424,6 +431,7 @@ class LibraryDetail(LoginRequiredMixin, TemplateView):
             'metadata_fields': metadata_fields,
             'library_dict': library_dict,
             'additional_samples': additional_samples,
+            'sublibraries': sublibraries,
         }
         return render(request, self.template_name, context)
 
@@ -1369,4 +1377,4 @@ class SearchView(TemplateView):
         if len(query_str) < 1:
             return {"total": 0}
 
-        return return_text_search(query_str)
+        return return_text_search(query_str, start=get_start(self.request.GET), group=self.request.GET.get('group'))
@@ -6,6 +6,8 @@ git reset --hard origin/master
 source venv/bin/activate
 pip3 install -r requirements.txt --ignore-installed
 python manage.py migrate
+python manage.py createcachetable
+python manage.py rebuild_search_documents
 sudo systemctl daemon-reload
 sudo systemctl restart uwsgi
 exit
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dlp', '0009_history_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dlplane',
+            index=models.Index(fields=['flow_cell_id'], name='dlp_dlplane_flow_cell_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dlplibrary',
+            index=models.Index(fields=['pool_id'], name='dlp_dlplibrary_pool_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dlplibrary',
+            index=models.Index(fields=['jira_ticket'], name='dlp_dlplibrary_jira_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dlpsequencing',
+            index=models.Index(fields=['gsc_library_id'], name='dlp_dlpsequencing_gsc_idx'),
+        ),
+    ]
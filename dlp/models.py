@@ -17,6 +17,10 @@ class DlpLibrary(models.Model, FieldValue, LibraryAssistant):
 
     class Meta:
         ordering = ('sample', 'pool_id')
+        indexes = [
+            models.Index(fields=['pool_id'], name='dlp_dlplibrary_pool_id_idx'),
+            models.Index(fields=['jira_ticket'], name='dlp_dlplibrary_jira_idx'),
+        ]
 
     library_type = 'dlp'
 
@@ -350,6 +354,7 @@ class DlpSequencing(models.Model, FieldValue):
 
     class Meta:
         unique_together = ('library', 'sequencing_center', 'sequencing_instrument')
+        indexes = [models.Index(fields=['gsc_library_id'], name='dlp_dlpsequencing_gsc_idx')]
 
     fields_to_exclude = ['ID', 'Library']
     values_to_exclude = ['id', 'library']
@@ -470,6 +475,9 @@ class DlpLane(models.Model, FieldValue):
     """
     history = HistoricalRecords(table_name='dlp_history_lane')
 
+    class Meta:
+        indexes = [models.Index(fields=['flow_cell_id'], name='dlp_dlplane_flow_cell_idx')]
+
     # database relationships
     sequencing = models.ForeignKey(
         DlpSequencing,
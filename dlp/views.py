@@ -6,6 +6,7 @@ from django.contrib.auth.decorators import login_required
 from colossus import settings
 from core.forms import GSCFormDeliveryInfo, GSCFormSubmitterInfo
 from core.models import MetadataField, SublibraryInformation
+from core.stats import get_stats
 from core.utils import generate_gsc_form
 from dlp.models import *
 from dlp.forms import *
@@ -86,7 +87,9 @@ class DlpLibraryDetail(LibraryDetail):
         metadata_dict = collections.OrderedDict()
         controls_to_exclude = ["NCC", "gDNA", "hTERT", "NTC"]
         additional_samples = []
-        for chip_region in library.chipregion_set.all().order_by('region_code'):
+        chip_regions = library.chipregion_set.order_by('region_code').prefetch_related(
+            'chipregionmetadata_set__metadata_field')
+        for chip_region in chip_regions:
             metadata_set = chip_region.chipregionmetadata_set.all()
             d1 = {}
 
@@ -115,8 +118,11 @@ class DlpLibraryDetail(LibraryDetail):
         additional_samples = list(dict.fromkeys(additional_samples))
         additional_samples = [a for a in additional_samples if a.sample_id != library.sample.sample_id]
 
+        sublibraries = library.sublibraryinformation_set.select_related('chip_region')
+
         return self.get_context_and_render(request, library, library_type, analyses, sublibinfo.get_fields(),
-                                           metadata_dict, fields, additional_samples=additional_samples, )
+                                           metadata_dict, fields, additional_samples=additional_samples,
+                                           sublibraries=sublibraries, )
 
     def sort_library_order(self, library):
         new_library_order = ['Description', 'Result', 'Title', 'Jira ticket', 'Quality', 'Chip ID',
@@ -272,16 +278,23 @@ class DlpLaneDelete(LaneDelete):
 # ----------------------------
 @Render("core/summary.html")
 def dlp_summary_view(request):
-    library_per_sample_count = {s.sample_id: s.dlplibrary_set.count() for s in Sample.objects.all()}
+    stats = get_stats(['sample_libraries', 'totals'])[0]
+    library_per_sample_count = dict(
+        (row['sample_id'], row['dlp_libraries']) for row in stats['sample_libraries'])
+    sublibrary_per_sample_count = dict(
+        (row['sample_id'], row['sublibraries']) for row in stats['sample_libraries'])
 
-    sublibrary_per_sample_count = {s.sample_id: s.sublibraryinformation_set.count() for s in Sample.objects.all()}
+    samples = list(Sample.objects.all().order_by('sample_id'))
+    for sample in samples:
+        sample.num_libraries = library_per_sample_count.get(sample.sample_id, 0)
+        sample.num_sublibraries = sublibrary_per_sample_count.get(sample.sample_id, 0)
 
     context = {
         'library_per_sample': library_per_sample_count,
         'sublibrary_per_sample': sublibrary_per_sample_count,
-        'total_sublibs': SublibraryInformation.objects.count(),
-        'total_libs': DlpLibrary.objects.count(),
-        'samples': Sample.objects.all().order_by('sample_id'),
+        'total_sublibs': stats['totals']['sublibraries'],
+        'total_libs': stats['totals']['dlp_libraries'],
+        'samples': samples,
     }
     return context
 
@@ -344,8 +357,6 @@ def export_sublibrary_csv(request, pk):
     response['Content-Disposition'] = 'attachment; filename="Sublibrary-info.csv"'
     dlp = DlpLibrary.objects.get(id=pk)
     df = pd.DataFrame(list(dlp.sublibraryinformation_set.all().values()))
-    df = df.assign(
-        Sublibrary_information=pd.Series([x.get_sublibrary_id() for x in dlp.sublibraryinformation_set.all()],
-                                         index=df.index))
+    df = df.assign(Sublibrary_information=df.pop('cell_id') if 'cell_id' in df else pd.Series())
     df.to_csv(response)
     return response
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Index history_date so the API change feed reads only recent history."""
+
+    dependencies = [
+        ('pbal', '0003_auto_20200327_1736'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX "pbal_history_lane_history_date_idx" ON "pbal_history_lane" ("history_date")',
+            reverse_sql='DROP INDEX "pbal_history_lane_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "pbal_history_library_history_date_idx" ON "pbal_history_library" ("history_date")',
+            reverse_sql='DROP INDEX "pbal_history_library_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "pbal_history_library_construction_information_history_date_idx" ON "pbal_history_library_construction_information" ("history_date")',
+            reverse_sql='DROP INDEX "pbal_history_library_construction_information_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "pbal_history_library_q_and_s_history_date_idx" ON "pbal_history_library_q_and_s" ("history_date")',
+            reverse_sql='DROP INDEX "pbal_history_library_q_and_s_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "pbal_history_library_sample_detail_history_date_idx" ON "pbal_history_library_sample_detail" ("history_date")',
+            reverse_sql='DROP INDEX "pbal_history_library_sample_detail_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "pbal_history_sequencing_history_date_idx" ON "pbal_history_sequencing" ("history_date")',
+            reverse_sql='DROP INDEX "pbal_history_sequencing_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "pbal_plate_history_history_date_idx" ON "pbal_plate_history" ("history_date")',
+            reverse_sql='DROP INDEX "pbal_plate_history_history_date_idx"',
+        ),
+    ]
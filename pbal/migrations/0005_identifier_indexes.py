@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pbal', '0004_history_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pballane',
+            index=models.Index(fields=['flow_cell_id'], name='pbal_pballane_flow_cell_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pbalsequencing',
+            index=models.Index(fields=['gsc_library_id'], name='pbal_pbalsequencing_gsc_idx'),
+        ),
+    ]
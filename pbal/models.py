@@ -228,6 +228,7 @@ class PbalSequencing(models.Model, FieldValue):
     """
     class Meta:
         unique_together = ('library', 'sequencing_center', 'sequencing_instrument')
+        indexes = [models.Index(fields=['gsc_library_id'], name='pbal_pbalsequencing_gsc_idx')]
 
     fields_to_exclude = ['ID', 'Library']
     values_to_exclude = ['id', 'library']
@@ -338,6 +339,10 @@ class PbalLane(models.Model, FieldValue):
     PBAL lane information.
     """
     history = HistoricalRecords(table_name='pbal_history_lane')
+
+    class Meta:
+        indexes = [models.Index(fields=['flow_cell_id'], name='pbal_pballane_flow_cell_idx')]
+
     # database relationships
     sequencing = models.ForeignKey(
         PbalSequencing,
@@ -29,6 +29,19 @@ class PbalLibraryList(LibraryList):
     library_class = PbalLibrary
     library_type = 'pbal'
 
+    def get_context_data(self):
+        context = {
+            'libraries': PbalLibrary.objects.all().order_by(self.order).prefetch_related(
+                'sample',
+                'projects',
+                'pballibrarysampledetail',
+                'pballibraryconstructioninformation',
+                'plate_set',
+            ),
+            'library_type': self.library_type,
+        }
+        return context
+
 
 class PbalLibraryDetail(LibraryDetail):
     library_class = PbalLibrary
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Index history_date so the API change feed reads only recent history."""
+
+    dependencies = [
+        ('sisyphus', '0005_auto_20191118_1543'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX "analysis_run_history_history_date_idx" ON "analysis_run_history" ("history_date")',
+            reverse_sql='DROP INDEX "analysis_run_history_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "dlp_analysis_info_history_history_date_idx" ON "dlp_analysis_info_history" ("history_date")',
+            reverse_sql='DROP INDEX "dlp_analysis_info_history_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "dlp_history_analysis_version_history_date_idx" ON "dlp_history_analysis_version" ("history_date")',
+            reverse_sql='DROP INDEX "dlp_history_analysis_version_history_date_idx"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "ref_genome_history_history_date_idx" ON "ref_genome_history" ("history_date")',
+            reverse_sql='DROP INDEX "ref_genome_history_history_date_idx"',
+        ),
+    ]
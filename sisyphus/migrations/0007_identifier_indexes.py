@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sisyphus', '0006_history_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dlpanalysisinformation',
+            index=models.Index(fields=['analysis_jira_ticket'], name='sisyphus_analysis_jira_idx'),
+        ),
+    ]
@@ -181,3 +181,4 @@ class DlpAnalysisInformation(models.Model):
 
     class Meta:
         ordering = ['pk']
+        indexes = [models.Index(fields=['analysis_jira_ticket'], name='sisyphus_analysis_jira_idx')]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:12
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenx', '0016_history_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tenxanalysis',
+            index=models.Index(fields=['jira_ticket'], name='tenx_tenxanalysis_jira_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenxlane',
+            index=models.Index(fields=['flow_cell_id'], name='tenx_tenxlane_flow_cell_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenxlane',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['gsc_sublibrary_names'], name='tenx_tenxlane_sublibraries_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenxlibrary',
+            index=models.Index(fields=['jira_ticket'], name='tenx_tenxlibrary_jira_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenxlibrary',
+            index=models.Index(fields=['gsc_library_id'], name='tenx_tenxlibrary_gsc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenxpool',
+            index=models.Index(fields=['pool_name'], name='tenx_tenxpool_pool_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenxsequencing',
+            index=models.Index(fields=['gsc_library_id'], name='tenx_tenxsequencing_gsc_idx'),
+        ),
+    ]
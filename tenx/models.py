@@ -1,6 +1,7 @@
 import datetime
 
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.urls import reverse
 from simple_history.models import HistoricalRecords
 from django.db import models
@@ -10,6 +11,11 @@ from core.constants import *
 from core.models import Sample, Project
 
 
+def format_chip_id(id):
+    """Return the name of the TenxChip with the given id, e.g. CHIP0042."""
+    return "CHIP" + format(id, "04")
+
+
 class TenxChip(models.Model, FieldValue):
 
     # Chip Model for TenX Libraries
@@ -33,7 +39,7 @@ class TenxChip(models.Model, FieldValue):
 
     #TenXLibrary name depend on below methods, so please be mindful when making changes
     def get_id(self):
-        return "CHIP" + format(self.id, "04")
+        return format_chip_id(self.id)
 
     def __str__(self):
         return self.get_id() + "_" + self.lab_name
@@ -51,6 +57,10 @@ class TenxLibrary(models.Model, FieldValue, LibraryAssistant):
     """
     class Meta:
         ordering = ['sample']
+        indexes = [
+            models.Index(fields=['jira_ticket'], name='tenx_tenxlibrary_jira_idx'),
+            models.Index(fields=['gsc_library_id'], name='tenx_tenxlibrary_gsc_idx'),
+        ]
 
     name = create_chrfield(
         "Library Name",
@@ -163,6 +173,9 @@ class TenxLibrary(models.Model, FieldValue, LibraryAssistant):
 
 
 class TenxPool(models.Model, FieldValue):
+    class Meta:
+        indexes = [models.Index(fields=['pool_name'], name='tenx_tenxpool_pool_name_idx')]
+
     LOCATION = (
         ('BCCAGSC', 'GSC'),
         ('UBCBRC', 'UBC'),
@@ -222,6 +235,7 @@ class TenxPool(models.Model, FieldValue):
 class TenxAnalysis(models.Model, FieldValue):
     class Meta:
         ordering = ['id']
+        indexes = [models.Index(fields=['jira_ticket'], name='tenx_tenxanalysis_jira_idx')]
 
     input_type = create_chrfield(
         "Input Type",
@@ -407,6 +421,7 @@ class TenxSequencing(models.Model, FieldValue):
     """
     class Meta:
         unique_together = ('library', 'sequencing_center', 'sequencing_instrument')
+        indexes = [models.Index(fields=['gsc_library_id'], name='tenx_tenxsequencing_gsc_idx')]
 
     fields_to_exclude = ['ID', 'Library']
     values_to_exclude = ['id', 'library']
@@ -476,6 +491,13 @@ class TenxLane(models.Model, FieldValue):
     10x lane information.
     """
     history = HistoricalRecords(table_name='tenx_history_lane')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['flow_cell_id'], name='tenx_tenxlane_flow_cell_idx'),
+            GinIndex(fields=['gsc_sublibrary_names'], name='tenx_tenxlane_sublibraries_idx'),
+        ]
+
     # database relationships
     sequencing = models.ForeignKey(
         TenxSequencing,
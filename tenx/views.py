@@ -351,8 +351,10 @@ class TenxChipDetail(LoginRequiredMixin, TemplateView):
     template_name = "core/tenx/tenxchip_detail.html"
 
     def get_context_data(self, pk):
+        chip = get_object_or_404(TenxChip, pk=pk)
         context = {
-            'chip': get_object_or_404(TenxChip, pk=pk),
+            'chip': chip,
+            'libraries': chip.tenxlibrary_set.select_related('sample'),
             'pk': pk,
         }
 
@@ -13,5 +13,8 @@ pg_restore -h localhost -p 5432 -U admin -d colossus -n public < /home/ubuntu/co
 
 pip3 install -r requirements.txt --ignore-installed
 python3 manage.py migrate
+python3 manage.py createcachetable
+python3 manage.py rebuild_search_documents
 python3 manage.py makemigrations --check
 
+python3 manage.py test --settings=colossus.settings_test --noinput